@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Alexander David Leech
+@date:   Wed Aug 17 22:40:19 2016
+@rev:    1
+@lang:   Python 2.7
+@deps:   numpy, pymodbus
+@desc:   Benchmark registerCodec against the pymodbus payload classes
+
+Run from the processControl directory: python dev/benchCodec.py
+"""
+
+import os
+import sys
+import timeit
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),\
+                                ".."))
+
+from pymodbus.payload   import BinaryPayloadBuilder, BinaryPayloadDecoder
+from pymodbus.constants import Endian
+from src.toolClasses.registerCodec import registerCodec
+
+
+def payloadDecode(registers):
+    """Float decode as previously done in modbusClient.__decodeData"""
+    try:
+        decoder = BinaryPayloadDecoder.fromRegisters(registers,\
+                                                     endian=Endian.Little)
+    except TypeError:                           #pymodbus >= 1.4 argument name
+        decoder = BinaryPayloadDecoder.fromRegisters(registers,\
+                                                     byteorder=Endian.Little)
+    return [round(decoder.decode_32bit_float(), 2)\
+            for i in range(len(registers) // 2)]
+
+
+def payloadEncode(values):
+    """Float encode as previously done in modbusClient.__encodeData"""
+    try:
+        builder = BinaryPayloadBuilder(endian=Endian.Little)
+    except TypeError:
+        builder = BinaryPayloadBuilder(byteorder=Endian.Little)
+    for value in values:
+        builder.add_32bit_float(value)
+    return builder.to_registers()
+
+
+def main():
+    codec = registerCodec()
+    print("%8s %14s %14s %14s %14s" % ("floats", "payload dec", "codec dec",\
+                                       "payload enc", "codec enc"))
+    for count in (2, 10, 62, 1000):
+        values = (np.random.rand(count) * 100).tolist()
+        registers = codec.encode(values, "float32")
+        loops = max(20000 // count, 10)
+        results = []
+        for stmt in (lambda: payloadDecode(registers),\
+                     lambda: np.round(codec.decode(registers), 2).tolist(),\
+                     lambda: payloadEncode(values),\
+                     lambda: codec.encode(values, "float32")):
+            best = min(timeit.repeat(stmt, number=loops, repeat=3))
+            results.append("%11.2f us" % (best / loops * 1e6))
+        print("%8d %s" % (count, " ".join(results)))
+
+if __name__ == '__main__':main()
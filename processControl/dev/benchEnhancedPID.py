@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Alexander David Leech
+@date:   Mon Sep 05 22:40:06 2016
+@rev:    1
+@lang:   Python 2.7
+@deps:   numpy
+@desc:   Check enhancedPID against PIDController and compare the cost per tick
+
+Run from the processControl directory: python dev/benchEnhancedPID.py
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),\
+                                ".."))
+
+from src.PIDControl.enhancedPID   import enhancedPID
+from src.PIDControl.PIDController import PIDController
+
+#Test system shift equation - steady state PV = M1 * OP + C1
+M1 = 0.18
+C1 = 15.88
+
+POINTS = [{'at': 16.0, 'Kg': 6.10, 'Ki': 30.00, 'Kd': 3.00},
+          {'at': 25.0, 'Kg': 8.29, 'Ki': 24.11, 'Kd': 3.58},
+          {'at': 34.0, 'Kg': 10.50, 'Ki': 20.00, 'Kd': 4.20}]
+
+
+def enhancedConfig(tuningMode, shiftActive):
+    """Enhanced settings in auto with the given options"""
+    return {'controlMode': "auto", 'setPoint': 25.0, 'ctrlType': "PID",\
+            'Kg': 8.29, 'Ki': 24.11, 'Kd': 3.58, 'dT': 5,\
+            'vlvLowLimit': 0, 'vlvHighLimit': 100, 'antiWindUp': 0.0,\
+            'tuningMode': tuningMode, 'shiftActive': shiftActive,\
+            'gainSchedule': {'scheduleOn': "PV", 'tableSize': 256,\
+                             'points': POINTS},\
+            'M1': M1, 'C1': C1}
+
+
+def plainConfig():
+    """PIDController settings equal to enhancedConfig("N", False)"""
+    return {'controlMode': "auto", 'setPoint': 25.0, 'ctrlType': "PID",\
+            'Kg': 8.29, 'Ki': 24.11, 'Kd': 3.58, 'interval': 5,\
+            'limitsActive': True, 'vlvLowLimit': 0, 'vlvHighLimit': 100,\
+            'antiWindUp': 0.0}
+
+
+def makeEnhanced(tuningMode, shiftActive):
+    """enhancedPID using the given settings instead of the file"""
+    ctrl = enhancedPID()
+    ctrl.cfgWatch.cfg = enhancedConfig(tuningMode, shiftActive)
+    return ctrl
+
+
+def makePlain():
+    """PIDController using plainConfig instead of the file"""
+    ctrl = PIDController()
+    ctrl.cfgWatch.cfg = plainConfig()
+    return ctrl
+
+
+def simulate(ctrl, steps=400, seed=1):
+    """Run a controller on a first order plant following the shift equation,
+    stepping the setpoint across the operating range
+
+    :return: Array of OPs
+    """
+    rng = np.random.RandomState(seed)
+    pv, op = 20.0, 25.0
+    ops = []
+    for step in range(steps):
+        SP = [22.0, 30.0, 18.0, 27.0][step * 4 // steps]
+        op = ctrl.runCtrl(pv, op, SP)
+        ops.append(op)
+        pv += (M1 * op + C1 - pv) * 0.1 + rng.normal(0, 0.05)
+    return np.array(ops)
+
+
+def perTick(ctrl, repeats=5, seconds=0.2):
+    """Return the cost of one 'runCtrl' (us, best of the repeats) with the PV
+    sweeping the whole schedule so the gains change as they would in service
+    """
+    pvs = np.linspace(14.0, 36.0, 1000).tolist()
+    op = 50.0
+    ctrl.runCtrl(pvs[0], op)
+    best = None
+    for repeat in range(repeats):
+        steps = 0
+        start = time.time()
+        while time.time() - start < seconds:
+            for pv in pvs:
+                op = ctrl.runCtrl(pv, op)
+            steps += len(pvs)
+        cost = (time.time() - start) * 1e6 / steps
+        best = cost if best is None else min(best, cost)
+    return best
+
+
+def interpCost(seconds=0.5):
+    """Return the cost (us) of interpolating the 3 gains on every tick, the
+    work the lookup table removes
+    """
+    at = [p['at'] for p in POINTS]
+    cols = [[p[key] for p in POINTS] for key in ("Kg", "Ki", "Kd")]
+    pvs = np.linspace(14.0, 36.0, 1000).tolist()
+    steps = 0
+    start = time.time()
+    while time.time() - start < seconds:
+        for pv in pvs:
+            gains = [np.interp(pv, at, col) for col in cols]
+        steps += len(pvs)
+    return (time.time() - start) * 1e6 / steps
+
+
+def main():
+    diff = np.max(np.abs(simulate(makePlain()) -\
+                         simulate(makeEnhanced("N", False))))
+    print("Max PIDController/enhancedPID (N, no shift) OP difference: %g" %\
+          diff)
+    plain = perTick(makePlain())
+    print("%-32s %8.2f us/tick" % ("PIDController", plain))
+    for mode, shift in (("N", False), ("N", True), ("S", True)):
+        name = "enhancedPID (%s%s)" % (mode, ", shift" if shift else "")
+        cost = perTick(makeEnhanced(mode, shift))
+        print("%-32s %8.2f us/tick (%.2fx)" % (name, cost, cost / plain))
+    print("%-32s %8.2f us/tick" % ("+ np.interp per tick (avoided)",\
+                                   interpCost()))
+
+if __name__ == '__main__':main()
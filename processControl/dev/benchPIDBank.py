@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Alexander David Leech
+@date:   Sun Aug 21 16:03:58 2016
+@rev:    1
+@lang:   Python 2.7
+@deps:   numpy
+@desc:   Check PIDBank against PIDController and benchmark loops per ms
+
+Run from the processControl directory: python dev/benchPIDBank.py
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),\
+                                ".."))
+
+from src.PIDControl.PIDBank       import PIDBank
+from src.PIDControl.PIDController import PIDController
+
+
+def randomConfigs(count, rng):
+    """Create a spread of loop settings covering every branch"""
+    cfgs = []
+    for i in range(count):
+        cfgs.append({'controlMode': "auto", 'interval': rng.choice([1, 5]),\
+                     'setPoint': rng.uniform(20, 80),\
+                     'Kg': rng.uniform(0.5, 3), 'Ki': rng.uniform(5, 100),\
+                     'Kd': rng.uniform(0, 10),\
+                     'ctrlType': ["P", "PI", "PID"][i % 3],\
+                     'limitsActive': bool(i % 4),\
+                     'vlvLowLimit': 0, 'vlvHighLimit': 100,\
+                     'antiWindUp': rng.choice([0.0, 0.5, 1.0])})
+    return cfgs
+
+
+def checkParity(count=60, steps=300):
+    """Run scalar controllers and a bank side by side on simple plants
+
+    :return: Largest difference between the scalar and bank outputs,
+             relative to the size of the output where that exceeds 1
+    """
+    rng = np.random.RandomState(1)
+    cfgs = randomConfigs(count, rng)
+    scalar = []
+    for cfg in cfgs:
+        ctrl = PIDController()
+        ctrl.cfgWatch.cfg = dict(cfg)           #Bypass the settings file
+        scalar.append(ctrl)
+    bank = PIDBank.fromConfigs(cfgs)
+    pv = rng.uniform(0, 100, count)
+    op = rng.uniform(0, 100, count)
+    worst = 0.0
+    for step in range(steps):
+        if step == steps // 3 or step == steps // 2:     #Exercise transfer
+            for i in range(0, count, 2):
+                mode = ["manual", "auto"][step == steps // 2]
+                scalar[i].cfgWatch.cfg['controlMode'] = mode
+                bank.controlMode[i] = bank.ctrlModes[mode]
+        ref = np.array([scalar[i].runCtrl(pv[i], op[i])\
+                        for i in range(count)])
+        out = bank.runCtrl(pv, op)
+        worst = max(worst, np.max(np.abs(ref - out) /\
+                                  np.maximum(np.abs(ref), 1.0)))
+        op = out
+        pv += (np.clip(op, 0, 100) - pv) * 0.1 + rng.normal(0, 0.5, count)
+    return worst
+
+
+def benchmark(count, seconds=0.5):
+    """Return loop evaluations per ms for a bank of the given size"""
+    rng = np.random.RandomState(2)
+    bank = PIDBank.fromConfigs(randomConfigs(count, rng))
+    pv = rng.uniform(0, 100, count)
+    op = rng.uniform(0, 100, count)
+    steps = 0
+    start = time.time()
+    while time.time() - start < seconds:
+        op = bank.runCtrl(pv, op)
+        steps += 1
+    return (steps * count) / ((time.time() - start) * 1000)
+
+
+def scalarBenchmark(seconds=0.5):
+    """Return loop evaluations per ms for a single PIDController"""
+    ctrl = PIDController()
+    ctrl.cfgWatch.cfg = randomConfigs(3, np.random.RandomState(3))[2]
+    steps = 0
+    start = time.time()
+    while time.time() - start < seconds:
+        ctrl.runCtrl(45.0, 50.0)
+        steps += 1
+    return steps / ((time.time() - start) * 1000)
+
+
+def main():
+    print("Max scalar/bank OP difference: %g" % checkParity())
+    print("PIDController (scalar): %10.1f loops/ms" % scalarBenchmark())
+    for count in (1, 10, 100, 1000, 10000):
+        print("PIDBank N=%-6d        %10.1f loops/ms" % (count,\
+                                                       benchmark(count)))
+
+if __name__ == '__main__':main()
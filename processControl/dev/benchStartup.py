@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Alexander David Leech
+@date:   Fri Aug 19 19:05:44 2016
+@rev:    1
+@lang:   Python 2.7
+@deps:   yaml, resource (Linux only)
+@desc:   Measure cold start time and memory of each tool in each plot mode
+
+Run from the processControl directory: python dev/benchStartup.py
+Each case is started in a fresh interpreter against a local stand-in server,
+so the figures include interpreter start up, imports and tool construction.
+"""
+
+import os
+import sys
+import time
+import yaml
+import shutil
+import tempfile
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from src.toolClasses.modbusStandIn import modbusStandIn
+
+TOOLS = [("PIDControl", "PIDControl"), ("dataLoggingTool", "dataLoggingTool")]
+MODES = ["none", "inline", "process"]
+
+CHILD = """
+import time, resource
+from src.%s.%s import %s
+tool = %s()
+print("%%.6f %%d" %% (time.time(),
+                      resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+"""
+
+
+def setupDir(port):
+    """Copy the config to a scratch directory pointing at the stand-in"""
+    work = tempfile.mkdtemp()
+    shutil.copytree(os.path.join(ROOT, "cfg"), os.path.join(work, "cfg"))
+    os.mkdir(os.path.join(work, "log"))
+    path = os.path.join(work, "cfg", "modbusSettings.yaml")
+    with open(path) as f:
+        cfg = yaml.safe_load(f)
+    cfg.update({'method': "tcp", 'ip': "127.0.0.1", 'tcpPort': port,\
+                'logging': "disable"})
+    with open(path, "w") as f:
+        yaml.safe_dump(cfg, f)
+    return work
+
+
+def setMode(work, tool, mode):
+    """Set the plot mode in the tool settings"""
+    path = os.path.join(work, "cfg", "controllerSettings", tool + ".yaml")
+    with open(path) as f:
+        cfg = yaml.safe_load(f)
+    cfg['plotMode'] = mode
+    with open(path, "w") as f:
+        yaml.safe_dump(cfg, f)
+
+
+def runCase(work, package, tool, repeat=3):
+    """Start the tool in new interpreters and return the best time & RSS"""
+    env = dict(os.environ, PYTHONPATH=ROOT, MPLBACKEND="Agg")
+    code = CHILD % (package, tool, tool, tool)
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        out = subprocess.check_output([sys.executable, "-W", "ignore",\
+                                       "-c", code], cwd=work, env=env)
+        ready, rss = out.strip().split("\n")[-1].split()
+        result = (float(ready) - start, int(rss))
+        if best is None or result[0] < best[0]:
+            best = result
+    return best
+
+
+def main():
+    server = modbusStandIn(port=0)
+    server.start()
+    work = setupDir(server.port)
+    try:
+        print("%-16s %-8s %12s %12s" % ("tool", "plot", "start (ms)",\
+                                        "RSS (MB)"))
+        for package, tool in TOOLS:
+            for mode in MODES:
+                setMode(work, tool, mode)
+                secs, rss = runCase(work, package, tool)
+                print("%-16s %-8s %12.1f %12.1f" % (tool, mode, secs * 1000,\
+                                                    rss / 1024.0))
+    finally:
+        shutil.rmtree(work)
+        server.stop()
+
+if __name__ == '__main__':main()
@@ -3,28 +3,211 @@
 Created on Wed May 04 22:38:40 2016
 
 @author: Alex
+
+ARX structure search scored with the Young Information Criterion (YIC)
+
+Run from the processControl directory: python dev/yic.py
 """
+import os
+import sys
+import time
+import multiprocessing
 import numpy as np
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),\
+                                ".."))
+
+from src.PIDControl.RLSEstimator import RLSEstimator
+
+
+def _solveBatch(args):
+    """Fit a batch of candidates that all have the same number of parameters
+
+    :param args: (G, c, yy, rows, varY, cols) where cols is a (B, p) array of
+                 the regressor columns used by each candidate
+    :return: (score, fit) arrays of length B, NaN for a candidate whose Gram
+             matrix is singular
+    """
+    G, c, yy, rows, varY, cols = args
+    p = cols.shape[1]
+    Gs = G[cols[:, :, None], cols[:, None, :]]              #(B, p, p)
+    rhs = np.concatenate((c[cols][:, :, None],\
+                          np.broadcast_to(np.eye(p), (len(cols), p, p))),\
+                         axis=2)
+    try:
+        sol = np.linalg.solve(Gs, rhs)                      #[theta | G^-1]
+    except np.linalg.LinAlgError:
+        sol = np.full(rhs.shape, np.nan)        #Singular - solve one by one
+        for i in range(len(cols)):
+            try:
+                sol[i] = np.linalg.solve(Gs[i], rhs[i])
+            except np.linalg.LinAlgError:
+                pass                            #Scored NaN, ranked last
+    theta = sol[:, :, 0]
+    pDiag = np.diagonal(sol[:, :, 1:], axis1=1, axis2=2)
+    varE = np.maximum(yy - np.sum(theta * c[cols], axis=1), 0.0) / rows
+    with np.errstate(divide='ignore', invalid='ignore'):
+        nevn = np.mean((varE[:, None] * pDiag) / theta ** 2, axis=1)
+        score = np.log(varE / varY) + np.log(nevn)
+    return score, 1.0 - (varE / varY)
+
+
 class yic:
-    
+    """Searches ARX model orders and ranks them by YIC
+
+    Usage:  Create an instance
+            Call 'yic(y, u, na, nb, nk)' with the output and input records
+            Read the ranked results from 'struct', 'score' and 'fit'
+
+    Every candidate y(t) + a1.y(t-1) .. + a_i.y(t-i) =
+    b1.u(t-k) .. + b_j.u(t-k-j+1) for i <= na, j <= nb, k <= nk is a subset of
+    the columns of one regressor matrix holding every y and u lag. That
+    matrix and its Gram matrix are built once, so each fit is a p x p solve
+    on a slice of the Gram matrix instead of a pass over the data. The fits
+    are solved in batches of equal parameter count and the batches are
+    shared out over a process pool. Every candidate is fitted on the same
+    rows so the scores are directly comparable.
+
+    YIC = ln(var(e) / var(y)) + ln(NEVN) where NEVN is the mean of
+    var(e).Pii / theta_i^2 over the parameters. The most negative score is
+    the best model - well fitted without poorly defined parameters.
+    """
+
     def __init__(self):
-        self.struct = np.array([[0],[0],[0]])
-        self.score  = np.array([[0],[0],[0]])   
-        self.fit    = np.array([[0],[0],[0]])
+        self.struct = np.array([[0],[0],[0]])   #Columns of [na, nb, nk]
+        self.score  = np.array([[0],[0],[0]])   #YIC of each column of struct
+        self.fit    = np.array([[0],[0],[0]])   #R^2 of each column of struct
         return
 
-    
-    def yic(self, y, u, na, nb, nk):
+
+    def yic(self, y, u, na, nb, nk, processes=None, batchSize=256,\
+            detrend=True):
+        """Fit and score every ARX structure up to the given orders
+
+        :param y:         Output record
+        :param u:         Input record (same sample times as y)
+        :param na:        Largest number of output (a) parameters
+        :param nb:        Largest number of input (b) parameters
+        :param nk:        Largest input delay (samples)
+        :param processes: Worker processes (None for one per CPU, 1 to run
+                          in this process)
+        :param batchSize: Most candidates solved in one call
+        :param detrend:   Remove the mean of y and u before fitting
+        :type y:          numpy array
+        :type u:          numpy array
+        :type na:         int
+        :type nb:         int
+        :type nk:         int
+        :type processes:  int
+        :type batchSize:  int
+        :type detrend:    bool
+
+        :return: (struct, score, fit) sorted best score first
+        """
+        y = np.asarray(y, dtype=float).ravel()
+        u = np.asarray(u, dtype=float).ravel()
+        if detrend:
+            y = y - y.mean()
+            u = u - u.mean()
+        uLags = nk + nb                         #u(t) .. u(t-nk-nb+1)
+        start = max(na, uLags - 1)
+        rows = len(y) - start
+        if rows <= na + nb:
+            raise ValueError("Too few samples for the requested orders")
+
+        #Shared regressors: y(t-1)..y(t-na) then u(t)..u(t-uLags+1)
+        phi = np.empty((rows, na + uLags))
+        for i in range(na):
+            phi[:, i] = -y[start - 1 - i:len(y) - 1 - i]
+        for i in range(uLags):
+            phi[:, na + i] = u[start - i:len(u) - i]
+        target = y[start:]
+        G = np.dot(phi.T, phi)
+        c = np.dot(phi.T, target)
+        yy = np.dot(target, target)
+        varY = np.var(target)
+
+        #Candidate column sets grouped by parameter count
+        groups = {}
         for i in range(0, na+1):
             for j in range(0, nb+1):
                 for k in range(0, nk+1):
-                    
-            
-        
-        
-        
-        pass
-    
-    def RLS(self):
-        pass
\ No newline at end of file
+                    if i + j == 0 or (j == 0 and k > 0):
+                        continue                #No model / duplicate
+                    cols = list(range(i)) + list(range(na + k, na + k + j))
+                    groups.setdefault(i + j, []).append(((i, j, k), cols))
+
+        jobs = []
+        structs = []
+        for p in sorted(groups):
+            members = groups[p]
+            for b in range(0, len(members), batchSize):
+                batch = members[b:b + batchSize]
+                structs.extend(m[0] for m in batch)
+                jobs.append((G, c, yy, rows, varY,\
+                             np.array([m[1] for m in batch])))
+
+        if processes == 1 or len(jobs) == 1:
+            results = [_solveBatch(job) for job in jobs]
+        else:
+            pool = multiprocessing.Pool(processes)
+            try:
+                results = pool.map(_solveBatch, jobs)
+            finally:
+                pool.close()
+                pool.join()
+
+        score = np.concatenate([r[0] for r in results])
+        fit = np.concatenate([r[1] for r in results])
+        score[~np.isfinite(score)] = np.inf
+        order = np.argsort(score, kind='mergesort')
+        self.struct = np.array(structs).T[:, order]
+        self.score  = score[order]
+        self.fit    = fit[order]
+        return self.struct, self.score, self.fit
+
+    def RLS(self, y, u, na, nb, nk, forget=1.0):
+        """Fit one ARX structure recursively (see RLSEstimator)
+
+        :param y:      Output record
+        :param u:      Input record (same sample times as y)
+        :param na:     Number of output (a) parameters
+        :param nb:     Number of input (b) parameters
+        :param nk:     Input delay (samples, at least 1)
+        :param forget: Forgetting factor
+        :type y:       numpy array
+        :type u:       numpy array
+        :type na:      int
+        :type nb:      int
+        :type nk:      int
+        :type forget:  float
+
+        :return: (a, b, c) of the final estimate
+        """
+        est = RLSEstimator(na, nb, nk, forget)
+        for i in range(len(y)):
+            est.update(y[i], u[i])
+        return est.model()
+
+
+def main():
+    #Test on a simulated 2nd order plant with 3 samples of delay
+    rng = np.random.RandomState(0)
+    n = 20000
+    u = np.repeat(rng.choice([0.0, 1.0], n // 5), 5)     #PRBS style input
+    y = np.zeros(n)
+    for t in range(5, n):
+        y[t] = 1.5 * y[t-1] - 0.7 * y[t-2] + 0.5 * u[t-3] + 0.3 * u[t-4]
+    y += rng.normal(0, 0.05, n)
+
+    search = yic()
+    start = time.time()
+    struct, score, fit = search.yic(y, u, 10, 10, 10)
+    print("%d structures from %d samples in %.2fs" % (struct.shape[1], n,\
+                                                     time.time() - start))
+    print("%4s %4s %4s %10s %8s" % ("na", "nb", "nk", "YIC", "fit"))
+    for i in range(5):
+        print("%4d %4d %4d %10.3f %8.4f" % (struct[0, i], struct[1, i],\
+                                            struct[2, i], score[i], fit[i]))
+
+if __name__ == '__main__':main()
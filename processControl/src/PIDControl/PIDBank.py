@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Alexander David Leech
+@date:   Sun Aug 21 14:27:36 2016
+@rev:    1
+@lang:   Python 2.7
+@deps:   numpy
+@desc:   Vectorised bank of PID loops evaluated in a single step
+"""
+
+import numpy as np
+
+
+class PIDBank:
+    """Runs the PIDController algorithm for N loops at once
+
+    Usage:  Create an instance with the number of loops
+            Set each loop up with 'setLoop(i, cfg)' using the same keys as the
+            'PIDControl' settings file (or write to the arrays directly)
+            Call 'runCtrl(PV, OP)' each interval with arrays of PV and OP
+
+    Tuning, limits and state are held in numpy arrays with one entry per loop
+    and every branch of PIDController (control type, control mode, valve
+    limits, anti-windup and bumpless transfer) is evaluated for all loops
+    with masks instead of per loop string comparisons. The outputs match
+    PIDController loop for loop.
+    """
+
+    ctrlTypes = {"P": 0, "PI": 1, "PID": 2}
+    ctrlModes = {"manual": 0, "auto": 1}
+    STARTUP = -1
+
+
+    def __init__(self, loops):
+        """Allocate the tuning and state arrays
+
+        :param loops: Number of loops in the bank
+        :type loops:  int
+        """
+        self.loops = loops
+        self.setPoint = np.zeros(loops)
+        self.interval = np.ones(loops)
+        self.Kg = np.ones(loops)
+        self.Ki = np.ones(loops)
+        self.Kd = np.zeros(loops)
+        self.ctrlType = np.full(loops, self.ctrlTypes["PID"], dtype=np.int8)
+        self.controlMode = np.zeros(loops, dtype=np.int8)
+        self.limitsActive = np.zeros(loops, dtype=bool)
+        self.vlvLowLimit = np.zeros(loops)
+        self.vlvHighLimit = np.full(loops, 100.0)
+        self.antiWindUp = np.zeros(loops)
+        self.spErr = np.zeros(loops)                    #Accumulated error
+        self.deriv = np.zeros(loops)                    #PV at last D eval
+        self.prevCtrlMode = np.full(loops, self.STARTUP, dtype=np.int8)
+
+
+    @classmethod
+    def fromConfigs(cls, cfgs):
+        """Create a bank from a list of 'PIDControl' style settings dicts
+
+        :param cfgs: One settings dict per loop
+        :type cfgs:  list
+        """
+        bank = cls(len(cfgs))
+        for i in range(len(cfgs)):
+            bank.setLoop(i, cfgs[i])
+        return bank
+
+
+    def setLoop(self, i, cfg):
+        """Load the settings for one loop
+
+        :param i:   Loop index
+        :param cfg: Settings using the keys of the 'PIDControl' file
+        :type i:    int
+        :type cfg:  dict
+        """
+        if cfg['ctrlType'] not in self.ctrlTypes:
+            raise ValueError('Invalid Control Type - Options are P, PI & PID')
+        if cfg['controlMode'] not in self.ctrlModes:
+            raise ValueError("Invalid Control Mode")
+        self.setPoint[i] = cfg['setPoint']
+        self.interval[i] = cfg['interval']
+        self.Kg[i] = cfg['Kg']
+        self.Ki[i] = cfg['Ki']
+        self.Kd[i] = cfg['Kd']
+        self.ctrlType[i] = self.ctrlTypes[cfg['ctrlType']]
+        self.controlMode[i] = self.ctrlModes[cfg['controlMode']]
+        self.limitsActive[i] = cfg['limitsActive'] == True
+        self.vlvLowLimit[i] = cfg['vlvLowLimit']
+        self.vlvHighLimit[i] = cfg['vlvHighLimit']
+        self.antiWindUp[i] = cfg['antiWindUp']
+
+
+    def runCtrl(self, PV, OP):
+        """Run one control interval for every loop
+
+        :param PV:  Process variable of each loop
+        :param OP:  Current valve operating point of each loop
+        :type PV:   numpy array
+        :type OP:   numpy array
+
+        :return: numpy array of the new OP for each loop
+        """
+        PV = np.asarray(PV, dtype=float)
+        OP = np.asarray(OP, dtype=float)
+        changed = self.prevCtrlMode != self.controlMode
+        if changed.any():
+            self.__reduceTransEffect(changed, PV, OP)
+
+        ERR = self.setPoint - PV
+        isPI = self.ctrlType >= self.ctrlTypes["PI"]
+        isPID = self.ctrlType == self.ctrlTypes["PID"]
+        auto = self.controlMode == self.ctrlModes["auto"]
+
+        out = ERR.copy()
+        out += np.where(isPI, (self.spErr * self.interval) / self.Ki, 0.0)
+        out += np.where(isPID, ((self.deriv - PV) * self.Kd) / self.interval,\
+                        0.0)
+        out *= self.Kg
+        np.copyto(self.deriv, PV, where=auto & isPID)
+
+        high = self.limitsActive & (out > self.vlvHighLimit)
+        low = self.limitsActive & ~high & (out < self.vlvLowLimit)
+        saturated = high | low
+        self.spErr += np.where(auto, np.where(saturated,\
+                                              self.antiWindUp * ERR, ERR), 0.0)
+        np.copyto(out, self.vlvHighLimit, where=high)
+        np.copyto(out, self.vlvLowLimit, where=low)
+
+        out = np.sign(out) * np.floor((np.abs(out) * 100) + 0.5) / 100
+        return np.where(auto, out, self.setPoint)
+
+
+    def __reduceTransEffect(self, changed, PV, OP):
+        """Bumpless transfer for the loops whose control mode has changed
+
+        :param changed: Mask of loops to initialise
+        :param PV:      Process variable of each loop
+        :param OP:      Valve operating point of each loop
+        :type changed:  numpy array
+        :type PV:       numpy array
+        :type OP:       numpy array
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            trans = np.around((self.Ki / self.interval) *\
+                              ((OP / self.Kg) - (self.setPoint - PV)), 0)
+        trans[self.ctrlType == self.ctrlTypes["P"]] = 0.0
+        np.copyto(self.spErr, trans, where=changed)
+        np.copyto(self.deriv, PV, where=changed)
+        np.copyto(self.prevCtrlMode, self.controlMode, where=changed)
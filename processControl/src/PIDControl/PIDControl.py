@@ -9,14 +9,18 @@
 @desc:   Simple PID controller algorithm
 """
 
-import time
-
+from ..toolClasses.loopScheduler  import loopScheduler
 from ..toolClasses.modbusClient   import modbusClient
+from ..toolClasses.modbusErrors   import modbusError, modbusTimeoutError
 from ..toolClasses.osTools        import osTools
-from ..toolClasses.plotDataPoints import plotDataPoints
+from ..toolClasses.plotSetup      import plotSetup
 from ..toolClasses.procDataLog    import procDataLog
+from ..toolClasses.stageTimer     import stageTimer
+from ..toolClasses.tagMap         import tagMap
 from ..toolClasses.yamlImport     import yamlImport
 from .PIDController               import PIDController
+from .enhancedPID                 import enhancedPID
+from .RLSEstimator                import RLSEstimator
 
 class PIDControl:
     """A PID algorithm for use with a wide range control applications
@@ -26,16 +30,33 @@ class PIDControl:
             Call 'startStop(1)' to begin logging and connection to server
             Call 'run()' to enter main loop
             Call 'startStop(0)' to close log and connection
+    
+    When a MODBUS request fails the loop carries on at its interval in a
+    degraded mode: the rest of the cycle is skipped, so the device holds the
+    last OP written and the controller does not act on missing data, until
+    the link recovers. The requests of each cycle share a time budget of
+    'ioBudget' of the interval, and a request that runs out of budget counts
+    as a deadline miss against its stage.
     """
     
     def __init__(self):
         """Create all required objects and import settings"""
+        self.cfg = yamlImport.importYAML("./cfg/controllerSettings/PIDControl.yaml")
         self.coms = modbusClient()
         self.ext = osTools()
-        self.gph = plotDataPoints()
-        self.log = procDataLog()
-        self.PID = PIDController()
-        self.cfg = yamlImport.importYAML("./cfg/controllerSettings/PIDControl.yaml")
+        self.gph = plotSetup.createPlot(self.cfg['plotMode'])
+        self.log = procDataLog(stream="PIDControl")
+        self.tags = tagMap()
+        self.PID = self.__setupController()
+        self.rls = self.__setupRLS()
+        self.sched = loopScheduler(self.cfg['interval'] / float(self.cfg['speed']),\
+                                   self.cfg['overrunPolicy'])
+        self.timer = stageTimer(["read", "control", "write", "adapt", "log",\
+                                 "plot", "exit"], self.cfg['stageTiming'],\
+                                self.cfg['timingFile'], self.cfg['timingPeriod'])
+        self.ioBudget = self.cfg['ioBudget'] * self.sched.interval
+        self.faults = 0                         #Cycles lost to link/device errors
+        self.degraded = False
         self.count = 0
 
     
@@ -51,7 +72,11 @@ class PIDControl:
         elif run == 0:
             self.log.stopLog()            
             self.coms.closeConnection()
-            self.gph.closeBlock()               #Keep data plot open until exit
+            self.__report()                     #Faults and deadline misses
+            if self.timer.enabled:
+                self.timer.writeSummary()       #Final stage timings
+            if self.gph is not None:
+                self.gph.closeBlock()           #Keep data plot open until exit
         else:
             raise ValueError
 
@@ -59,30 +84,119 @@ class PIDControl:
         """Main run loop for the PID controller
         Ensure that the startStop method is called before and after this function
         """
-        startTime = time.time()                             #For time reference
+        self.sched.start()                                  #For time reference
         while(True):
-            loopTime = time.time()                          #Itteration start time
-            runTime = round(time.time() - startTime)        #Graph plot x axis
-            data = self.IOHandler()                         #Read device
-            data[1] = self.PID.runCtrl(data[0],data[1])     #Calculate OP           
-            self.coms.dataHandler('w',16,0,data=data[1])    #Write new OP to device
-            data.append(self.PID.cfg["setPoint"])           #Append setpoint to array
-            self.log.write(data)                            #Write data array to csv
-            self.gph.dataUpdate(runTime, data)              #Plot data array to graph
+            self.timer.start()                              #Stage timing
+            self.coms.setDeadline(self.sched.cycleStart + self.ioBudget)
+            runTime = round(self.sched.elapsed())           #Graph plot x axis
+            stage = "read"
+            try:
+                data = self.IOHandler()                     #Read device
+                self.timer.mark("read")
+                data[1] = self.PID.runCtrl(data[0],data[1]) #Calculate OP
+                self.timer.mark("control")
+                stage = "write"
+                self.coms.dataHandler('w',16,0,data=data[1]) #Write OP to device
+                self.timer.mark("write")
+            except modbusError as err:
+                self.timer.mark(stage)                      #Time the failed stage
+                self.__linkState(err, stage)                #Hold last OP
+            else:
+                self.__linkState(None)
+                if self.rls is not None:
+                    self.__adapt(data[0], data[1])          #Update model/tuning
+                self.timer.mark("adapt")
+                data.append(self.PID.cfg["setPoint"])       #Append setpoint to array
+                self.log.write(data)                        #Write data array to csv
+                self.timer.mark("log")
+                if self.gph is not None:
+                    self.gph.dataUpdate(runTime, data)      #Plot data array to graph
+                self.timer.mark("plot")
             if self.ext.kbdExit():                          #Check for exit condition
                 break
+            self.timer.mark("exit")
             print self.count                                #Heartbeat
             self.count += 1                                 #Heartbeat
-            time.sleep(self.cfg['interval'] - (time.time() - loopTime))
+            self.sched.wait()                               #Wait for next interval
+    
+    def __setupController(self):
+        """Create the controller selected by 'algorithm' in the settings"""
+        if self.cfg['algorithm'] == "standard":
+            return PIDController()
+        if self.cfg['algorithm'] != "enhanced":
+            raise ValueError("Invalid algorithm - Options are standard & enhanced")
+        if self.cfg['adaptive'] == "apply":
+            raise ValueError("Adaptive 'apply' needs the standard algorithm")
+        pid = enhancedPID()
+        if pid.dT != self.cfg['interval']:
+            raise ValueError("Enhanced PID 'dT' must match 'interval'")
+        return pid
+    
+    def __setupRLS(self):
+        """Create the model estimator selected by 'adaptive' in the settings"""
+        if self.cfg['adaptive'] == "off":
+            return None
+        if self.cfg['adaptive'] not in ("suggest", "apply"):
+            raise ValueError("Invalid adaptive mode - Options are off, suggest & apply")
+        na, nb, nk = self.cfg['rlsOrders']
+        return RLSEstimator(na, nb, nk, self.cfg['rlsForget'],\
+                            interval=self.cfg['interval'])
+    
+    def __adapt(self, PV, OP):
+        """Add the latest sample to the model and update the tuning
+        
+        The model update is a fixed size calculation each interval. The tuning
+        is only derived every 'adaptPeriod' intervals and is handed to the
+        controller to apply at the start of its next tick.
+        """
+        self.rls.update(PV, OP)
+        if self.rls.samples % self.cfg['adaptPeriod'] != 0:
+            return
+        tuning = self.rls.suggestTuning(self.PID.cfg['ctrlType'])
+        if tuning is None:
+            return
+        print("Suggested tuning: Kg %(Kg).3f Ki %(Ki).2f Kd %(Kd).2f" % tuning)
+        if self.cfg['adaptive'] == "apply":
+            self.PID.setTuning(tuning['Kg'], tuning['Ki'], tuning['Kd'])
+    
+    def __report(self):
+        """Print the MODBUS faults and per stage deadline misses of the run
+        (counted whether or not stage timing is enabled)
+        """
+        misses = ["%s %d" % (stage, self.timer.misses[stage])\
+                  for stage in self.timer.stages if self.timer.misses[stage]]
+        print("MODBUS faults: %d, deadline misses: %s" %\
+              (self.faults, ", ".join(misses) or "none"))
+    
+    def __linkState(self, err, stage=None):
+        """Track the MODBUS link, reporting when it fails and recovers
+        
+        A timeout is counted as a deadline miss against its stage rather than
+        a link fault, as the link is still up for the next cycle.
+        
+        :param err:   Error that ended this cycle (None if it completed)
+        :param stage: Stage the error was raised in
+        :type err:    modbusError
+        :type stage:  string
+        """
+        if isinstance(err, modbusTimeoutError):
+            self.timer.miss(stage)                          #Out of time
+        elif err is not None:
+            self.faults += 1
+            if not self.degraded:
+                print("MODBUS fault - holding last OP: " + str(err))
+            self.degraded = True
+        elif self.degraded:
+            print("MODBUS link restored - resuming control")
+            self.degraded = False
     
     def IOHandler(self):
-        """Used to read data from the MODBUS connection and append to one list
-        Add data by including additional lines of ioData.extend or modifying the
-        current read address lengths
+        """Used to read data from the MODBUS connection into one list
+        Add data by including additional tags in the 'tagMap' config file. The
+        tags are read with the minimum number of requests and returned in the
+        order they are listed.
         """
-        ioData = self.coms.dataHandler('r',4,0,length=2)        #PV
-        ioData.extend(self.coms.dataHandler('r',3,0,length=2))  #OP
-        return ioData
+        return self.tags.read(self.coms)
         
     
 def main():
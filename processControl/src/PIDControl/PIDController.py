@@ -10,32 +10,90 @@
 """
 
 import numpy as np
-from ..toolClasses.yamlImport import yamlImport
+from ..toolClasses.configWatch import configWatch
 
 
 class PIDController:
     """Help Text"""
-    def __init__(self):
-        """Read the config fle and set initial control mode"""        
+    def __init__(self, cfgFile="./cfg/controllerSettings/PIDControl.yaml"):
+        """Read the config fle and set initial control mode
+        
+        :param cfgFile: Path to the controller settings file
+        :type cfgFile:  string
+        """
+        self.cfgWatch = configWatch(cfgFile)
+        self.tuning = {}
+        self.__base = None
+        self.__retune = False
         self.__readConfig()
         self.prevCtrlMode = "Startup"
         
+
+    def setTuning(self, Kg, Ki, Kd):
+        """Override the tuning from the settings file
+        
+        The new values are applied at the start of the next 'runCtrl' call so
+        a tick never sees a mix of old and new tuning. The accumulated error
+        is rescaled so the integral term carries on from the same value; the
+        P and D terms still change with Kg, so OP steps by the change in
+        those terms. Call 'clearTuning()' to return to the file values.
+        
+        :param Kg: Controller gain
+        :param Ki: Integral time (s)
+        :param Kd: Derivative time (s)
+        :type Kg:  float
+        :type Ki:  float
+        :type Kd:  float
+        """
+        self.tuning = {'Kg': float(Kg), 'Ki': float(Ki), 'Kd': float(Kd)}
+        self.__base = None                      #Merge on the next tick
+        self.__retune = True
+    
+    
+    def clearTuning(self):
+        """Remove the 'setTuning' override"""
+        self.tuning = {}
+        self.__base = None
+        self.__retune = True
+        
     
-    def runCtrl(self,PV,OP):
+    def trackOutput(self, OP):
+        """Re-seed the integral term so it equals OP (external reset)
+        
+        Used while another loop's output drives the valve (e.g. an override
+        selector picked it). The integral term follows that output while the
+        P and D terms still act on this loop's own error, so the loop takes
+        over without a bump as soon as its output is chosen again.
+        
+        :param OP: Output actually in use
+        :type OP:  float
+        """
+        self.__readConfig()
+        if self.cfg['ctrlType'] != "P":
+            self.spErr = (OP * self.cfg['Ki']) /\
+                         (self.cfg['Kg'] * float(self.cfg['interval']))
+        
+    
+    def runCtrl(self,PV,OP,SP=None):
         """Call to run the PID control algorithm as per the cfg file
         
         :param PV:  Process variable at current time      
         :param OP:  Valve operating point
+        :param SP:  Setpoint to use instead of the file 'setPoint' (e.g. the
+                    output of a cascade master). In manual mode the file value
+                    is still returned as the OP.
         :type PV:   float
         :type OP:   float
+        :type SP:   float
         
         :return: New value for OP
         """
         self.__readConfig()
+        self.SP = self.cfg['setPoint'] if SP is None else SP
         if self.prevCtrlMode != self.cfg['controlMode']:
             self.spErr = self.__reduceTransEffect(PV,OP)
             self.prevCtrlMode = self.cfg['controlMode']
-        if self.cfg['controlMode'] == "acuto":
+        if self.cfg['controlMode'] == "auto":
             return round(self.__autoControl(PV,OP),2)
         if self.cfg['controlMode'] == "manual":
             return self.cfg['setPoint']
@@ -52,7 +110,7 @@ class PIDController:
         
         :return: New value for OP
         """
-        ERR = self.cfg['setPoint'] - PV
+        ERR = self.SP - PV
         return self.__vlvLims(self.__pidAlgorithm(PV,ERR),ERR)
     
 
@@ -128,15 +186,29 @@ class PIDController:
         :return: Value for spErr
         """
         self.deriv = PV
-        self.prevErr = self.cfg['setPoint'] - PV
+        self.prevErr = self.SP - PV
         
         if self.cfg["ctrlType"] == "P":
             return 0
         elif self.cfg["ctrlType"] == "PI" or self.cfg["ctrlType"] == "PID":
-            return np.around(((self.cfg['Ki']/self.cfg['interval'])*((OP/self.cfg['Kg'])-(self.cfg['setPoint'] - PV))),0)   
+            return np.around(((self.cfg['Ki']/self.cfg['interval'])*((OP/self.cfg['Kg'])-(self.SP - PV))),0)   
         else:
             return ValueError('Invalid Control Type - Options are P, PI & PID')
 
     def __readConfig(self):
-        """Read the PID control config file"""
-        self.cfg = yamlImport.importYAML("./cfg/controllerSettings/PIDControl.yaml")
\ No newline at end of file
+        """Fetch the current PID control settings
+        
+        The file is only parsed again when it has changed on disk. The snapshot
+        is taken once per call to 'runCtrl' so edits apply between ticks. Any
+        'setTuning' override is laid over the file values.
+        """
+        base = self.cfgWatch.read()
+        if base is self.__base:
+            return
+        old = getattr(self, 'cfg', None)
+        self.__base = base
+        self.cfg = dict(base, **self.tuning) if self.tuning else base
+        retune, self.__retune = self.__retune, False
+        if retune and hasattr(self, 'spErr'):
+            self.spErr *= (old['Kg'] / float(old['Ki'])) /\
+                          (self.cfg['Kg'] / float(self.cfg['Ki']))
\ No newline at end of file
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Alexander David Leech
+@date:   Thu Aug 25 21:06:44 2016
+@rev:    1
+@lang:   Python 2.7
+@deps:   numpy
+@desc:   Offline PID tuning by closed loop simulation of many gain sets
+"""
+
+import time
+import multiprocessing
+import numpy as np
+from ..plantSimulator.plantBank  import plantBank
+from ..toolClasses.yamlImport    import yamlImport
+from .PIDBank                    import PIDBank
+
+
+def _simulate(args):
+    """Closed loop setpoint step for a chunk of gain sets
+
+    :param args: (plant, base, steps, spStep, valve, Kg, Ki, Kd)
+    :return: (IAE, ISE, overshoot) arrays for the chunk
+    """
+    plant, base, steps, spStep, valve, Kg, Ki, Kd = args
+    count = len(Kg)
+    plants = plantBank.fromConfigs([plant] * count, base['interval'])
+    bank = PIDBank.fromConfigs([dict(base, controlMode="auto")] * count)
+    bank.Kg[:] = Kg
+    bank.Ki[:] = Ki
+    bank.Kd[:] = Kd
+    OP = plants.initialOP.copy()
+    PV = plants.pv()
+    bank.setPoint[:] = PV + spStep
+    IAE = np.zeros(count)
+    ISE = np.zeros(count)
+    peak = np.full(count, -np.inf)
+    sign = 1.0 if spStep >= 0 else -1.0
+    with np.errstate(all='ignore'):
+        for step in range(steps):
+            OP = bank.runCtrl(PV, OP)
+            PV = plants.step(np.clip(OP, valve[0], valve[1]))
+            err = bank.setPoint - PV
+            IAE += np.abs(err)
+            ISE += err * err
+            np.maximum(peak, sign * (PV - bank.setPoint), out=peak)
+        overshoot = np.maximum(peak, 0.0) * 100.0 / max(abs(spStep), 1e-9)
+    dT = float(base['interval'])
+    return IAE * dT, ISE * dT, overshoot
+
+
+class PIDTuner:
+    """Scores PID gain sets against a process model and returns the best
+
+    Usage:  Create an instance with a plant model and the controller settings
+            Call 'search(Kg, Ki, Kd)' with arrays of candidate gains (or
+            'candidates()' to build a grid of them from the 'PIDTuner'
+            settings or given ranges)
+            Call 'pareto(scores)' for the gain sets not beaten on every score
+
+    Each candidate runs a closed loop setpoint step through PIDBank, which
+    evaluates exactly the PIDController algorithm (type, limits, anti-windup
+    and rounding) for every candidate at once, against a plantBank copy of
+    the model with the OP clipped to the valve range. The candidates are
+    split into chunks and the chunks are simulated over a process pool.
+    Scores are IAE and ISE of the setpoint error (time weighted in seconds)
+    and overshoot as a percentage of the step.
+    """
+
+    def __init__(self, plant, base, steps=400, spStep=10.0, valve=(0, 100)):
+        """Setup
+
+        :param plant:  Plant dict using the keys of the 'plantSimulator' file
+        :param base:   Controller settings using the keys of 'PIDControl'
+        :param steps:  Control intervals to simulate
+        :param spStep: Size of the setpoint step from the initial PV
+        :param valve:  Physical OP range (low, high)
+        :type plant:   dict
+        :type base:    dict
+        :type steps:   int
+        :type spStep:  float
+        :type valve:   tuple
+        """
+        self.plant = plant
+        self.base = dict(base)
+        self.steps = steps
+        self.spStep = spStep
+        self.valve = valve
+        self.cfg = None                         #Set by 'fromSettings'
+
+
+    @classmethod
+    def fromSettings(cls, cfgFile="./cfg/controllerSettings/PIDTuner.yaml"):
+        """Create a tuner from the 'PIDTuner' settings file"""
+        cfg = yamlImport.importYAML(cfgFile)
+        plants = yamlImport.importYAML(cfg['plantFile'])['plants']
+        tuner = cls(plants[cfg['plant']],\
+                    yamlImport.importYAML(cfg['controllerFile']),\
+                    cfg['steps'], cfg['spStep'], tuple(cfg['valve']))
+        tuner.cfg = cfg
+        return tuner
+
+
+    @staticmethod
+    def plantFromFOPDT(gain, tau, deadTime, bias=0.0, initialOP=50.0):
+        """Build a plant dict from a first order plus dead time model
+
+        :return: Plant dict, e.g. from 'RLSEstimator.fopdt()'
+        """
+        return {'model': "FOPDT", 'gain': gain, 'tau': tau, 'tau2': 0.0,\
+                'deadTime': deadTime, 'bias': bias, 'noise': 0.0,\
+                'initialOP': initialOP}
+
+
+    def candidates(self, ranges=None):
+        """Build a log spaced grid of gains
+
+        :param ranges: dict of "Kg", "Ki" and "Kd" -> [low, high, count]
+                       (None for the ranges in the settings file)
+        :type ranges:  dict
+
+        :return: (Kg, Ki, Kd) arrays
+        """
+        if ranges is None:
+            if self.cfg is None:
+                raise ValueError("No gain ranges - pass 'ranges' or create "\
+                                 "the tuner with 'fromSettings'")
+            ranges = self.cfg
+        axes = []
+        for key in ("Kg", "Ki", "Kd"):
+            low, high, count = ranges[key]
+            if low <= 0:
+                axes.append(np.linspace(low, high, count))
+            else:
+                axes.append(np.logspace(np.log10(low), np.log10(high), count))
+        if self.base['ctrlType'] != "PID":
+            axes[2] = np.zeros(1)               #Kd is unused
+        grid = np.meshgrid(*axes, indexing='ij')
+        return tuple(g.ravel() for g in grid)
+
+
+    def search(self, Kg, Ki, Kd, processes=None, chunk=2000):
+        """Simulate every candidate gain set
+
+        :param Kg:        Candidate gains
+        :param Ki:        Candidate integral times (s)
+        :param Kd:        Candidate derivative times (s)
+        :param processes: Worker processes (None for one per CPU, 1 to run
+                          in this process)
+        :param chunk:     Candidates simulated together in one worker call
+        :type Kg:         numpy array
+        :type Ki:         numpy array
+        :type Kd:         numpy array
+        :type processes:  int
+        :type chunk:      int
+
+        :return: (N, 3) array of IAE, ISE and overshoot per candidate
+        """
+        Kg, Ki, Kd = [np.asarray(k, dtype=float) for k in (Kg, Ki, Kd)]
+        jobs = [(self.plant, self.base, self.steps, self.spStep, self.valve,\
+                 Kg[i:i + chunk], Ki[i:i + chunk], Kd[i:i + chunk])\
+                for i in range(0, len(Kg), chunk)]
+        if processes == 1 or len(jobs) == 1:
+            results = [_simulate(job) for job in jobs]
+        else:
+            pool = multiprocessing.Pool(processes)
+            try:
+                results = pool.map(_simulate, jobs)
+            finally:
+                pool.close()
+                pool.join()
+        scores = np.column_stack([np.concatenate([r[i] for r in results])\
+                                  for i in range(3)])
+        scores[~np.isfinite(scores)] = np.inf   #Unstable candidates
+        return scores
+
+
+    @staticmethod
+    def pareto(scores):
+        """Find the candidates no other candidate beats on every score
+
+        :param scores: (N, M) array of scores to minimise
+        :type scores:  numpy array
+
+        :return: Indices of the Pareto set ordered by the first score
+        """
+        order = np.lexsort(scores.T[::-1])
+        front = []
+        for i in order:
+            if not np.isfinite(scores[i]).all():
+                continue
+            if front:
+                kept = scores[front]
+                if np.any(np.all(kept <= scores[i], axis=1)):
+                    continue                    #Dominated (or a duplicate)
+            front.append(i)
+        return np.array(front, dtype=int)
+
+
+def main():
+    tuner = PIDTuner.fromSettings()
+    Kg, Ki, Kd = tuner.candidates()
+    start = time.time()
+    scores = tuner.search(Kg, Ki, Kd)
+    front = tuner.pareto(scores)
+    print("%d gain sets simulated in %.1fs - %d on the Pareto front" %\
+          (len(Kg), time.time() - start, len(front)))
+    print("%10s %10s %10s %12s %12s %10s" % ("Kg", "Ki", "Kd", "IAE", "ISE",\
+                                             "Over (%)"))
+    for i in front:
+        print("%10.3f %10.2f %10.2f %12.1f %12.1f %10.1f" % (Kg[i], Ki[i],\
+              Kd[i], scores[i, 0], scores[i, 1], scores[i, 2]))
+
+if __name__ == '__main__':main()
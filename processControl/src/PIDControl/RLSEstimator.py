@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Alexander David Leech
+@date:   Wed Aug 24 20:31:09 2016
+@rev:    1
+@lang:   Python 2.7
+@deps:   numpy
+@desc:   Recursive least squares ARX estimator for adaptive PID tuning
+"""
+
+import numpy as np
+
+
+class RLSEstimator:
+    """Streaming ARX model estimate updated from each (PV, OP) sample
+
+    Usage:  Create an instance with the model orders and forgetting factor
+            Call 'update(PV, OP)' once per control interval with the PV read
+            and the OP written on that interval
+            Call 'suggestTuning(ctrlType)' to get Kg/Ki/Kd for PIDController
+
+    The model is PV(t) + a1.PV(t-1) .. + a_na.PV(t-na) =
+    b1.OP(t-nk) .. + b_nb.OP(t-nk-nb+1) + c, so nk >= 1 as the OP written on
+    an interval can only show in the PV read on a later one. The regressor,
+    parameter, covariance and scratch arrays are allocated once and updated
+    in place so each update is O(n^2) in the number of parameters with no
+    stored history. The forgetting factor discounts old samples so the
+    estimate follows slow changes in the plant.
+    """
+
+    def __init__(self, na=2, nb=2, nk=1, forget=0.995, delta=1000.0,\
+                 interval=1.0):
+        """Allocate the estimator
+
+        :param na:       Number of PV (a) parameters
+        :param nb:       Number of OP (b) parameters
+        :param nk:       OP delay (intervals, at least 1)
+        :param forget:   Forgetting factor (0 < forget <= 1)
+        :param delta:    Initial covariance (large for a fast start)
+        :param interval: Sample interval (s) used for the tuning
+        :type na:        int
+        :type nb:        int
+        :type nk:        int
+        :type forget:    float
+        :type delta:     float
+        :type interval:  float
+        """
+        if nk < 1 or nb < 1:
+            raise ValueError("nk and nb must be at least 1")
+        if not 0 < forget <= 1:
+            raise ValueError("Forgetting factor must be in (0, 1]")
+        self.na = na
+        self.nb = nb
+        self.nk = nk
+        self.forget = float(forget)
+        self.delta = float(delta)
+        self.interval = float(interval)
+        self.n = na + nb + 1
+        self.theta = np.zeros(self.n)           #[a1..a_na, b1..b_nb, c]
+        self.P = np.zeros((self.n, self.n))
+        self.phi = np.zeros(self.n)
+        self.opHist = np.zeros(nk + nb - 1)     #OP(t-1) .. OP(t-nk-nb+1)
+        self.__Pphi = np.zeros(self.n)
+        self.__gain = np.zeros(self.n)
+        self.__outer = np.zeros((self.n, self.n))
+        self.reset()
+
+
+    def reset(self):
+        """Forget the current estimate"""
+        self.theta[:] = 0.0
+        self.P[:] = 0.0
+        self.P.flat[::self.n + 1] = self.delta
+        self.phi[:] = 0.0
+        self.phi[-1] = 1.0                      #Constant term
+        self.opHist[:] = 0.0
+        self.samples = 0
+        self.error = 0.0
+
+
+    def update(self, PV, OP):
+        """Add one sample to the estimate
+
+        :param PV: Process variable read this interval
+        :param OP: Valve operating point written this interval
+        :type PV:  float
+        :type OP:  float
+
+        :return: One step ahead prediction error for PV
+        """
+        na, nb, nk = self.na, self.nb, self.nk
+        if self.samples >= max(na, nk + nb - 1): #Regressor populated
+            phi = self.phi
+            Pphi = self.__Pphi
+            gain = self.__gain
+            self.error = PV - np.dot(phi, self.theta)
+            np.dot(self.P, phi, out=Pphi)
+            np.divide(Pphi, self.forget + np.dot(phi, Pphi), out=gain)
+            self.theta += gain * self.error
+            np.outer(gain, Pphi, out=self.__outer)
+            self.P -= self.__outer
+            self.P /= self.forget
+
+        #Shift in the new sample for the next interval
+        if na:
+            self.phi[1:na] = self.phi[:na - 1]  #Overlap safe in numpy
+            self.phi[0] = -PV
+        self.opHist[1:] = self.opHist[:-1]
+        self.opHist[0] = OP
+        self.phi[na:na + nb] = self.opHist[nk - 1:nk - 1 + nb]
+        self.samples += 1
+        return self.error
+
+
+    def model(self):
+        """Return the current estimate as (a, b, c) arrays"""
+        return (self.theta[:self.na].copy(),\
+                self.theta[self.na:self.na + self.nb].copy(),\
+                self.theta[-1])
+
+
+    def stepResponse(self, steps=500):
+        """Simulate the response of the model to a unit step in OP
+
+        :param steps: Number of intervals to simulate
+        :type steps:  int
+
+        :return: numpy array of the PV change after each interval
+        """
+        a, b, c = self.model()
+        y = np.zeros(steps + self.na)
+        for t in range(self.na, steps + self.na):
+            k = t - self.na + 1                 #Intervals since the step
+            y[t] = -np.dot(a, y[t - self.na:t][::-1]) +\
+                   np.sum(b[:max(0, min(self.nb, k - self.nk + 1))])
+        return y[self.na:]
+
+
+    def fopdt(self, steps=500):
+        """Reduce the model to first order plus dead time
+
+        Uses the two point (28.3% / 63.2%) method on the model step response.
+
+        :return: (gain, tau, deadTime) in PV per OP and seconds, or None when
+                 the model is not a stable, settling process
+        """
+        a, b, c = self.model()
+        den = 1.0 + np.sum(a)
+        roots = np.roots(np.concatenate(([1.0], a))) if self.na else []
+        if abs(den) < 1e-9 or np.any(np.abs(roots) >= 1.0):
+            return None
+        gain = np.sum(b) / den
+        if gain == 0:
+            return None
+        resp = self.stepResponse(steps) / gain
+        if resp[-1] < 0.95:                     #Not settled in 'steps'
+            return None
+        t28 = (np.argmax(resp >= 0.283) + 1) * self.interval
+        t63 = (np.argmax(resp >= 0.632) + 1) * self.interval
+        tau = max(1.5 * (t63 - t28), self.interval)
+        deadTime = max(t63 - tau, self.interval / 2.0)
+        return gain, tau, deadTime
+
+
+    def suggestTuning(self, ctrlType="PID"):
+        """Cohen-Coon tuning for the current estimate
+
+        :param ctrlType: Controller type - P, PI or PID
+        :type ctrlType:  string
+
+        :return: dict of Kg, Ki and Kd in the form used by PIDController, or
+                 None when no sensible model has been found yet
+        """
+        model = self.fopdt()
+        if model is None or model[0] <= 0:
+            return None
+        K, tau, L = model
+        r = L / tau
+        if ctrlType == "P":
+            return {'Kg': (1 / (K * r)) * (1 + r / 3), 'Ki': 1.0, 'Kd': 0.0}
+        if ctrlType == "PI":
+            return {'Kg': (1 / (K * r)) * (0.9 + r / 12),\
+                    'Ki': L * (30 + 3 * r) / (9 + 20 * r), 'Kd': 0.0}
+        if ctrlType == "PID":
+            return {'Kg': (1 / (K * r)) * (4.0 / 3 + r / 4),\
+                    'Ki': L * (32 + 6 * r) / (13 + 8 * r),\
+                    'Kd': L * 4 / (11 + 2 * r)}
+        raise ValueError('Invalid Control Type - Options are P, PI & PID')
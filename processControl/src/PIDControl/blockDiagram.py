@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Alexander David Leech
+@date:   Sat Sep 03 16:08:27 2016
+@rev:    1
+@lang:   Python 2.7
+@deps:   <None>
+@desc:   Multi-loop control (cascade, feedforward, ratio, override) built from
+         blocks and compiled into a flat evaluation plan.
+"""
+
+import heapq
+from ..toolClasses.yamlImport     import yamlImport
+from .PIDController               import PIDController
+
+
+class blockDiagram:
+    """Evaluates a diagram of PID, gain, ratio, sum and selector blocks
+
+    Usage:  Ensure all blocks are setup in the 'blockDiagram' file
+            Create an instance of the class to compile the diagram
+            Call 'run(inputs)' each interval with the input values (in the
+            order of 'inputs') to get the output values (in the order of
+            'outputs')
+
+    Every input and block output is a named signal. Blocks:
+        pid    - PIDController using 'controllerFile'. Reads 'pv', takes its
+                 setpoint from 'sp' (a cascade master, or the file setPoint
+                 if not set) and returns its OP. 'track' is the OP the loop
+                 starts from for bumpless transfer (the OP read back from
+                 the device, or the output a selector chose). When 'track'
+                 is a select block the loop also uses external reset: on
+                 every tick the selector did not pass its output on, the
+                 integral term is re-seeded from the selected output, so a
+                 loop that is not in control does not wind up and takes
+                 over bumplessly when it is picked again
+        gain   - k * input + bias (e.g. a feedforward term)
+        ratio  - input * ratio, the ratio coming from the 'ratioInput'
+                 signal when set
+        sum    - sum of the inputs times their 'weights' plus 'bias'
+        select - the "low", "high" or "median" input (override control).
+                 The median of an even number of inputs is the mean of the
+                 middle two
+
+    The diagram is compiled once: the blocks are sorted so that each runs
+    after the blocks it reads, every signal gets a slot in one list of
+    values, and each block becomes a small function bound to its slot
+    numbers. A tick is then one pass over that list of functions. Blocks run
+    in the order of the file where the signals they read allow it. A 'track'
+    signal is not a dependency - it reads whatever value the slot holds, so
+    tracking a block that runs later (e.g. the selector after the loops it
+    chooses between) gets its value from the previous tick. List a block
+    before the loop that tracks it to have it read this tick's value.
+    """
+
+    blockTypes = ("pid", "gain", "ratio", "sum", "select")
+    selectModes = ("low", "high", "median")
+
+
+    def __init__(self, cfgFile="./cfg/controllerSettings/blockDiagram.yaml",\
+                 cfg=None):
+        """Compile the diagram
+
+        :param cfgFile: Path to the diagram settings file
+        :param cfg:     Diagram settings to use instead of the file
+        :type cfgFile:  string
+        :type cfg:      dict
+        """
+        if cfg is None:
+            cfg = yamlImport.importYAML(cfgFile)
+        self.cfg = cfg
+        self.inputs = list(cfg['inputs'])
+        self.outputs = list(cfg['outputs'])
+        self.blocks = dict((block['name'], block) for block in cfg['blocks'])
+        if len(self.blocks) != len(cfg['blocks']):
+            raise ValueError("Block names must be unique")
+        self.slot = {}
+        for name in self.inputs + [b['name'] for b in cfg['blocks']]:
+            if name in self.slot:
+                raise ValueError("Signal " + name + " is defined twice")
+            self.slot[name] = len(self.slot)
+        self.values = [0.0] * len(self.slot)
+        self.order = self.__sort()
+        self.PID = {}
+        self.plan = [self.__compile(self.blocks[name]) for name in self.order]
+        for name in self.outputs:
+            self.__index(name, "outputs")
+        self.inSlots = [self.slot[name] for name in self.inputs]
+        self.outSlots = [self.slot[name] for name in self.outputs]
+        intervals = set(pid.cfg['interval'] for pid in self.PID.values())
+        if len(intervals) > 1:
+            raise ValueError("All pid blocks must use the same interval")
+        self.interval = intervals.pop() if intervals else None
+
+
+    def __index(self, name, user):
+        """Slot of a signal, rejecting unknown names"""
+        if name not in self.slot:
+            raise ValueError("Unknown signal " + str(name) + " in " + user)
+        return self.slot[name]
+
+
+    def __reads(self, block):
+        """Signals a block needs before it can run (excluding 'track')"""
+        kind = block['type']
+        if kind == "pid":
+            return [block['pv']] + ([block['sp']] if block.get('sp') else [])
+        if kind in ("gain", "ratio"):
+            extra = [block['ratioInput']] if block.get('ratioInput') else []
+            return [block['input']] + extra
+        if kind in ("sum", "select"):
+            return list(block['inputs'])
+        raise ValueError("Invalid block type - Options are " +\
+                         ", ".join(self.blockTypes))
+
+
+    def __sort(self):
+        """Order the blocks so each runs after the blocks it reads, keeping
+        the file order where it can
+
+        :return: List of block names in evaluation order
+        """
+        needs = {}
+        users = dict((name, []) for name in self.blocks)
+        position = dict((block['name'], i)\
+                        for i, block in enumerate(self.cfg['blocks']))
+        for block in self.cfg['blocks']:
+            name = block['name']
+            deps = set()
+            for signal in self.__reads(block):
+                self.__index(signal, name)
+                if signal in self.blocks:
+                    deps.add(signal)
+            needs[name] = len(deps)
+            for dep in deps:
+                users[dep].append(name)
+        ready = [(position[name], name) for name in needs if needs[name] == 0]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            name = heapq.heappop(ready)[1]
+            order.append(name)
+            for user in users[name]:
+                needs[user] -= 1
+                if needs[user] == 0:
+                    heapq.heappush(ready, (position[user], user))
+        if len(order) != len(self.blocks):
+            loop = sorted(name for name in needs if needs[name] > 0)
+            raise ValueError("Blocks form a loop: " + ", ".join(loop) +\
+                             " (use 'track' for feedback)")
+        return order
+
+
+    def __compile(self, block):
+        """Turn one block into a function of the value list
+
+        :param block: Block settings
+        :type block:  dict
+
+        :return: Function taking no arguments that updates the block output
+        """
+        v = self.values
+        out = self.slot[block['name']]
+        kind = block['type']
+        if kind == "pid":
+            pid = PIDController(block['controllerFile'])
+            self.PID[block['name']] = pid
+            pv = self.slot[block['pv']]
+            track = self.__index(block.get('track') or block['name'], \
+                                 block['name'])
+            if block.get('sp'):
+                sp = self.slot[block['sp']]
+                def step():
+                    v[out] = pid.runCtrl(v[pv], v[track], v[sp])
+            else:
+                def step():
+                    v[out] = pid.runCtrl(v[pv], v[track])
+            if block.get('track') in self.blocks and\
+               self.blocks[block['track']]['type'] == "select":
+                ctrl = step
+                def step():
+                    if v[track] != v[out]:              #Not selected
+                        pid.trackOutput(v[track])
+                    ctrl()
+            return step
+        if kind == "gain":
+            x = self.slot[block['input']]
+            k = float(block['k'])
+            bias = float(block.get('bias', 0.0))
+            def step():
+                v[out] = k * v[x] + bias
+            return step
+        if kind == "ratio":
+            x = self.slot[block['input']]
+            if block.get('ratioInput'):
+                r = self.slot[block['ratioInput']]
+                def step():
+                    v[out] = v[x] * v[r]
+            else:
+                ratio = float(block['ratio'])
+                def step():
+                    v[out] = v[x] * ratio
+            return step
+        if kind == "sum":
+            xs = [self.slot[name] for name in block['inputs']]
+            ws = [float(w) for w in block.get('weights') or [1.0] * len(xs)]
+            if len(ws) != len(xs):
+                raise ValueError("Weights do not match inputs in " +\
+                                 block['name'])
+            terms = zip(ws, xs)
+            bias = float(block.get('bias', 0.0))
+            def step():
+                total = bias
+                for w, x in terms:
+                    total += w * v[x]
+                v[out] = total
+            return step
+        xs = [self.slot[name] for name in block['inputs']]
+        mode = block.get('mode', "low")
+        if mode not in self.selectModes:
+            raise ValueError("Invalid select mode - Options are " +\
+                             ", ".join(self.selectModes))
+        if mode == "median" and len(xs) % 2 == 0:
+            mid = len(xs) // 2
+            def step():
+                ordered = sorted([v[x] for x in xs])
+                v[out] = (ordered[mid - 1] + ordered[mid]) / 2.0
+        elif mode == "median":
+            mid = len(xs) // 2
+            def step():
+                v[out] = sorted([v[x] for x in xs])[mid]
+        else:
+            pick = min if mode == "low" else max
+            def step():
+                v[out] = pick([v[x] for x in xs])
+        return step
+
+
+    def run(self, inputs):
+        """Evaluate every block once
+
+        :param inputs: Input values in the order of 'inputs'
+        :type inputs:  list
+
+        :return: List of output values in the order of 'outputs'
+        """
+        v = self.values
+        for slot, value in zip(self.inSlots, inputs):
+            v[slot] = value
+        for step in self.plan:
+            step()
+        return [v[slot] for slot in self.outSlots]
+
+
+    def signals(self):
+        """Return the current value of every signal by name"""
+        return dict((name, self.values[slot])\
+                    for name, slot in self.slot.items())
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Alexander David Leech
+@date:   Mon Sep 05 21:12:50 2016
+@rev:    1
+@lang:   Python 2.7
+@deps:   numpy
+@desc:   Enhanced PID controller with shift equation feedforward and gain
+         scheduling from a precomputed lookup table
+"""
+
+import numpy as np
+from ..toolClasses.configWatch import configWatch
+
+
+class enhancedPID:
+    """PID controller set up by the 'PIDControlSettings' file
+
+    Usage:  Ensure all params are setup in the 'PIDControlSettings' file
+            Create an instance of the class to load the settings
+            Call 'runCtrl(PV, OP)' each 'dT' seconds, as with PIDController
+
+    The shift equation Y = M1 * x + C1 gives the steady state PV of the
+    process with the OP at x, so the OP that holds the setpoint is
+    (SP - C1) / M1. When 'shiftActive' is set this is added to the PID
+    output as a feedforward, so the OP moves straight to the region of a new
+    setpoint and the PID only trims the remaining error.
+
+    tuningMode:
+        "N" - normal, the fixed Kg, Ki and Kd of the file
+        "S" - scheduled, Kg, Ki and Kd interpolated between the operating
+              points in 'gainSchedule' on the PV (or SP)
+
+    The schedule is interpolated into a lookup table of 'tableSize' entries
+    when the file is loaded, so each tick only indexes the table. When the
+    gains change the accumulated error is rescaled so the integral term
+    carries on from the same value, as PIDController does for 'setTuning'.
+    The P and D terms move with the new gains, so OP can still step.
+    Otherwise the algorithm (control types, valve limits, anti-windup and
+    bumpless transfer) is that of PIDController.
+    """
+
+    ctrlTypes = {"P": 0, "PI": 1, "PID": 2}
+    tuningModes = ("N", "S")
+
+
+    def __init__(self, cfgFile="./cfg/PIDControlSettings.yaml"):
+        """Read the config file and build the gain table
+
+        :param cfgFile: Path to the enhanced controller settings file
+        :type cfgFile:  string
+        """
+        self.cfgWatch = configWatch(cfgFile)
+        self.__base = None
+        self.spErr = 0.0
+        self.deriv = 0.0
+        self.index = None                       #Table entry in use
+        self.Kg = None                          #Gains of that entry
+        self.__readConfig()
+        self.prevCtrlMode = "Startup"
+
+
+    def runCtrl(self, PV, OP, SP=None):
+        """Call to run the enhanced PID algorithm as per the cfg file
+
+        :param PV:  Process variable at current time
+        :param OP:  Valve operating point
+        :param SP:  Setpoint to use instead of the file 'setPoint'
+        :type PV:   float
+        :type OP:   float
+        :type SP:   float
+
+        :return: New value for OP
+        """
+        self.__readConfig()
+        self.SP = self.cfg['setPoint'] if SP is None else SP
+        if self.prevCtrlMode != self.cfg['controlMode']:
+            self.spErr = self.__reduceTransEffect(PV, OP)
+            self.prevCtrlMode = self.cfg['controlMode']
+        if self.cfg['controlMode'] == "auto":
+            return round(self.__autoControl(PV), 2)
+        if self.cfg['controlMode'] == "manual":
+            return self.cfg['setPoint']
+        raise ValueError("Invalid Control Mode")
+
+
+    def __autoControl(self, PV):
+        """Handler for the enhanced PID algorithm (auto mode)"""
+        self.__schedule(PV)
+        ERR = self.SP - PV
+        OP = (self.SP - self.C1) * self.invM1 + self.__pidAlgorithm(PV, ERR)
+        return self.__vlvLims(OP, ERR)
+
+
+    def __schedule(self, PV):
+        """Load the gains for this tick, rescaling the accumulated error when
+        they change so the integral term carries on from the same value
+        """
+        x = PV if self.onPV else self.SP
+        i = int((x - self.low) * self.scale + 0.5)
+        if i < 0:
+            i = 0
+        elif i > self.last:
+            i = self.last
+        if i == self.index:
+            return
+        Kg, Ki, Kd = self.table[i]
+        if self.Kg is not None:
+            self.spErr *= (self.Kg / self.Ki) / (Kg / Ki)
+        self.index = i
+        self.Kg, self.Ki, self.Kd = Kg, Ki, Kd
+
+
+    def __pidAlgorithm(self, PV, ERR):
+        """Runs the PID algorithm
+
+        :param PV: Process Variable
+        :param ERR: Setpoint Error
+        :type PV: float
+        :type ERR: float
+        """
+        if self.ctrlType == 0:
+            return self.Kg * ERR
+        if self.ctrlType == 1:
+            return self.Kg * (ERR + self.spErr * self.dT / self.Ki)
+        d = (self.deriv - PV) * self.Kd / self.dT
+        self.deriv = PV
+        return self.Kg * (ERR + self.spErr * self.dT / self.Ki + d)
+
+
+    def __vlvLims(self, OP, ERR):
+        """Enforce Valve Limitations and antiwindup
+
+        :param OP:  Valve operating point
+        :param ERR: Set point error
+        :type OP:   float
+        :type ERR:  float
+        """
+        if OP > self.high:
+            self.spErr += self.antiWindUp * ERR
+            return self.high
+        if OP < self.lowLimit:
+            self.spErr += self.antiWindUp * ERR
+            return self.lowLimit
+        self.spErr += ERR
+        return OP
+
+
+    def __reduceTransEffect(self, PV, OP):
+        """Calculate spErr so the first auto tick returns the current OP
+
+        :param PV: Process variable at current time
+        :param OP: Valve operating point
+        :type PV:  float
+        :type OP:  float
+
+        :return: Value for spErr
+        """
+        self.deriv = PV
+        if self.ctrlType == 0:
+            return 0
+        self.__schedule(PV)
+        feed = (self.SP - self.C1) * self.invM1
+        return np.around((self.Ki / self.dT) *\
+                         (((OP - feed) / self.Kg) - (self.SP - PV)), 0)
+
+
+    def __readConfig(self):
+        """Fetch the current settings, rebuilding the gain table when the
+        file has changed on disk
+        """
+        base = self.cfgWatch.read()
+        if base is self.__base:
+            return
+        if base['ctrlType'] not in self.ctrlTypes:
+            raise ValueError('Invalid Control Type - Options are P, PI & PID')
+        if base['tuningMode'] not in self.tuningModes:
+            raise ValueError('Invalid Tuning Mode - Options are N & S')
+        self.__base = self.cfg = base
+        self.ctrlType = self.ctrlTypes[base['ctrlType']]
+        self.dT = float(base['dT'])
+        self.lowLimit = base['vlvLowLimit']
+        self.high = base['vlvHighLimit']
+        self.antiWindUp = base['antiWindUp']
+        self.C1 = float(base['C1']) if base['shiftActive'] else 0.0
+        self.invM1 = 1.0 / base['M1'] if base['shiftActive'] else 0.0
+        self.__buildTable()
+
+
+    def __buildTable(self):
+        """Interpolate the gain schedule into the lookup table"""
+        cfg = self.cfg
+        if cfg['tuningMode'] == "N":
+            table = [(float(cfg['Kg']), float(cfg['Ki']), float(cfg['Kd']))]
+            self.low, self.scale, self.onPV = 0.0, 0.0, True
+        else:
+            sched = cfg['gainSchedule']
+            if sched['scheduleOn'] not in ("PV", "SP"):
+                raise ValueError("Invalid scheduleOn - Options are PV & SP")
+            points = sorted(sched['points'], key=lambda p: p['at'])
+            at = np.array([p['at'] for p in points], dtype=float)
+            if len(at) < 2 or np.any(np.diff(at) <= 0):
+                raise ValueError("Gain schedule needs 2 or more distinct points")
+            size = max(int(sched['tableSize']), 2)
+            xs = np.linspace(at[0], at[-1], size)
+            columns = [np.interp(xs, at, [p[key] for p in points])\
+                       for key in ("Kg", "Ki", "Kd")]
+            table = zip(*[c.tolist() for c in columns])
+            self.low = float(at[0])
+            self.scale = (size - 1) / float(at[-1] - at[0])
+            self.onPV = sched['scheduleOn'] == "PV"
+        self.table = table
+        self.last = len(table) - 1
+        self.index = None                       #Reload on the next tick
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Alexander David Leech
+@date:   Mon Aug 29 20:57:13 2016
+@rev:    1
+@lang:   Python 2.7
+@deps:   numpy
+@desc:   Replays a process log through the PID controller as fast as possible
+         and checks the OP against the recorded values.
+"""
+
+import time
+import numpy as np
+from ..toolClasses.historian      import historian
+from ..toolClasses.yamlImport     import yamlImport
+from .PIDController               import PIDController
+
+
+class virtualClock:
+    """Stands in for loopScheduler, taking its time from the log rows
+
+    'wait' moves on to the next logged row straight away instead of
+    sleeping, so the loop runs as fast as the CPU allows while 'elapsed'
+    still reports the recorded run time.
+    """
+
+    def __init__(self, stamps):
+        """
+        :param stamps: Epoch time of each row (s)
+        :type stamps:  numpy array
+        """
+        self.stamps = stamps
+        self.start()
+
+
+    def start(self):
+        """Go back to the first row"""
+        self.row = 0
+
+
+    def elapsed(self):
+        """Return the recorded seconds from the first row to this one"""
+        return self.stamps[self.row] - self.stamps[0]
+
+
+    def remaining(self):
+        """Return the recorded seconds until the next row"""
+        if self.row + 1 < len(self.stamps):
+            return self.stamps[self.row + 1] - self.stamps[self.row]
+        return 0.0
+
+
+    def wait(self):
+        """Move to the next row without sleeping
+
+        :return: Lateness (always 0)
+        """
+        self.row += 1
+        return 0.0
+
+
+class logReplay:
+    """Drives PIDController (and optionally plotDataPoints) from a log
+
+    Usage:  Ensure all params are setup in the 'logReplay' file
+            Create an instance of the class to load the log
+            Call 'run()' to replay it and get the results
+
+    Each row gives the controller the logged PV, the setpoint in force and
+    the OP held by the device (the OP recorded on the row before, which is
+    what PIDControl reads back). The OP the controller returns is compared
+    to the OP recorded on the row. In manual mode PIDControl writes (and
+    logs as the setpoint) the file 'setPoint', so the logged setpoint is
+    the expected OP. The first row is not compared as the OP held before
+    the log started is not known. Logs stored with compression
+    ('log_compression') cannot be replayed as rows are missing.
+    """
+
+    def __init__(self, cfgFile="./cfg/controllerSettings/logReplay.yaml"):
+        """Load the settings and the log"""
+        self.cfg = yamlImport.importYAML(cfgFile)
+        log = historian().readFile(self.cfg['logFile'])
+        for key in ('pvColumn', 'opColumn', 'spColumn'):
+            if self.cfg[key] not in log.dtype.names[1:]:
+                raise ValueError("No column " + str(self.cfg[key]) +\
+                                 " in " + self.cfg['logFile'])
+        self.stamps = log['time'] / 1e9
+        self.PV = log[self.cfg['pvColumn']]
+        self.OP = log[self.cfg['opColumn']]
+        self.SP = log[self.cfg['spColumn']]
+        self.clock = virtualClock(self.stamps)
+        self.PID = PIDController(self.cfg['controllerFile'])
+        self.gph = None
+        if self.cfg['plot']:
+            from ..toolClasses.plotDataPoints import plotDataPoints
+            self.gph = plotDataPoints()
+
+
+    def run(self):
+        """Replay every row of the log
+
+        :return: dict of rows, mismatches, first mismatch row, largest OP
+                 error, wall time (s), rows per second and speed up on the
+                 recorded run time
+        """
+        rows = len(self.stamps)
+        out = np.zeros(rows)
+        plotEvery = max(int(self.cfg['plotEvery']), 1)
+        held = self.OP[0] if rows else 0.0
+        start = time.time()
+        self.clock.start()
+        for row in range(rows):
+            SP = float(self.SP[row])
+            out[row] = self.PID.runCtrl(float(self.PV[row]), float(held), SP)
+            if self.PID.cfg['controlMode'] == "manual":
+                out[row] = SP                   #Manual OP is the logged SP
+            held = self.OP[row]                 #Device OP on the next row
+            if self.gph is not None:
+                self.gph.dataAppend(self.clock.elapsed(), self.PV[row],\
+                                    out[row], self.SP[row])
+                if row % plotEvery == 0:
+                    self.gph.refresh()
+            self.clock.wait()
+        wall = time.time() - start
+
+        err = np.abs(out[1:] - self.OP[1:])
+        bad = np.flatnonzero(~(err <= self.cfg['tolerance'])) + 1
+        recorded = self.stamps[-1] - self.stamps[0] if rows else 0.0
+        self.replayOP = out
+        return {'rows': rows,
+                'mismatches': len(bad),
+                'firstMismatch': int(bad[0]) if len(bad) else None,
+                'maxError': float(np.nanmax(err)) if len(err) else 0.0,
+                'wall': wall,
+                'rowsPerSec': rows / wall if wall > 0 else float('inf'),
+                'speedUp': recorded / wall if wall > 0 else float('inf')}
+
+
+def main():
+    replay = logReplay()                     #Load the settings and log
+    res = replay.run()                       #Replay as fast as possible
+    print("Replayed %d rows in %.3fs - %.0f rows/s, %.0fx real time" %\
+          (res['rows'], res['wall'], res['rowsPerSec'], res['speedUp']))
+    if res['mismatches'] == 0:
+        print("OP matches the recording (max error %.4f)" % res['maxError'])
+    else:
+        print("%d OP mismatches, first on row %d (max error %.4f)" %\
+              (res['mismatches'], res['firstMismatch'], res['maxError']))
+        raise SystemExit(1)
+
+if __name__ == '__main__':main()
@@ -9,12 +9,14 @@
 @desc:   Tool to log and plot data from a MODBUS connection. Acts as an ideal
          tool for logging and monitoring step tests as they progress.
 """
-import time
-
+from ..toolClasses.loopScheduler  import loopScheduler
 from ..toolClasses.modbusClient   import modbusClient
+from ..toolClasses.modbusErrors   import modbusError, modbusTimeoutError
 from ..toolClasses.osTools        import osTools
-from ..toolClasses.plotDataPoints import plotDataPoints
+from ..toolClasses.plotSetup      import plotSetup
 from ..toolClasses.procDataLog    import procDataLog
+from ..toolClasses.stageTimer     import stageTimer
+from ..toolClasses.tagMap         import tagMap
 from ..toolClasses.yamlImport     import yamlImport
 
 class dataLoggingTool:
@@ -25,15 +27,29 @@ class dataLoggingTool:
             Call 'startStop(1)' to begin logging and connection to server
             Call 'run()' to enter main loop
             Call 'startStop(0)' to close log and connection
+    
+    When a MODBUS read fails nothing is logged for that cycle and the loop
+    carries on at its interval until the link recovers. The reads of each
+    cycle share a time budget of 'ioBudget' of the interval, and a read that
+    runs out of budget counts as a deadline miss.
     """
     
     def __init__(self):
         """Create all required objects and import settings"""
+        self.cfg = yamlImport.importYAML("./cfg/controllerSettings/dataLoggingTool.yaml")
         self.coms = modbusClient()
         self.ext = osTools()
-        self.gph = plotDataPoints()
-        self.log = procDataLog()
-        self.cfg = yamlImport.importYAML("./cfg/controllerSettings/dataLoggingTool.yaml")
+        self.gph = plotSetup.createPlot(self.cfg['plotMode'])
+        self.log = procDataLog(stream="dataLoggingTool")
+        self.tags = tagMap()
+        self.sched = loopScheduler(self.cfg['interval'] / float(self.cfg['speed']),\
+                                   self.cfg['overrunPolicy'])
+        self.timer = stageTimer(["read", "log", "plot", "exit"],\
+                                self.cfg['stageTiming'], self.cfg['timingFile'],\
+                                self.cfg['timingPeriod'])
+        self.ioBudget = self.cfg['ioBudget'] * self.sched.interval
+        self.faults = 0                         #Cycles lost to link/device errors
+        self.degraded = False
         self.count = 0
 
     
@@ -49,7 +65,11 @@ class dataLoggingTool:
         elif run == 0:
             self.log.stopLog()            
             self.coms.closeConnection()
-            self.gph.closeBlock()               #Keep data plot open until exit
+            self.__report()                     #Faults and deadline misses
+            if self.timer.enabled:
+                self.timer.writeSummary()       #Final stage timings
+            if self.gph is not None:
+                self.gph.closeBlock()           #Keep data plot open until exit
         else:
             raise ValueError 
         
@@ -58,28 +78,65 @@ class dataLoggingTool:
         """Main run loop for the data logging tool
         Ensure that the startStop method is called before and after this function
         """
-        startTime = time.time()                 #For time reference
+        self.sched.start()                      #For time reference
         while(True):
-            loopTime = time.time()              #Itteration start time
-            runTime = round(time.time() - startTime)
-            data = self.IOHandler()
-            self.log.write(data)
-            self.gph.dataUpdate(runTime, data)
+            self.timer.start()                  #Stage timing
+            self.coms.setDeadline(self.sched.cycleStart + self.ioBudget)
+            runTime = round(self.sched.elapsed())
+            try:
+                data = self.IOHandler()
+                self.timer.mark("read")
+            except modbusError as err:
+                self.timer.mark("read")         #Time the failed read
+                if isinstance(err, modbusTimeoutError):
+                    self.timer.miss("read")     #Out of time, link up
+                else:
+                    self.__linkState(err)       #Skip this cycle
+            else:
+                self.__linkState(None)
+                self.log.write(data)
+                self.timer.mark("log")
+                if self.gph is not None:
+                    self.gph.dataUpdate(runTime, data)
+                self.timer.mark("plot")
             if self.ext.kbdExit():              #Detect exit condition
                 break
+            self.timer.mark("exit")
             print self.count                    #Heartbeat
             self.count += 1                     #Heartbeat
-            time.sleep(self.cfg['interval'] -\
-                      (time.time() - loopTime)) #Loop Interval
+            self.sched.wait()                   #Loop Interval
+    
+    def __report(self):
+        """Print the MODBUS faults and per stage deadline misses of the run
+        (counted whether or not stage timing is enabled)
+        """
+        misses = ["%s %d" % (stage, self.timer.misses[stage])\
+                  for stage in self.timer.stages if self.timer.misses[stage]]
+        print("MODBUS faults: %d, deadline misses: %s" %\
+              (self.faults, ", ".join(misses) or "none"))
+    
+    def __linkState(self, err):
+        """Track the MODBUS link, reporting when it fails and recovers
+        
+        :param err: Error that ended this cycle (None if it completed)
+        :type err:  modbusError
+        """
+        if err is not None:
+            self.faults += 1
+            if not self.degraded:
+                print("MODBUS fault - logging paused: " + str(err))
+            self.degraded = True
+        elif self.degraded:
+            print("MODBUS link restored - logging resumed")
+            self.degraded = False
     
     def IOHandler(self):
-        """Used to read data from the MODBUS connection and append to one list
-        Add data by including additional lines of ioData.extend or modifying the
-        current read address lengths
+        """Used to read data from the MODBUS connection into one list
+        Add data by including additional tags in the 'tagMap' config file. The
+        tags are read with the minimum number of requests and returned in the
+        order they are listed.
         """
-        ioData = self.coms.dataHandler('r',4,0,length=2)
-        ioData.extend(self.coms.dataHandler('r',3,0,length=2))
-        return ioData
+        return self.tags.read(self.coms)
         
     
 def main():
@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Alexander David Leech
+@date:   Tue Aug 30 20:14:37 2016
+@rev:    1
+@lang:   Python 2.7
+@deps:   pymodbus, numpy
+@desc:   Local MODBUS TCP gateway that shares one device connection between
+         any number of tools, polling the registers they use once per scan.
+"""
+
+import Queue
+import threading
+import numpy as np
+from ..toolClasses.loopScheduler  import loopScheduler, monotonic
+from ..toolClasses.modbusClient   import modbusClient
+from ..toolClasses.modbusErrors   import modbusError, modbusDeviceError
+from ..toolClasses.modbusStandIn  import modbusStandIn
+from ..toolClasses.osTools        import osTools
+from ..toolClasses.tagMap         import tagMap
+from ..toolClasses.yamlImport     import yamlImport
+
+
+class gatewayServer(modbusStandIn):
+    """MODBUS stand-in that passes every request to the gateway"""
+
+    def __init__(self, gateway, **kwargs):
+        """
+        :param gateway: Gateway serving the requests
+        :type gateway:  modbusGateway
+        """
+        modbusStandIn.__init__(self, size=0, **kwargs)
+        self.gateway = gateway
+
+
+    def readTable(self, unit, reg, addr, length):
+        """Serve a read request from the gateway cache"""
+        if unit not in self.tables:
+            return 0x0B
+        return self.gateway.read(self.fcTable[reg], addr, length)
+
+
+    def writeTable(self, unit, reg, addr, values):
+        """Pass a write request through to the device"""
+        if unit not in self.tables:
+            return 0x0B
+        return self.gateway.write(reg, addr, values)
+
+
+class modbusGateway:
+    """Owns the device connection and serves the tools from a shared cache
+
+    Usage:  Ensure all params are setup in the 'modbusGateway' file
+            Point the tools 'modbusSettings' at the gateway 'ip' and 'tcpPort'
+            Create an instance of the class to connect to the device
+            Call 'startStop(1)' to start polling and serving
+            Call 'run()' to enter main loop
+            Call 'startStop(0)' to stop
+
+    Every block a tool reads is remembered and polled from the device once
+    per 'scanInterval', with blocks in the same table merged into as few
+    requests as possible. Reads are answered from the cache while the data is
+    no older than 'maxAge'; anything older (or never polled) is read from the
+    device there and then. Writes are passed to the device in the order they
+    arrive, ahead of the next poll, and the tool only gets its reply once the
+    device has accepted the write. An exception reply from the device is
+    passed on to the tool, and any other failure (including the link being
+    down while modbusClient reconnects) is returned as MODBUS exception 0x0B
+    (gateway target failed to respond). Only the device thread ever touches
+    the device connection.
+    """
+
+    #Largest quantity polled in a single request for each table
+    readLimit = tagMap.readLimit
+
+    #Entries kept in the cache of each table (full MODBUS address range)
+    tableSize = 65536
+
+
+    def __init__(self, cfgFile="./cfg/controllerSettings/modbusGateway.yaml"):
+        """Create all required objects and import settings"""
+        self.cfg = yamlImport.importYAML(cfgFile)
+        self.coms = modbusClient(self.cfg['deviceFile'])
+        self.server = gatewayServer(self, host=self.cfg['ip'],\
+                                    port=self.cfg['tcpPort'],\
+                                    units=[self.cfg['unit']])
+        self.cache = {}
+        self.stamp = {}
+        for table in self.readLimit:
+            dtype = bool if table <= 2 else np.uint16
+            self.cache[table] = np.zeros(self.tableSize, dtype=dtype)
+            self.stamp[table] = np.full(self.tableSize, -np.inf)
+        self.lock = threading.Lock()
+        self.jobs = Queue.Queue()
+        self.requested = {}                     #(table, addr, length): time
+        self.blocks = []
+        self.__replan = False
+        self.__stop = threading.Event()
+        self.thread = None
+        self.stats = {'polls': 0, 'hits': 0, 'misses': 0, 'writes': 0,\
+                      'errors': 0}
+        if self.cfg['preloadTags']:
+            for block in tagMap().blocks:
+                self.__touch(block[0], block[1], block[2])
+
+
+    def startStop(self, run):
+        """Use to start/stop the gateway before/after the main loop
+
+        :param run: set to 1 or 0 to start or stop serving
+        :type run: int
+        """
+        if run == 1:
+            self.__stop.clear()
+            self.thread = threading.Thread(target=self.__device)
+            self.thread.daemon = True
+            self.thread.start()
+            self.server.start()
+            print("Gateway serving on " + self.cfg['ip'] + ":" +\
+                  str(self.server.port))
+        elif run == 0:
+            self.server.stop()
+            self.__stop.set()
+            if self.thread is not None:
+                self.thread.join()
+                self.thread = None
+            self.coms.closeConnection()
+        else:
+            raise ValueError
+
+
+    def run(self):
+        """Main run loop for the gateway
+        Ensure that the startStop method is called before and after this function
+        """
+        ext = osTools()
+        sched = loopScheduler(1.0)
+        sched.start()
+        while(True):
+            if ext.kbdExit():                               #Check for exit
+                break
+            sched.wait()
+
+
+    def read(self, table, addr, length):
+        """Serve a read from the cache, or from the device if stale
+
+        :param table:  Table number (1-4)
+        :param addr:   Start address
+        :param length: Quantity to read
+        :type table:   int
+        :type addr:    int
+        :type length:  int
+
+        :return: List of values or a MODBUS exception code
+        """
+        if addr + length > self.tableSize:
+            return 0x02
+        self.__touch(table, addr, length)
+        oldest = monotonic() - self.cfg['maxAge']
+        with self.lock:
+            if self.stamp[table][addr:addr + length].min() >= oldest:
+                self.stats['hits'] += 1
+                return self.cache[table][addr:addr + length].tolist()
+        self.stats['misses'] += 1
+        return self.__submit(('r', table, addr, length))
+
+
+    def write(self, reg, addr, values):
+        """Pass a write through to the device, in order with other writes
+
+        :param reg:    Write function code (15 or 16)
+        :param addr:   Start address
+        :param values: Values to write
+        :type reg:     int
+        :type addr:    int
+        :type values:  list
+
+        :return: None on success or a MODBUS exception code
+        """
+        if addr + len(values) > self.tableSize:
+            return 0x02
+        self.stats['writes'] += 1
+        return self.__submit(('w', reg, addr, values))
+
+
+    def __touch(self, table, addr, length):
+        """Record that a tool wants a block, adding it to the poll if new"""
+        key = (table, addr, length)
+        with self.lock:
+            if key not in self.requested:
+                self.__replan = True
+            self.requested[key] = monotonic()
+
+
+    def __plan(self):
+        """Merge the wanted blocks into the smallest set of device reads,
+        dropping blocks no tool has read within 'expireAfter'
+        """
+        now = monotonic()
+        with self.lock:
+            for key, last in self.requested.items():
+                if now - last > self.cfg['expireAfter']:
+                    del self.requested[key]
+            wanted = sorted(self.requested)
+            self.__replan = False
+            self.__planned = now
+        blocks = []
+        for table, start, length in wanted:
+            end = start + length
+            if blocks and blocks[-1][0] == table:
+                block = blocks[-1]
+                blockEnd = block[1] + block[2]
+                if start - blockEnd <= self.cfg['maxGap'] and\
+                   max(end, blockEnd) - block[1] <= self.readLimit[table]:
+                    block[2] = max(end, blockEnd) - block[1]
+                    continue
+            blocks.append([table, start, length])
+        self.blocks = blocks
+
+
+    def __submit(self, job):
+        """Queue a job for the device thread and wait for its result
+
+        A job still queued after the wait is abandoned - the tool gets 0x0B
+        and the device thread skips the job, so a write reported as failed
+        never reaches the device after a later write. A job already running
+        is waited for, as the request itself has a timeout.
+        """
+        done = threading.Event()
+        box = [0x0B, "queued"]                  #Result, state
+        self.jobs.put((job, done, box))
+        if not done.wait(self.cfg['scanInterval'] + 5.0):
+            with self.lock:
+                if box[1] == "queued":
+                    box[1] = "abandoned"
+                    return 0x0B
+            done.wait()
+        return box[0]
+
+
+    def __device(self):
+        """Device thread - run queued jobs as they arrive and poll each scan"""
+        sched = loopScheduler(self.cfg['scanInterval'])
+        sched.start()
+        self.__plan()
+        self.__poll()
+        while not self.__stop.is_set():
+            wait = sched.remaining()
+            if wait <= 0:                       #Scan due - poll the device
+                if self.__replan or\
+                   monotonic() - self.__planned > self.cfg['expireAfter']:
+                    self.__plan()
+                self.__poll()
+                sched.wait()
+                continue
+            try:
+                job, done, box = self.jobs.get(timeout=wait)
+            except Queue.Empty:
+                continue
+            with self.lock:
+                if box[1] == "abandoned":       #Tool already told it failed
+                    continue
+                box[1] = "running"
+            box[0] = self.__execute(job)
+            done.set()
+
+
+    def __poll(self):
+        """Read every planned block from the device into the cache"""
+        for table, start, length in self.blocks:
+            self.__execute(('r', table, start, length))
+        self.stats['polls'] += 1
+
+
+    def __execute(self, job):
+        """Run one read or write on the device and update the cache
+
+        :return: List of values, None for a completed write or a MODBUS
+                 exception code on failure
+        """
+        op, reg, addr, values = job
+        try:
+            if op == 'r':
+                data = self.coms.dataHandler('r', reg, addr, length=values,\
+                                             encoding=0)
+                table, count = reg, values
+            else:
+                self.coms.dataHandler('w', reg, addr, data=values, encoding=0)
+                data, table, count = values, modbusStandIn.fcTable[reg],\
+                                     len(values)
+        except modbusDeviceError as err:        #Pass the device reply on
+            self.stats['errors'] += 1
+            return err.code
+        except modbusError:
+            self.stats['errors'] += 1
+            return 0x0B
+        with self.lock:
+            self.cache[table][addr:addr + count] = data
+            self.stamp[table][addr:addr + count] = monotonic()
+        if op == 'r':
+            return list(data)
+
+
+def main():
+    gateway = modbusGateway()                #Connect to the device
+    gateway.startStop(1)                     #Start polling and serving
+    gateway.run()                            #Run main method
+    gateway.startStop(0)                     #Stop and disconnect
+
+if __name__ == '__main__':main()
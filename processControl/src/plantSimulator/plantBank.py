@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Alexander David Leech
+@date:   Mon Aug 22 20:12:47 2016
+@rev:    1
+@lang:   Python 2.7
+@deps:   numpy
+@desc:   Vectorised bank of first/second order plus dead time process models
+"""
+
+import numpy as np
+
+
+class plantBank:
+    """Steps N process models at once
+
+    Usage:  Create an instance with the number of plants and the step size
+            Set each plant up with 'setPlant(i, cfg)' using the keys of the
+            'plantSimulator' settings file
+            Call 'reset()' to put every plant at steady state
+            Call 'step(OP)' each step with an array of OP to get the new PV
+
+    Each plant is gain * e^(-deadTime s) / ((tau s + 1)(tau2 s + 1)) where a
+    tau2 of 0 gives a first order (FOPDT) model. The pair of lags is
+    discretised exactly for a zero order hold on OP (the second lag sees the
+    first lag's decay within the step, not just its end value) so the
+    response does not depend on the step size, and the dead time is taken
+    from a ring buffer of past OP rounded to whole steps.
+    """
+
+    models = ["FOPDT", "SOPDT"]
+
+
+    def __init__(self, plants, dT):
+        """Allocate the model and state arrays
+
+        :param plants: Number of plants in the bank
+        :param dT:     Step size (s)
+        :type plants:  int
+        :type dT:      float
+        """
+        self.plants = plants
+        self.dT = float(dT)
+        self.gain = np.ones(plants)
+        self.tau = np.ones(plants)
+        self.tau2 = np.zeros(plants)
+        self.deadTime = np.zeros(plants)
+        self.bias = np.zeros(plants)
+        self.noise = np.zeros(plants)
+        self.initialOP = np.zeros(plants)
+        self.rng = np.random.RandomState()
+        self.reset()
+
+
+    @classmethod
+    def fromConfigs(cls, cfgs, dT):
+        """Create a bank from a list of 'plantSimulator' style plant dicts
+
+        :param cfgs: One settings dict per plant
+        :param dT:   Step size (s)
+        :type cfgs:  list
+        :type dT:    float
+        """
+        bank = cls(len(cfgs), dT)
+        for i in range(len(cfgs)):
+            bank.setPlant(i, cfgs[i])
+        bank.reset()
+        return bank
+
+
+    def setPlant(self, i, cfg):
+        """Load the model for one plant (call 'reset()' once all are set)
+
+        :param i:   Plant index
+        :param cfg: Settings using the keys of the 'plantSimulator' file
+        :type i:    int
+        :type cfg:  dict
+        """
+        if cfg['model'] not in self.models:
+            raise ValueError("Invalid plant model - Options are FOPDT & SOPDT")
+        if cfg['tau'] <= 0:
+            raise ValueError("Plant time constant must be above 0")
+        self.gain[i] = cfg['gain']
+        self.tau[i] = cfg['tau']
+        self.tau2[i] = cfg.get('tau2', 0.0) if cfg['model'] == "SOPDT" else 0.0
+        self.deadTime[i] = cfg.get('deadTime', 0.0)
+        self.bias[i] = cfg.get('bias', 0.0)
+        self.noise[i] = cfg.get('noise', 0.0)
+        self.initialOP[i] = cfg.get('initialOP', 0.0)
+
+
+    def reset(self):
+        """Rebuild the discrete model and settle every plant at 'initialOP'"""
+        self.a1 = np.exp(-self.dT / self.tau)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.a2 = np.exp(-self.dT / self.tau2)  #tau2 = 0 gives a2 = 0
+            #Share of the first lag's initial offset seen by the second lag
+            self.c12 = np.where(self.tau == self.tau2,\
+                                self.dT / self.tau * self.a1,\
+                                self.tau * (self.a1 - self.a2) /\
+                                (self.tau - self.tau2))
+        self.delay = np.round(self.deadTime / self.dT).astype(int)
+        self.depth = int(self.delay.max()) + 1 if self.plants else 1
+        self.hist = np.repeat(self.initialOP[:, None], self.depth, axis=1)
+        self.head = 0
+        self.x1 = self.gain * self.initialOP
+        self.x2 = self.x1.copy()
+        self.rows = np.arange(self.plants)
+        self.time = 0.0
+
+
+    def pv(self):
+        """Return the current PV of every plant (with measurement noise)"""
+        pv = self.bias + self.x2
+        if self.noise.any():
+            pv = pv + self.rng.normal(0.0, 1.0, self.plants) * self.noise
+        return pv
+
+
+    def step(self, OP):
+        """Advance every plant by one step
+
+        :param OP: Valve operating point applied to each plant this step
+        :type OP:  numpy array
+
+        :return: numpy array of the new PV for each plant
+        """
+        self.head = (self.head + 1) % self.depth
+        self.hist[:, self.head] = OP
+        u = self.hist[self.rows, (self.head - self.delay) % self.depth]
+        ss = self.gain * u                          #Steady state for this OP
+        self.x2 = ss + self.a2 * (self.x2 - ss) + self.c12 * (self.x1 - ss)
+        self.x1 = ss + self.a1 * (self.x1 - ss)
+        self.time += self.dT
+        return self.pv()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Alexander David Leech
+@date:   Mon Aug 22 21:38:05 2016
+@rev:    1
+@lang:   Python 2.7
+@deps:   numpy
+@desc:   Simulated process plants served as a local MODBUS TCP device, so the
+         tools can be tested and benchmarked without a live PLC.
+"""
+
+import threading
+from ..toolClasses.loopScheduler  import loopScheduler
+from ..toolClasses.modbusStandIn  import modbusStandIn
+from ..toolClasses.osTools        import osTools
+from ..toolClasses.registerCodec  import registerCodec
+from ..toolClasses.yamlImport     import yamlImport
+from .plantBank                   import plantBank
+
+
+class plantServer(modbusStandIn):
+    """MODBUS stand-in that hands OP writes to the simulator
+
+    Each write to the holding registers is stored as normal and then passed
+    to 'onWrite' before the reply is sent, so in lockstep mode the new PV is
+    ready by the time the writing tool gets its acknowledgement.
+    """
+
+    def __init__(self, onWrite, **kwargs):
+        """
+        :param onWrite: Called with no arguments after each holding write
+        :type onWrite:  function
+        """
+        modbusStandIn.__init__(self, **kwargs)
+        self.onWrite = onWrite
+
+
+    def writeTable(self, unit, reg, addr, values):
+        """Serve a write request then notify the simulator"""
+        err = modbusStandIn.writeTable(self, unit, reg, addr, values)
+        if err is None and self.fcTable[reg] == 3:
+            self.onWrite()
+        return err
+
+
+class plantSimulator:
+    """Runs a bank of simulated plants behind a local MODBUS TCP server
+
+    Usage:  Ensure all params are setup in the 'plantSimulator' file
+            Point 'modbusSettings' at the simulator 'ip' and 'tcpPort'
+            Create an instance of the class to build the plants
+            Call 'startStop(1)' to start serving
+            Call 'run()' to enter main loop
+            Call 'startStop(0)' to stop serving
+
+    Plant n reads its OP as a 32bit float from holding registers 2n, 2n+1
+    (where 'PIDControl' writes) and publishes its PV to input registers
+    2n, 2n+1 (where the 'tagMap' reads it). In "realtime" timing the plants
+    step every dT / speed seconds. In "lockstep" timing they step once for
+    every OP write, so a controller running with a short loop interval can
+    replay a whole day of plant time in seconds.
+    """
+
+    timings = ["realtime", "lockstep"]
+
+
+    def __init__(self, cfgFile="./cfg/controllerSettings/plantSimulator.yaml"):
+        """Create all required objects and import settings"""
+        self.cfg = yamlImport.importYAML(cfgFile)
+        if self.cfg['timing'] not in self.timings:
+            raise ValueError("Invalid timing - Options are realtime & lockstep")
+        self.plant = plantBank.fromConfigs(self.cfg['plants'], self.cfg['dT'])
+        self.codec = registerCodec()
+        self.unit = self.cfg['unit']
+        self.regs = 2 * self.plant.plants
+        self.server = plantServer(self.__onWrite, host=self.cfg['ip'],\
+                                  port=self.cfg['tcpPort'], units=[self.unit],\
+                                  size=max(self.regs, 2))
+        self.server.setValues(self.unit, 3, 0,\
+                              self.codec.encode(self.plant.initialOP, "float32"))
+        self.__publish(self.plant.pv())
+        self.lock = threading.Lock()
+        self.count = 0
+
+
+    def startStop(self, run):
+        """Use to start/stop the MODBUS server before/after the main loop
+
+        :param run: set to 1 or 0 to start or stop serving
+        :type run: int
+        """
+        if run == 1:
+            self.server.start()
+            print("Simulating " + str(self.plant.plants) + " plant(s) on " +\
+                  self.cfg['ip'] + ":" + str(self.server.port))
+        elif run == 0:
+            self.server.stop()
+        else:
+            raise ValueError
+
+
+    def run(self):
+        """Main run loop for the simulator
+        Ensure that the startStop method is called before and after this function
+        """
+        ext = osTools()
+        sched = loopScheduler(self.cfg['dT'] / float(self.cfg['speed']))
+        sched.start()
+        while(True):
+            if self.cfg['timing'] == "realtime":
+                self.stepPlants()
+            if ext.kbdExit():                               #Check for exit
+                break
+            sched.wait()
+
+
+    def stepPlants(self):
+        """Step every plant once using the OP currently held by the server
+
+        :return: numpy array of the new PV for each plant
+        """
+        with self.lock:
+            raw = self.server.getValues(self.unit, 3, 0, self.regs)
+            pv = self.plant.step(self.codec.decode(raw, "float32"))
+            self.__publish(pv)
+            self.count += 1
+        return pv
+
+
+    def __publish(self, pv):
+        """Write the PV of every plant to the input registers"""
+        self.server.setValues(self.unit, 4, 0, self.codec.encode(pv, "float32"))
+
+
+    def __onWrite(self):
+        """Step the plants on each OP write when running in lockstep"""
+        if self.cfg['timing'] == "lockstep":
+            self.stepPlants()
+
+
+def main():
+    sim = plantSimulator()                   #Build the plants from settings
+    sim.startStop(1)                         #Start the MODBUS server
+    sim.run()                                #Run main method
+    sim.startStop(0)                         #Stop the MODBUS server
+
+if __name__ == '__main__':main()
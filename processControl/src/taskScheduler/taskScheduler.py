@@ -0,0 +1,359 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Alexander David Leech
+@date:   Thu Sep 01 20:37:41 2016
+@rev:    1
+@lang:   Python 2.7
+@deps:   pymodbus, numpy
+@desc:   Cooperative multi-rate scheduler running many controllers and
+         loggers in one process over one shared MODBUS connection.
+"""
+
+from ..PIDControl.blockDiagram    import blockDiagram
+from ..PIDControl.PIDController   import PIDController
+from ..toolClasses.loopScheduler  import loopScheduler, monotonic
+from ..toolClasses.modbusClient   import modbusClient
+from ..toolClasses.modbusErrors   import modbusError, modbusTimeoutError
+from ..toolClasses.osTools        import osTools
+from ..toolClasses.procDataLog    import procDataLog
+from ..toolClasses.tagMap         import tagMap
+from ..toolClasses.yamlImport     import yamlImport
+
+
+class schedTask:
+    """Common state of a scheduled task
+
+    Subclasses list the tags they read in 'tags' and implement
+    'step(values)', returning the (tag, value) pairs to write.
+    """
+
+    def __init__(self, cfg, interval):
+        """
+        :param cfg:      Task entry from the 'taskScheduler' file
+        :param interval: Run interval (s)
+        :type cfg:       dict
+        :type interval:  float
+        """
+        self.name = cfg['name']
+        self.interval = float(interval)
+        self.priority = cfg['priority']
+        self.log = None
+        self.tags = []
+        self.due = 0.0                          #Next run (s after start)
+        self.runs = 0
+        self.deferred = 0                       #Ticks waited for a slot
+        self.skipped = 0                        #Runs missed entirely
+        self.faults = 0                         #Runs lost to link/device errors
+        self.misses = 0                         #Runs lost to timeouts
+        self.maxLateness = 0.0
+
+
+    def done(self, now):
+        """Move the task on to its next run, dropping missed runs
+
+        :param now: Time of this run (s after start)
+        :type now:  float
+        """
+        self.maxLateness = max(self.maxLateness, now - self.due)
+        self.due += self.interval
+        if self.due <= now:
+            missed = int((now - self.due) / self.interval) + 1
+            self.due += missed * self.interval
+            self.skipped += missed
+
+
+    def checkWrite(self, tag):
+        """Reject a write tag that is not a float32 holding register"""
+        if tag['table'] != 3 or tag.get('type', "float32") != "float32":
+            raise ValueError("Tag " + tag['name'] + " of task " + self.name +\
+                             " must be a float32 holding register")
+
+
+    def fault(self, err):
+        """Count a run lost to a MODBUS error - a timeout is a deadline miss,
+        anything else a fault
+        """
+        if isinstance(err, modbusTimeoutError):
+            self.misses += 1
+        else:
+            self.faults += 1
+
+
+class controlTask(schedTask):
+    """A PIDController reading its PV and OP and writing its new OP
+
+    Runs at the 'interval' of its controller settings file so the controller
+    maths and the schedule always agree.
+    """
+
+    def __init__(self, cfg):
+        """Create the controller and its tags"""
+        self.PID = PIDController(cfg['controllerFile'])
+        schedTask.__init__(self, cfg, self.PID.cfg['interval'])
+        self.pv = dict(cfg['pv'], name=self.name + ".PV")
+        self.op = dict(cfg['op'], name=self.name + ".OP")
+        self.checkWrite(self.op)
+        self.tags = [self.pv, self.op]
+        if cfg['log']:
+            self.log = procDataLog(["PV", "SP", "OP"], self.name)
+
+
+    def step(self, values):
+        """Run the controller on the latest PV and OP
+
+        :param values: PV and OP read this tick
+        :type values:  list
+
+        :return: List of (tag, value) to write
+        """
+        OP = self.PID.runCtrl(values[0], values[1])
+        if self.log is not None:
+            self.log.write([values[0], self.PID.cfg['setPoint'], OP])
+        return [(self.op, OP)]
+
+
+class diagramTask(schedTask):
+    """A blockDiagram reading its input tags and writing its output tags
+
+    Runs at the 'interval' of its pid blocks (or the task 'interval' when it
+    has none).
+    """
+
+    def __init__(self, cfg):
+        """Compile the diagram and match its signals to tags"""
+        self.diagram = blockDiagram(cfg['diagramFile'])
+        schedTask.__init__(self, cfg, self.diagram.interval or cfg['interval'])
+        tags = dict((tag['name'], tag) for tag in cfg['inputs'])
+        outTags = dict((tag['name'], tag) for tag in cfg['outputs'])
+        for names, found, kind in ((self.diagram.inputs, tags, "input"),\
+                                   (self.diagram.outputs, outTags, "output")):
+            for name in names:
+                if name not in found:
+                    raise ValueError("No " + kind + " tag for signal " +\
+                                     name + " of task " + self.name)
+        self.tags = [dict(tags[name]) for name in self.diagram.inputs]
+        self.outTags = [dict(outTags[name]) for name in self.diagram.outputs]
+        for tag in self.outTags:
+            self.checkWrite(tag)
+        if cfg['log']:
+            self.log = procDataLog(self.diagram.inputs + self.diagram.outputs,\
+                                   self.name)
+
+
+    def step(self, values):
+        """Evaluate the diagram on the inputs read this tick
+
+        :return: List of (tag, value) to write
+        """
+        outputs = self.diagram.run(values)
+        if self.log is not None:
+            self.log.write(values + outputs)
+        return zip(self.outTags, outputs)
+
+
+class logTask(schedTask):
+    """Logs a list of tags"""
+
+    def __init__(self, cfg):
+        """Create the log and its tags"""
+        schedTask.__init__(self, cfg, cfg['interval'])
+        self.tags = [dict(tag) for tag in cfg['tags']]
+        self.log = procDataLog([tag['name'] for tag in self.tags], self.name)
+
+
+    def step(self, values):
+        """Log the values read this tick
+
+        :return: Empty list (nothing to write)
+        """
+        self.log.write(values)
+        return []
+
+
+class taskScheduler:
+    """Runs many controller and logger tasks at their own rates in one loop
+
+    Usage:  Ensure all params are setup in the 'taskScheduler' file
+            Create an instance of the class to build the tasks
+            Call 'startStop(1)' to begin logging and connection to server
+            Call 'run()' to enter main loop
+            Call 'startStop(0)' to close logs and connection
+
+    The loop wakes every 'tick' and runs the tasks that are due, highest
+    priority (lowest number) first. The due tasks of one priority share a
+    single scan: their tags are merged into one read plan (compiled once
+    per set of tasks and reused), the tasks run, and their OP writes to
+    neighbouring registers are sent as one request. The MODBUS requests of
+    a tick share a budget of 'ioBudget' of the tick. Once it is spent the
+    remaining (lower priority) tasks wait for the next tick, so a fast
+    control loop is never held up by a slow logger. A task whose scan fails
+    skips that run, so controllers hold their last OP. There is no live plot.
+    """
+
+    taskTypes = {"controller": controlTask, "diagram": diagramTask,\
+                 "logger": logTask}
+
+
+    def __init__(self, cfgFile="./cfg/controllerSettings/taskScheduler.yaml"):
+        """Create all required objects and import settings"""
+        self.cfg = yamlImport.importYAML(cfgFile)
+        self.coms = modbusClient()
+        self.ext = osTools()
+        self.tasks = []
+        for cfg in self.cfg['tasks']:
+            if cfg['type'] not in self.taskTypes:
+                raise ValueError("Invalid task type - Options are " +\
+                                 ", ".join(sorted(self.taskTypes)))
+            self.tasks.append(self.taskTypes[cfg['type']](cfg))
+        tick = self.cfg['tick']
+        if min(task.interval for task in self.tasks) < tick:
+            raise ValueError("Task interval shorter than the tick")
+        self.sched = loopScheduler(tick / float(self.cfg['speed']),\
+                                   self.cfg['overrunPolicy'])
+        self.ioBudget = self.cfg['ioBudget'] * self.sched.interval
+        self.plans = {}                         #Task indices: (plan, slices)
+        self.count = 0
+
+
+    def startStop(self, run):
+        """Use to open/close connections before/after running main loop
+
+        :param run: set to 1 or 0 to start or stop the outgoing connections
+        :type run: int
+        """
+        if run == 1:
+            self.coms.openConnection()
+            for task in self.tasks:
+                if task.log is not None:
+                    task.log.startLog()
+        elif run == 0:
+            for task in self.tasks:
+                if task.log is not None:
+                    task.log.stopLog()
+            self.coms.closeConnection()
+        else:
+            raise ValueError
+
+
+    def run(self):
+        """Main run loop for the scheduler
+        Ensure that the startStop method is called before and after this function
+        """
+        speed = float(self.cfg['speed'])
+        self.sched.start()
+        for task in self.tasks:
+            task.due = 0.0
+        while(True):
+            self.tick(self.sched.elapsed() * speed)
+            if self.ext.kbdExit():                          #Check for exit
+                break
+            self.count += 1
+            self.sched.wait()                               #Wait for next tick
+
+
+    def tick(self, now):
+        """Run every task due at 'now', highest priority first
+
+        :param now: Schedule time (s after start)
+        :type now:  float
+        """
+        self.coms.setDeadline(self.sched.cycleStart + self.ioBudget)
+        due = [i for i in range(len(self.tasks))\
+               if self.tasks[i].due <= now + 1e-6]
+        due.sort(key=lambda i: (self.tasks[i].priority, self.tasks[i].due))
+        while due:
+            level = self.tasks[due[0]].priority
+            group = [i for i in due if self.tasks[i].priority == level]
+            due = due[len(group):]
+            if monotonic() + self.coms.rtt >= self.coms.deadline:
+                for i in group + due:                       #Out of budget
+                    self.tasks[i].deferred += 1
+                return
+            self.__runGroup(tuple(group), now)
+
+
+    def __plan(self, group):
+        """Read plan and value slices for a set of tasks (built once)"""
+        if group not in self.plans:
+            tags = []
+            slices = []
+            for i in group:
+                task = self.tasks[i]
+                slices.append((len(tags), len(tags) + len(task.tags)))
+                tags.extend(task.tags)
+            plan = tagMap(tagCfg={'tags': tags,\
+                                  'plan_cfg': {'max_gap': self.cfg['maxGap']}})
+            self.plans[group] = (plan, slices)
+        return self.plans[group]
+
+
+    def __runGroup(self, group, now):
+        """Scan, run and write back one set of due tasks"""
+        plan, slices = self.__plan(group)
+        tasks = [self.tasks[i] for i in group]
+        try:
+            values = plan.read(self.coms)
+        except modbusError as err:
+            for task in tasks:
+                task.fault(err)
+                task.done(now)
+            return
+        writes = []
+        for task, (start, end) in zip(tasks, slices):
+            writes.extend(task.step(values[start:end]))
+            task.runs += 1
+            task.done(now)
+        if writes:
+            try:
+                self.__write(writes)
+            except modbusError as err:
+                for task in tasks:
+                    task.fault(err)
+
+
+    def __write(self, writes):
+        """Write OPs, sending neighbouring registers as one request
+
+        :param writes: List of (tag, value) - float32 holding registers
+        :type writes:  list
+        """
+        writes.sort(key=lambda w: w[0]['address'])
+        run = []
+        for tag, value in writes:
+            value = (value - tag.get('offset', 0.0)) / tag.get('scale', 1.0)
+            if run and tag['address'] != run[0] + 2 * len(run[1]):
+                self.coms.dataHandler('w', 16, run[0], data=run[1])
+                run = []
+            if not run:
+                run = [tag['address'], []]
+            run[1].append(value)
+        self.coms.dataHandler('w', 16, run[0], data=run[1])
+
+
+    def stats(self):
+        """Return the counters of every task
+
+        :return: dict of task name -> dict of runs, deferred, skipped, faults,
+                 misses and max lateness (s)
+        """
+        return dict((task.name, {'runs': task.runs,
+                                 'deferred': task.deferred,
+                                 'skipped': task.skipped,
+                                 'faults': task.faults,
+                                 'misses': task.misses,
+                                 'maxLateness': task.maxLateness})\
+                    for task in self.tasks)
+
+
+def main():
+    sched = taskScheduler()                  #Build the tasks from settings
+    sched.startStop(1)                       #Start logs and open connection
+    sched.run()                              #Run main method
+    sched.startStop(0)                       #Stop logs and close connection
+    for name, s in sorted(sched.stats().items()):
+        print("%-16s runs %6d deferred %5d skipped %5d faults %5d misses %5d"\
+              % (name, s['runs'], s['deferred'], s['skipped'], s['faults'],\
+                 s['misses']))
+
+if __name__ == '__main__':main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Alexander David Leech
+@date:   Sat Aug 13 16:38:12 2016
+@rev:    1
+@lang:   Python 2.7
+@deps:   numpy
+@desc:   Compact fixed width binary log format with a memory mapped reader
+"""
+
+import os
+import csv
+import time
+import struct
+import numpy as np
+
+
+class binDataLog:
+    """Fixed width binary log records with a small header
+
+    Usage:  Writing - create an instance with an open file (mode 'wb'), the
+                      column names and value type then call 'writeRow'
+            Reading - call 'binDataLog.readLog(path)' to get the records as a
+                      numpy array mapped straight onto the file
+            Convert - use 'csvToBin' / 'binToCsv' to move between this format
+                      and the csv layout written by procDataLog
+
+    File layout (little endian):
+        magic "PCLOG\\0", version (uint16), column count (uint16),
+        value type ("f" float32 / "d" float64), pad byte,
+        header length (uint32), column names ("\\0" separated, padded to 8)
+        records: epoch time in ns (int64) + one value per column
+    """
+
+    magic = b"PCLOG\x00"
+    version = 1
+    valueTypes = {"float32": "f", "float64": "d"}
+
+
+    def __init__(self, logFile, names, valueType="float32"):
+        """Write the header to a newly opened file
+
+        :param logFile:   File object opened for binary writing
+        :param names:     Column names (excluding time)
+        :param valueType: float32 or float64
+        :type logFile:    file
+        :type names:      list
+        :type valueType:  string
+        """
+        if valueType not in self.valueTypes:
+            raise ValueError("Invalid value type - Options are float32 &"\
+                             " float64")
+        self.logFile = logFile
+        self.names = [str(n) for n in names]
+        self.cols = len(self.names)
+        code = self.valueTypes[valueType]
+        self.__record = struct.Struct('<q' + code * self.cols)
+        self.__nan = [float('nan')] * self.cols
+        nameBlock = "\0".join(self.names).encode('utf-8')
+        headerLen = 16 + len(nameBlock)
+        headerLen += (-headerLen) % 8
+        header = self.magic + struct.pack('<HHcxI', self.version, self.cols,\
+                                          code.encode('ascii'), headerLen)
+        self.logFile.write(header + nameBlock.ljust(headerLen - 16, b"\0"))
+
+
+    def writeRow(self, stamp, values):
+        """Append one record
+
+        Rows shorter than the column count are padded with NaN, longer rows
+        are truncated. Values that are not numbers are stored as NaN.
+
+        :param stamp:  Epoch time (s)
+        :param values: Values to log
+        :type stamp:   float
+        :type values:  list
+        """
+        row = (list(values) + self.__nan)[:self.cols]
+        for i in range(self.cols):
+            try:
+                row[i] = float(row[i])
+            except (TypeError, ValueError):
+                row[i] = float('nan')
+        self.logFile.write(self.__record.pack(int(round(stamp * 1e9)), *row))
+
+
+    @staticmethod
+    def readHeader(path):
+        """Read the header of a binary log
+
+        :param path: Path to the log file
+        :type path:  string
+
+        :return: (column names, numpy record dtype, header length)
+        """
+        with open(path, 'rb') as f:
+            fixed = f.read(16)
+            if len(fixed) < 16 or fixed[:6] != binDataLog.magic:
+                raise IOError("Not a binary process log: " + path)
+            version, cols, code, headerLen = struct.unpack('<HHcxI', fixed[6:])
+            if version != binDataLog.version:
+                raise IOError("Unsupported binary log version: " + path)
+            names = f.read(headerLen - 16).rstrip(b"\0").decode('utf-8')
+        names = names.split("\0") if cols > 0 else []
+        fieldType = '<f4' if code == b'f' else '<f8'
+        dtype = np.dtype([('time', '<i8')] + [(n, fieldType) for n in names])
+        return names, dtype, headerLen
+
+
+    @staticmethod
+    def readLog(path):
+        """Map a binary log into memory without copying it
+
+        Columns are accessed by name e.g. log['PV'], and log['time'] holds the
+        epoch time in ns. A trailing partial record (log still being written)
+        is ignored.
+
+        :param path: Path to the log file
+        :type path:  string
+
+        :return: numpy memmap structured array (read only)
+        """
+        names, dtype, headerLen = binDataLog.readHeader(path)
+        rows = (os.path.getsize(path) - headerLen) // dtype.itemsize
+        if rows == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', offset=headerLen,\
+                         shape=(rows,))
+
+
+    @staticmethod
+    def csvToBin(csvPath, binPath, valueType="float32", date=None):
+        """Convert a procDataLog csv file to the binary format
+
+        The csv only holds the time of day so the date is taken from the file
+        name (HH.MM.SS DD.MM.YYYY.csv) unless given. A time earlier than the
+        previous row is taken to be the next day.
+
+        :param csvPath:   Path to the csv log
+        :param binPath:   Path of the binary log to create
+        :param valueType: float32 or float64
+        :param date:      Date as DD.MM.YYYY (default from the file name)
+        :type csvPath:    string
+        :type binPath:    string
+        :type valueType:  string
+        :type date:       string
+
+        :return: Number of records written
+        """
+        if date is None:
+            date = os.path.splitext(os.path.basename(csvPath))[0].split(" ")[-1]
+        dayStart = time.mktime(time.strptime(date, "%d.%m.%Y"))
+        count = 0
+        with open(csvPath, 'rb') as src:
+            reader = csv.reader(src)
+            headers = next(reader)
+            with open(binPath, 'wb') as dst:
+                log = binDataLog(dst, headers[1:], valueType)
+                dayOffset = 0
+                prevSecs = -1
+                for row in reader:
+                    if not row:
+                        continue
+                    h, m, s = row[0].split(":")
+                    secs = int(h) * 3600 + int(m) * 60 + int(s)
+                    if secs < prevSecs:
+                        dayOffset += 86400
+                    prevSecs = secs
+                    log.writeRow(dayStart + dayOffset + secs, row[1:])
+                    count += 1
+        return count
+
+
+    @staticmethod
+    def binToCsv(binPath, csvPath):
+        """Convert a binary log to the procDataLog csv layout
+
+        :param binPath: Path to the binary log
+        :param csvPath: Path of the csv log to create
+        :type binPath:  string
+        :type csvPath:  string
+
+        :return: Number of rows written
+        """
+        log = binDataLog.readLog(binPath)
+        names = list(log.dtype.names[1:])
+        with open(csvPath, 'wb') as dst:
+            writer = csv.writer(dst, delimiter=',', quoting=csv.QUOTE_ALL)
+            writer.writerow(["Time"] + names)
+            stamps = (log['time'] // 1000000000).tolist()
+            columns = [log[n] for n in names]
+            for i in range(len(log)):
+                row = [time.strftime('%H:%M:%S', time.localtime(stamps[i]))]
+                row.extend([str(col[i]) for col in columns])
+                writer.writerow(row)
+        return len(log)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Alexander David Leech
+@date:   Sat Aug 06 10:12:47 2016
+@rev:    1
+@lang:   Python 2.7
+@deps:   yaml
+@desc:   Cached, change aware access to yaml config files
+"""
+
+import os
+import time
+import yaml
+from yamlImport import yamlImport
+
+
+class configWatch:
+    """Holds a parsed snapshot of a yaml file and only re-parses on change
+
+    Usage:  Create an instance with the path to the config file
+            Call 'read()' once per control tick to get the current snapshot
+
+    The file is checked with a single stat call (mtime, inode & size). When it
+    has changed the file is parsed into a new dict which then replaces the old
+    snapshot in one step, so a caller that reads the snapshot once at the start
+    of a tick never sees a half applied change. A file that fails to parse
+    (e.g. caught mid save) is ignored and the last good snapshot is kept.
+    """
+
+    def __init__(self, pathToFile):
+        """Load the initial snapshot
+
+        :param pathToFile: Path of the yaml file to watch
+        :type pathToFile: string
+        """
+        self.path = pathToFile
+        self.reloadCount = 0                    #Reloads since startup
+        self.reloadErrors = 0                   #Failed reload attempts
+        self.reloadTime = 0.0                   #Cost of last reload (s)
+        self.__signature = self.__fileSignature()
+        startTime = time.time()
+        self.cfg = yamlImport.importYAML(self.path)
+        self.reloadTime = time.time() - startTime
+
+
+    def read(self):
+        """Return the current config, reloading it first if the file changed
+
+        :return: dict containing the parsed config file
+        """
+        signature = self.__fileSignature()
+        if signature is not None and signature != self.__signature:
+            self.__reload(signature)
+        return self.cfg
+
+
+    def __reload(self, signature):
+        """Parse the changed file and swap in the new snapshot
+
+        :param signature: file signature the new snapshot belongs to
+        :type signature: tuple
+        """
+        startTime = time.time()
+        try:
+            with open(self.path, "r") as f:
+                cfg = yaml.load(f)
+        except (IOError, yaml.YAMLError):
+            cfg = None
+        self.__signature = signature            #Don't retry until next change
+        if type(cfg) != dict:
+            self.reloadErrors += 1
+            print("Failed to reload " + self.path + " - keeping last settings")
+            return
+        self.cfg = cfg
+        self.reloadCount += 1
+        self.reloadTime = time.time() - startTime
+        print("Reloaded " + self.path + " in " +\
+              str(round(self.reloadTime * 1000, 3)) + " ms")
+
+
+    def __fileSignature(self):
+        """Return the (mtime, inode, size) of the file or None if missing"""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime, st.st_ino, st.st_size)
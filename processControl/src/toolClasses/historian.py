@@ -0,0 +1,473 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Alexander David Leech
+@date:   Sat Aug 27 14:18:36 2016
+@rev:    1
+@lang:   Python 2.7
+@deps:   numpy
+@desc:   Time range queries over the daily process logs
+"""
+
+import os
+import csv
+import time
+import numpy as np
+from binDataLog import binDataLog
+
+
+class historian:
+    """Reads time ranges of logged data back out of the log directory
+
+    Usage:  Create an instance with the log directory
+            Call 'query(start, end, columns, stream)' for the raw rows in a
+            range
+            Call 'aggregate(start, end, bucket, columns, how, stream)' for
+            the rows reduced to one value per time bucket
+            Use 'iterQuery' to stream a long range one block at a time
+            Call 'readFile(path)' for the whole of a single log
+
+    Several tools can log to one directory, so the logs are grouped into
+    streams by the name in front of the date/time of the file name
+    ("<stream> HH.MM.SS DD.MM.YYYY", e.g. the task name of a taskScheduler
+    log, or "" for a log named by date/time only). A query reads one stream;
+    'streams()' lists them. The stream can be left out when the directory
+    only holds one. Files whose names do not end in a date/time are skipped
+    with a message.
+
+    Times are epoch seconds or strings in the log file name layout
+    ("HH:MM:SS DD.MM.YYYY" or "HH.MM.SS DD.MM.YYYY"). Results are numpy
+    structured arrays in the binDataLog layout - 'time' holds the epoch time
+    in ns and each column is accessed by name.
+
+    The csv logs only hold the time of day, so the first query of a csv log
+    builds a sidecar index ("<log>.idx") holding the full timestamp and byte
+    offset of every row. The date comes from the file name (or the day the
+    file was last modified if the name has no date) and a time earlier than
+    the previous row is taken to be the next day. A query then seeks
+    straight to the rows in range and parses only those. When the log has
+    grown since it was indexed only the new rows are indexed. Binary logs
+    are already fixed width with a full timestamp so are searched in place
+    through 'binDataLog.readLog'.
+    """
+
+    exts = (".csv", ".bin")
+    aggregates = ("mean", "min", "max", "count")
+
+
+    def __init__(self, logDir="./log", blockRows=100000):
+        """Setup
+
+        :param logDir:    Directory holding the procDataLog files
+        :param blockRows: Most rows returned in one block by 'iterQuery'
+        :type logDir:     string
+        :type blockRows:  int
+        """
+        self.logDir = logDir
+        self.blockRows = blockRows
+        self.__indexes = {}
+        self.__skipped = set()                  #Undated files reported
+
+
+    @staticmethod
+    def toEpoch(stamp):
+        """Convert a query time to epoch seconds
+
+        :param stamp: Epoch seconds or "HH:MM:SS DD.MM.YYYY" (":" or ".")
+        :type stamp:  float or string
+
+        :return: Epoch seconds
+        """
+        if isinstance(stamp, basestring):
+            return time.mktime(time.strptime(stamp.replace(":", "."),\
+                                             "%H.%M.%S %d.%m.%Y"))
+        return float(stamp)
+
+
+    def streams(self):
+        """List the log streams in the directory
+
+        :return: sorted list of stream names
+        """
+        return sorted(self.__scan().keys())
+
+
+    def files(self, stream=None):
+        """List the logs of one stream in time order
+
+        :param stream: Stream name (None when the directory holds one stream)
+        :type stream:  string
+
+        :return: list of (start epoch from the file name, path)
+        """
+        found = self.__scan()
+        if stream is None:
+            if len(found) > 1:
+                raise ValueError("Several log streams in " + self.logDir +\
+                                 " - name one of: " +\
+                                 ", ".join(repr(n) for n in sorted(found)))
+            return found.values()[0] if found else []
+        if stream not in found:
+            raise ValueError("No log stream " + repr(stream) + " in " +\
+                             self.logDir)
+        return found[stream]
+
+
+    def __scan(self):
+        """Group the logs in the directory by stream
+
+        :return: dict of stream name to list of (start epoch, path) in time
+                 order
+        """
+        found = {}
+        for name in os.listdir(self.logDir):
+            base, ext = os.path.splitext(name)
+            if ext not in self.exts:
+                continue
+            parts = base.rsplit(" ", 2)
+            try:
+                start = time.mktime(time.strptime(" ".join(parts[-2:]),\
+                                                  "%H.%M.%S %d.%m.%Y"))
+            except ValueError:
+                if name not in self.__skipped:
+                    self.__skipped.add(name)
+                    print("Skipping " + name + " - no date/time in the name")
+                continue
+            stream = parts[0] if len(parts) == 3 else ""
+            found.setdefault(stream, []).append((start,\
+                                     os.path.join(self.logDir, name)))
+        for logs in found.values():
+            logs.sort()
+        return found
+
+
+    def query(self, start, end, columns=None, stream=None):
+        """Return the logged rows with start <= time < end
+
+        :param start:   Start of the range
+        :param end:     End of the range
+        :param columns: Column names to return (None for all in the first
+                        log of the range)
+        :param stream:  Log stream to read (see 'files')
+        :type start:    float or string
+        :type end:      float or string
+        :type columns:  list
+        :type stream:   string
+
+        :return: numpy structured array with 'time' (ns) and the columns
+        """
+        blocks = list(self.iterQuery(start, end, columns, stream))
+        if not blocks:
+            return np.zeros(0, dtype=self.__dtype(columns or []))
+        return np.concatenate(blocks)
+
+
+    def readFile(self, path, columns=None):
+        """Return every row of one log (csv or binary)
+
+        :param path:    Path to the log
+        :param columns: Column names to return (None for all)
+        :type path:     string
+        :type columns:  list
+
+        :return: numpy structured array with 'time' (ns) and the columns
+        """
+        if columns is None:
+            columns = self.__names(path)
+        if path.endswith(".bin"):
+            source = binDataLog.readLog(path)
+            return self.__fromBin(source, 0, len(source), columns)
+        index = self.index(path)
+        if len(index['time']) == 0:
+            return np.zeros(0, dtype=self.__dtype(columns))
+        return self.__fromCsv(path, index, 0, len(index['time']), columns)
+
+
+    def iterQuery(self, start, end, columns=None, stream=None):
+        """Stream the rows in a range across the log files of one stream
+
+        Columns missing from a log are returned as NaN.
+
+        :return: Generator of numpy structured arrays of at most 'blockRows'
+        """
+        startNs = int(round(self.toEpoch(start) * 1e9))
+        endNs = int(round(self.toEpoch(end) * 1e9))
+        logs = self.files(stream)
+        for i in range(len(logs)):
+            if i + 1 < len(logs) and logs[i + 1][0] * 1e9 <= startNs:
+                continue                        #Next log starts before range
+            if logs[i][0] * 1e9 >= endNs:
+                break
+            path = logs[i][1]
+            if path.endswith(".bin"):
+                source = binDataLog.readLog(path)
+                stamps = source['time']
+            else:
+                index = self.index(path)
+                stamps = index['time']
+            first = np.searchsorted(stamps, startNs, 'left')
+            last = np.searchsorted(stamps, endNs, 'left')
+            if columns is None:
+                columns = self.__names(path)
+            for row in range(first, last, self.blockRows):
+                stop = min(row + self.blockRows, last)
+                if path.endswith(".bin"):
+                    yield self.__fromBin(source, row, stop, columns)
+                else:
+                    yield self.__fromCsv(path, index, row, stop, columns)
+
+
+    def aggregate(self, start, end, bucket, columns=None, how="mean",\
+                  stream=None):
+        """Reduce the rows in a range to one value per time bucket
+
+        Buckets are 'bucket' seconds long starting at 'start'. Empty buckets
+        are NaN (0 for count). NaN values are ignored.
+
+        :param bucket: Bucket length (s)
+        :param how:    mean, min, max or count
+        :type bucket:  float
+        :type how:     string
+
+        :return: numpy structured array with 'time' (bucket start, ns) and
+                 one aggregated value per column
+        """
+        if how not in self.aggregates:
+            raise ValueError("Invalid aggregate - Options are " +\
+                             ", ".join(self.aggregates))
+        startS = self.toEpoch(start)
+        count = int(np.ceil((self.toEpoch(end) - startS) / float(bucket)))
+        bucketNs = int(round(bucket * 1e9))
+        startNs = int(round(startS * 1e9))
+        acc = None
+        for block in self.iterQuery(start, end, columns, stream):
+            if acc is None:
+                columns = list(block.dtype.names[1:])
+                acc = dict((n, self.__newAccumulator(count, how))\
+                           for n in columns)
+            slot = (block['time'] - startNs) // bucketNs
+            for name in columns:
+                self.__accumulate(acc[name], slot, block[name], how)
+        out = np.zeros(max(count, 0), dtype=self.__dtype(columns or []))
+        out['time'] = startNs + np.arange(len(out)) * bucketNs
+        if acc is not None:
+            for name in columns:
+                out[name] = self.__finish(acc[name], how)
+        elif how != "count":
+            for name in out.dtype.names[1:]:
+                out[name] = np.nan
+        return out
+
+
+    def index(self, path):
+        """Load, update or build the sidecar index of a csv log
+
+        :param path: Path to the csv log
+        :type path:  string
+
+        :return: dict of 'time' (ns) and 'offset' (bytes) per row plus the
+                 indexing state
+        """
+        size = os.path.getsize(path)
+        index = self.__indexes.get(path)
+        if index is None:
+            index = self.__loadIndex(path)
+        if index is None or index['indexed'] > size:
+            index = self.__emptyIndex(path)     #New or replaced log
+        if index['indexed'] < size:
+            self.__extendIndex(path, index)
+            self.__saveIndex(path, index)
+        self.__indexes[path] = index
+        return index
+
+
+    def __emptyIndex(self, path):
+        """Start a new index, reading the date and header row of the log"""
+        with open(path, 'rb') as f:
+            header = f.readline()
+        names = []
+        if header.endswith("\n"):
+            names = next(csv.reader([header.rstrip("\r\n")]))[1:]
+        return {'time': np.zeros(0, np.int64),
+                'offset': np.zeros(0, np.int64),
+                'indexed': len(header) if names else 0,
+                'dayStart': self.__logDate(path),
+                'prevSecs': -1,
+                'dayOffset': 0,
+                'names': names}
+
+
+    def __logDate(self, path):
+        """Epoch time of midnight on the day a csv log started
+
+        Taken from the "DD.MM.YYYY" at the end of the procDataLog file name.
+        A log renamed without it (e.g. a copy for replay) is dated by the day
+        it was last modified.
+        """
+        base = os.path.splitext(os.path.basename(path))[0]
+        try:
+            return time.mktime(time.strptime(base.split(" ")[-1], "%d.%m.%Y"))
+        except ValueError:
+            day = time.localtime(os.path.getmtime(path))[:3]
+            return time.mktime(day + (0, 0, 0, 0, 0, -1))
+
+
+    def __extendIndex(self, path, index):
+        """Index the complete rows added since the log was last indexed
+
+        The time of day is read straight from the bytes of each row, with or
+        without the quotes written by procDataLog.
+        """
+        if index['indexed'] == 0:                #Header not yet complete
+            fresh = self.__emptyIndex(path)
+            if fresh['indexed'] == 0:
+                return
+            index.update(fresh)
+        with open(path, 'rb') as f:
+            f.seek(index['indexed'])
+            data = f.read()
+        end = data.rfind("\n") + 1               #Complete rows only
+        if end == 0:
+            return
+        raw = np.frombuffer(data[:end], dtype=np.uint8)
+        stops = np.flatnonzero(raw == ord("\n"))
+        starts = np.concatenate(([0], stops[:-1] + 1))
+        starts = starts[stops - starts > 8]      #Skip blank lines
+        pos = starts + (raw[starts] == ord('"'))
+        digit = lambda k: raw[pos + k].astype(np.int64) - ord("0")
+        secs = (digit(0) * 10 + digit(1)) * 3600 +\
+               (digit(3) * 10 + digit(4)) * 60 + (digit(6) * 10 + digit(7))
+        prev = np.concatenate(([index['prevSecs']], secs[:-1]))
+        days = index['dayOffset'] + np.cumsum(secs < prev) * 86400
+        stamps = ((index['dayStart'] + days + secs) * 1e9).astype(np.int64)
+        index['time'] = np.concatenate((index['time'], stamps))
+        index['offset'] = np.concatenate((index['offset'],\
+                                          starts + index['indexed']))
+        if len(secs):
+            index['prevSecs'] = int(secs[-1])
+            index['dayOffset'] = int(days[-1])
+        index['indexed'] += end
+
+
+    def __loadIndex(self, path):
+        """Read a sidecar index from disk (None if missing or unreadable)"""
+        try:
+            with open(path + ".idx", 'rb') as f:
+                saved = np.load(f)
+                meta = saved['meta']
+                return {'time': saved['time'], 'offset': saved['offset'],
+                        'indexed': int(meta[0]), 'dayStart': float(meta[1]),
+                        'prevSecs': int(meta[2]), 'dayOffset': int(meta[3]),
+                        'names': saved['names'].tolist()}
+        except (IOError, KeyError, ValueError):
+            return None
+
+
+    def __saveIndex(self, path, index):
+        """Write the sidecar index, replacing the old one in one step"""
+        meta = np.array([index['indexed'], index['dayStart'],\
+                         index['prevSecs'], index['dayOffset']], np.float64)
+        tmp = path + ".idx.tmp"
+        with open(tmp, 'wb') as f:
+            np.savez(f, time=index['time'], offset=index['offset'],\
+                     meta=meta, names=np.array(index['names'], dtype=str))
+        if os.name == 'nt' and os.path.exists(path + ".idx"):
+            os.remove(path + ".idx")
+        os.rename(tmp, path + ".idx")
+
+
+    def __names(self, path):
+        """Column names of a log (excluding time)"""
+        if path.endswith(".bin"):
+            return binDataLog.readHeader(path)[0]
+        return self.index(path)['names']
+
+
+    def __dtype(self, columns):
+        """Result dtype for a list of columns"""
+        return np.dtype([('time', '<i8')] + [(str(n), '<f8') for n in columns])
+
+
+    def __fromBin(self, source, first, last, columns):
+        """Copy rows [first, last) of a binary log into a result block"""
+        out = np.zeros(last - first, dtype=self.__dtype(columns))
+        out['time'] = source['time'][first:last]
+        for name in columns:
+            if name in source.dtype.names:
+                out[name] = source[name][first:last]
+            else:
+                out[name] = np.nan
+        return out
+
+
+    def __fromCsv(self, path, index, first, last, columns):
+        """Parse rows [first, last) of a csv log into a result block"""
+        out = np.zeros(last - first, dtype=self.__dtype(columns))
+        out['time'] = index['time'][first:last]
+        offsets = index['offset']
+        stop = offsets[last] if last < len(offsets) else index['indexed']
+        with open(path, 'rb') as f:
+            f.seek(offsets[first])
+            data = f.read(stop - offsets[first])
+        names = index['names']
+        cols = len(names)
+        rows = data.replace('"', "").splitlines()
+        values = np.fromstring(",".join(r.split(",", 1)[1] if "," in r\
+                                        else "" for r in rows if r),\
+                               dtype=float, sep=",")
+        if values.size != (last - first) * cols:
+            values = self.__slowParse([r for r in rows if r], cols)
+        values = values.reshape(last - first, cols)
+        for name in columns:
+            if name in names:
+                out[name] = values[:, names.index(name)]
+            else:
+                out[name] = np.nan
+        return out
+
+
+    def __slowParse(self, rows, cols):
+        """Row by row parse for blocks holding short rows or non numbers"""
+        values = np.full((len(rows), cols), np.nan)
+        for i, row in enumerate(rows):
+            for j, value in enumerate(row.split(",")[1:cols + 1]):
+                try:
+                    values[i, j] = float(value)
+                except ValueError:
+                    pass
+        return values
+
+
+    def __newAccumulator(self, count, how):
+        """Per bucket state for one column"""
+        if how == "min":
+            return np.full(count, np.inf)
+        if how == "max":
+            return np.full(count, -np.inf)
+        return [np.zeros(count), np.zeros(count)]    #Sum, count
+
+
+    def __accumulate(self, acc, slot, values, how):
+        """Add one block of a column to its per bucket state"""
+        keep = ~np.isnan(values)
+        slot = slot[keep]
+        values = values[keep]
+        if how == "min":
+            np.minimum.at(acc, slot, values)
+        elif how == "max":
+            np.maximum.at(acc, slot, values)
+        else:
+            acc[0] += np.bincount(slot, values, len(acc[0]))[:len(acc[0])]
+            acc[1] += np.bincount(slot, None, len(acc[1]))[:len(acc[1])]
+
+
+    def __finish(self, acc, how):
+        """Turn the per bucket state into the result values"""
+        if how == "count":
+            return acc[1]
+        if how == "mean":
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return acc[0] / acc[1]
+        out = acc.copy()
+        out[np.isinf(out)] = np.nan
+        return out
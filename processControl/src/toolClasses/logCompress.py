@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Alexander David Leech
+@date:   Sun Aug 28 17:44:02 2016
+@rev:    1
+@lang:   Python 2.7
+@deps:   numpy
+@desc:   Deadband and swinging door compression of process log rows
+"""
+
+import numpy as np
+
+
+class logCompress:
+    """Decides which log rows need to be stored to reproduce every column
+    within its tolerance
+
+    Usage:  Create an instance with the column names and the
+            'log_compression' settings from the 'logHeaders' file
+            Pass each row to 'process(stamp, values)' and store the rows it
+            returns (in order)
+            Call 'flush()' when the log stops to store the last held row
+
+    Each column has a tolerance of 'abs' + 'rel' * |last stored value| and a
+    method:
+        deadband     - store when the value moves more than the tolerance
+                       from the last stored value. Reads back as a step
+                       (sample and hold) between stored rows.
+        swingingDoor - store when the straight line from the last stored row
+                       to the newest row no longer passes within the
+                       tolerance of every row between. Reads back by linear
+                       interpolation between stored rows.
+    Columns that are not configured store a row whenever they change at all.
+    Rows are stored whole, so a row stored for one column also restarts the
+    other columns from that row, which only ever reduces their error. A row
+    is always stored at least every 'max_interval' seconds.
+    """
+
+    methods = ("deadband", "swingingDoor")
+
+
+    def __init__(self, names, cfg):
+        """Setup
+
+        :param names: Column names (excluding time)
+        :param cfg:   'log_compression' settings
+        :type names:  list
+        :type cfg:    dict
+        """
+        count = len(names)
+        columns = cfg.get('columns') or {}
+        self.names = list(names)
+        self.maxInterval = float(cfg.get('max_interval', 0) or np.inf)
+        self.door = np.zeros(count, dtype=bool)
+        self.absTol = np.zeros(count)
+        self.relTol = np.zeros(count)
+        for name in columns:
+            if name not in self.names:
+                raise ValueError("Compression set for unknown column " + name)
+            col = columns[name]
+            if col['method'] not in self.methods:
+                raise ValueError("Invalid compression method - Options are " +\
+                                 ", ".join(self.methods))
+            i = self.names.index(name)
+            self.door[i] = col['method'] == "swingingDoor"
+            self.absTol[i] = col.get('abs', 0.0)
+            self.relTol[i] = col.get('rel', 0.0)
+        self.rowsIn = 0
+        self.rowsOut = 0
+        self.reset()
+
+
+    def reset(self):
+        """Start again - the next row is always stored"""
+        self.archive = None                     #(stamp, values) last stored
+        self.held = None                        #(stamp, row, values) latest
+        self.__resetDoor()
+
+
+    def process(self, stamp, row, force=False):
+        """Pass one row through the compression
+
+        :param stamp: Epoch time of the row (s)
+        :param row:   Values of the row
+        :param force: Store this row regardless
+        :type stamp:  float
+        :type row:    list
+        :type force:  bool
+
+        :return: List of (stamp, row) to store, oldest first
+        """
+        self.rowsIn += 1
+        values = self.__toFloat(row)
+        if self.archive is None or force:
+            return self.__store([], stamp, row, values)
+        out = []
+        if self.__doorCloses(stamp, values):
+            self.__store(out, *self.held)       #Held row ends the segment
+            self.__doorCloses(stamp, values)
+        if self.__exceeds(stamp, values):
+            return self.__store(out, stamp, row, values)
+        self.held = (stamp, row, values)
+        return out
+
+
+    def flush(self):
+        """Return the held row (if not yet stored) so the log ends on it
+
+        :return: List of (stamp, row) to store
+        """
+        out = []
+        if self.held is not None:
+            self.__store(out, *self.held)
+        return out
+
+
+    def __toFloat(self, row):
+        """Row values as floats (NaN for missing or non numeric values)"""
+        values = np.full(len(self.names), np.nan)
+        for i in range(min(len(row), len(values))):
+            try:
+                values[i] = float(row[i])
+            except (TypeError, ValueError):
+                pass
+        return values
+
+
+    def __tolerance(self):
+        """Tolerance of each column about the last stored row"""
+        return self.absTol + self.relTol * np.abs(self.archive[1])
+
+
+    def __resetDoor(self):
+        """Open the doors fully from the last stored row"""
+        self.slopeLow = np.full(len(self.names), -np.inf)
+        self.slopeHigh = np.full(len(self.names), np.inf)
+
+
+    def __doorCloses(self, stamp, values):
+        """Check a new row against the doors, then narrow them with it
+
+        The doors hold the range of slopes from the last stored row that
+        pass within the tolerance of every row since. When the line to the
+        new row is outside that range the held row has to be stored, and the
+        doors are left for the caller to restart from it.
+        """
+        dt = max(stamp - self.archive[0], 1e-9)
+        tol = self.__tolerance()
+        base = self.archive[1]
+        with np.errstate(invalid='ignore'):
+            slope = (values - base) / dt
+            if np.any(self.door & ((slope < self.slopeLow) |\
+                                   (slope > self.slopeHigh))):
+                return True
+            np.maximum(self.slopeLow, slope - tol / dt, out=self.slopeLow,\
+                       where=self.door)
+            np.minimum(self.slopeHigh, slope + tol / dt, out=self.slopeHigh,\
+                       where=self.door)
+        return False
+
+
+    def __exceeds(self, stamp, values):
+        """Check the non swinging door limits of a new row"""
+        if stamp - self.archive[0] >= self.maxInterval:
+            return True
+        base = self.archive[1]
+        if np.any(np.isnan(values) != np.isnan(base)):
+            return True
+        with np.errstate(invalid='ignore'):
+            moved = np.abs(values - base) > self.__tolerance()
+        return bool(np.any(moved & ~self.door))
+
+
+    def __store(self, out, stamp, row, values):
+        """Store a row and restart every column from it"""
+        out.append((stamp, row))
+        self.rowsOut += 1
+        self.archive = (stamp, values)
+        self.held = None
+        self.__resetDoor()
+        return out
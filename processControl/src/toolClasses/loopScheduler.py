@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Alexander David Leech
+@date:   Thu Aug 11 19:26:40 2016
+@rev:    1
+@lang:   Python 2.7
+@deps:   ctypes (Linux only)
+@desc:   Fixed rate loop timing based on a monotonic clock
+"""
+
+import os
+import time
+
+
+def _linuxMonotonic():
+    """Build a monotonic clock from clock_gettime (not in the 2.7 time module)"""
+    import ctypes
+    import ctypes.util
+
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    try:
+        lib = ctypes.CDLL('librt.so.1', use_errno=True)
+    except OSError:
+        lib = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    clockGetTime = lib.clock_gettime
+    clockGetTime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+    ts = timespec()
+    tsRef = ctypes.byref(ts)
+
+    def monotonic():
+        """Seconds from an arbitrary point, unaffected by clock changes"""
+        if clockGetTime(1, tsRef) != 0:                 #1 = CLOCK_MONOTONIC
+            raise OSError(ctypes.get_errno(), "clock_gettime failed")
+        return ts.tv_sec + (ts.tv_nsec * 1e-9)
+    return monotonic
+
+
+if hasattr(time, 'monotonic'):
+    monotonic = time.monotonic
+elif os.name == 'nt':
+    monotonic = time.clock                  #Performance counter on Windows
+else:
+    monotonic = _linuxMonotonic()
+
+
+class loopScheduler:
+    """Runs a loop at a fixed interval using absolute monotonic deadlines
+
+    Usage:  Create an instance with the loop interval and overrun policy
+            Call 'start()' immediately before entering the loop
+            Call 'wait()' at the end of each iteration
+            Use 'stats()' to inspect the timing of the loop so far
+
+    Each cycle is due at start + n * interval, so time spent in the loop body
+    never accumulates as drift. When an iteration overruns its slot the
+    overrun policy decides what happens next:
+        skip    - drop the missed slots and wait for the next one on the grid
+        catchup - run the missed cycles back to back until on time again
+        stretch - start the next cycle now and move the grid to follow it
+    """
+
+    policies = ("skip", "catchup", "stretch")
+
+
+    def __init__(self, interval, overrun="skip"):
+        """Setup
+
+        :param interval: Loop interval (s)
+        :param overrun:  Overrun policy - skip, catchup or stretch
+        :type interval:  float
+        :type overrun:   string
+        """
+        if interval <= 0:
+            raise ValueError("Interval must be greater than 0")
+        if overrun not in self.policies:
+            raise ValueError("Invalid overrun policy - Options are " +\
+                             ", ".join(self.policies))
+        self.interval = float(interval)
+        self.overrun = overrun
+        self.start()
+
+
+    def start(self):
+        """Reset the schedule so the first cycle is due now"""
+        self.startTime = monotonic()
+        self.cycleStart = self.startTime        #When the current cycle began
+        self.deadline = self.startTime + self.interval
+        self.lastPeriod = self.interval         #Actual time between cycles
+        self.cycles = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.lateness = 0.0                     #Wake up after due time (s)
+        self.jitter = 0.0                       #lastPeriod - interval (s)
+        self.maxLateness = 0.0
+        self.maxJitter = 0.0
+        self.__sumLateness = 0.0
+
+
+    def elapsed(self):
+        """Return the seconds since 'start' was called"""
+        return monotonic() - self.startTime
+
+
+    def remaining(self):
+        """Return the seconds left before the next cycle is due"""
+        return self.deadline - monotonic()
+
+
+    def wait(self):
+        """Block until the next cycle is due, applying the overrun policy
+
+        :return: Lateness of the new cycle start (s)
+        """
+        now = monotonic()
+        target = self.deadline
+        if now >= target:
+            self.overruns += 1
+            if self.overrun == "skip":
+                missed = int((now - target) / self.interval) + 1
+                target += missed * self.interval
+                self.skipped += missed
+            elif self.overrun == "stretch":
+                target = now
+        delay = target - monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+        woke = monotonic()
+        self.lateness = woke - target
+        self.lastPeriod = woke - self.cycleStart
+        self.jitter = self.lastPeriod - self.interval
+        self.cycleStart = woke
+        self.deadline = target + self.interval
+        self.cycles += 1
+        self.__sumLateness += self.lateness
+        self.maxLateness = max(self.maxLateness, self.lateness)
+        self.maxJitter = max(self.maxJitter, abs(self.jitter))
+        return self.lateness
+
+
+    def stats(self):
+        """Return a summary of the loop timing since 'start'
+
+        :return: dict of cycle counts and lateness/jitter figures (s)
+        """
+        meanLateness = 0.0
+        if self.cycles > 0:
+            meanLateness = self.__sumLateness / self.cycles
+        return {'cycles': self.cycles,
+                'overruns': self.overruns,
+                'skipped': self.skipped,
+                'lastPeriod': self.lastPeriod,
+                'lateness': self.lateness,
+                'meanLateness': meanLateness,
+                'maxLateness': self.maxLateness,
+                'jitter': self.jitter,
+                'maxJitter': self.maxJitter}
@@ -5,17 +5,23 @@
 @date:   Wed Jun 15 20:16:53 2016
 @rev:    1
 @lang:   Python 2.7
-@deps:   pymodbus
+@deps:   pymodbus, numpy
 @desc:   Class to carry out MODBUS read/write requests
 """
 
 import time
-from yamlImport import yamlImport
+import random
+import threading
+import numpy as np
+from yamlImport    import yamlImport
+from registerCodec import registerCodec
+from loopScheduler import monotonic
+from modbusErrors  import modbusError, modbusLinkError, modbusTimeoutError,\
+                          modbusDeadlineError, modbusDeviceError,\
+                          modbusRequestError
 
 from pymodbus.client.sync import ModbusTcpClient, ModbusSerialClient
 from pymodbus.exceptions  import ModbusIOException, ConnectionException
-from pymodbus.payload     import BinaryPayloadBuilder, BinaryPayloadDecoder
-from pymodbus.constants   import Endian
 
 class modbusClient:
     """Class to carry out MODBUS read/write requests
@@ -24,18 +30,50 @@ class modbusClient:
             Call 'openConnection' to connect to the assigned server
             Use 'dataHandler' to read or write data to the server
             Call 'closeConnection' to safely close the connection
+    
+    Requests never block waiting for a lost connection. When the link drops
+    the request raises 'modbusLinkError' and a background thread reconnects,
+    waiting a random time of up to min(backoffMax, backoffBase * 2^attempt)
+    between attempts. Until it succeeds every request fails straight away
+    with 'modbusLinkError', so the calling loop keeps its timing. All
+    communication failures raise a subclass of 'modbusError' (see
+    modbusErrors.py) and each request waits no longer than the timeout set
+    by 'setTimeout'.
+    
+    A loop can also give each cycle a time budget with 'setDeadline'. Each
+    request then waits no longer than the time left before the deadline,
+    and a request that would not finish in time (less time left than a
+    request has been taking) is dropped without being sent, raising
+    'modbusDeadlineError'.
     """
 
-    def __init__(self):
-        """Load settings and connect to the designated slave"""
+    #pymodbus messages for a reply that did not arrive in full in time
+    noReply = ("No Response received", "Incomplete message received")
+
+    def __init__(self, cfgFile="./cfg/modbusSettings.yaml"):
+        """Load settings and connect to the designated slave
+        
+        :param cfgFile: Path to the MODBUS settings file
+        :type cfgFile:  string
+        """
         
-        self.modbusCfg = yamlImport.importYAML("./cfg/modbusSettings.yaml")
+        self.modbusCfg = yamlImport.importYAML(cfgFile)
         if self.modbusCfg['logging'] == "enable":
             self.log = self.__logging()
+        self.codec = registerCodec(self.modbusCfg['byteOrder'],\
+                                   self.modbusCfg['wordOrder'])
+        self.timeout = self.modbusCfg['timeout']
+        self.deadline = None
+        self.rtt = 0.0                          #Smoothed request time (s)
+        self.dropped = 0
+        self.linkUp = threading.Event()
+        self.reconnects = 0
+        self.__halt = threading.Event()
+        self.__thread = None
+        self.__lock = threading.Lock()
         if self.__setupClient() == 0:
             return 0
-        if self.openConnection() == 0:
-            return 0
+        self.openConnection()                   #Retries in the background
             
             
     def __logging(self):
@@ -55,42 +93,86 @@ class modbusClient:
         if self.modbusCfg['method'] == "tcp":
             try:
                 self.client = ModbusTcpClient(self.modbusCfg['ip'],\
-                                              self.modbusCfg['tcpPort'])
+                                              self.modbusCfg['tcpPort'],\
+                                              timeout=self.modbusCfg['timeout'])
             except:
                 raise
                 return 0
         elif self.modbusCfg['method'] == "rtu":
             try:
                 self.client = ModbusSerialClient(self.modbusCfg['method'],\
-                                                 self.modbusCfg['rtuPort'],\
-                                                 self.modbusCfg['stopbits'],\
-                                                 self.modbusCfg['bytesize'],\
-                                                 self.modbusCfg['parity'],\
-                                                 self.modbusCfg['baudrate'],\
-                                                 self.modbusCfg['timeout'])
+                                                 port=self.modbusCfg['rtuPort'],\
+                                                 stopbits=self.modbusCfg['stopbits'],\
+                                                 bytesize=self.modbusCfg['bytesize'],\
+                                                 parity=self.modbusCfg['parity'],\
+                                                 baudrate=self.modbusCfg['baudrate'],\
+                                                 timeout=self.modbusCfg['timeout'])
             except:
                 raise
                 return 0
-            else:
-                raise NameError("Unsupported method")
-                return 0
+        else:
+            raise NameError("Unsupported method")
+            return 0
+            
+            
+    def setTimeout(self, timeout):
+        """Set the time allowed for each request from now on
+        
+        :param timeout: Longest wait for a reply (s)
+        :type timeout:  float
+        """
+        self.timeout = timeout
+        self.__applyTimeout(timeout)
+            
+            
+    def setDeadline(self, deadline):
+        """Set the time by which requests must complete
+        
+        :param deadline: 'loopScheduler.monotonic' time (None for no limit)
+        :type deadline:  float
+        """
+        self.deadline = deadline
+            
+            
+    def __applyTimeout(self, timeout):
+        """Pass a reply timeout to the pymodbus client (and serial port)"""
+        if timeout == self.client.timeout:
+            return
+        self.client.timeout = timeout
+        if self.modbusCfg['method'] == "rtu" and self.client.socket:
+            self.client.socket.timeout = timeout            #Open serial port
             
             
     def openConnection(self):
-        """Attempt connection with the MODBUS server"""
-        for i in range(3):
+        """Attempt connection with the MODBUS server
+        
+        Makes one attempt on the calling thread. If it fails the connection is
+        retried in the background and requests fail with 'modbusLinkError'
+        until it succeeds.
+        
+        :return: 1 if connected now, 0 if reconnecting in the background
+        """
+        if self.linkUp.is_set():
+            return 1
+        self.__halt.clear()
+        with self.__lock:
+            if self.__thread is not None:
+                return 0                                    #Already retrying
             if self.client.connect() == True:
+                self.linkUp.set()
                 return 1
-            else:
-                print "Attempt " + str(i) + " failed"
-            if i == 2:
-                raise IOError("Failed to connect to specified server")
-                return 0
-            time.sleep(0.5)
+        print("Connection failed - retrying in the background")
+        self.__startReconnect()
+        return 0
    
 
     def closeConnection(self):
         """Close connection with the MODBUS server"""
+        self.__halt.set()
+        thread = self.__thread
+        if thread is not None:
+            thread.join()
+        self.linkUp.clear()
         try:
             self.client.close()
         except:
@@ -116,37 +198,51 @@ class modbusClient:
         :type length: int
         :type data: list
         
-        :return: List containing the requested data or confimation of send.
+        :return: List containing the requested data or 1 for a completed write
+        :raises modbusError: the request did not complete (see modbusErrors)
+        :raises modbusRequestError: invalid operation or register
         """
-        if op == 'r':
-            for i in range(3):
-                r = self.__readData(reg, addr, length, encoding)
-                if (r == ConnectionException) or (r == ModbusIOException):
-                    print("Read attempt " + str(i) + " failed")
-                    if i == 2:
-                        #TODO: remove sys exit and handle properly
-                        raise SystemExit('Modbus Error: Failed 3 Attemps')
-                elif r == ValueError:
-                    #TODO: remove sys exit and handle properly
-                    raise SystemExit('Invalid Register - Use 15 or 16')
-                else:
-                    return r
-        if op == 'w':
-            for i in range(3):
-                w = self.__writeData(reg, addr, data, encoding)
-                if (w == ConnectionException) or (w == ModbusIOException):
-                    print("Write attempt " + str(i) + " failed")
-                    if i == 2:
-                        #TODO: remove sys exit and handle properly
-                        raise SystemExit('Modbus Error: Failed 3 Attemps')
-                elif w == ValueError:
-                    #TODO: remove sys exit and handle properly
-                    raise SystemExit('Invalid Register - Use 15 or 16')
-                else:
-                    return w
-        return ValueError('Invalid Operation')
+        if op not in ('r', 'w'):
+            raise modbusRequestError('Invalid Operation')
+        if not self.linkUp.is_set():
+            raise modbusLinkError('Modbus Error: Link down - reconnecting')
+        start = self.__budget()
+        try:
+            if op == 'r':
+                data = self.__readData(reg, addr, length, encoding)
+            else:
+                self.__writeData(reg, addr, data, encoding)
+                data = 1
+            self.rtt += 0.2 * ((monotonic() - start) - self.rtt)
+            return data
+        except ConnectionException:
+            self.__linkLost()
+            raise modbusLinkError('Modbus Error: Connection lost')
+        except modbusLinkError:
+            self.__linkLost()
+            raise
             
     
+    def __budget(self):
+        """Fit the next request into the time left before the deadline
+        
+        :return: Start time of the request
+        :raises modbusDeadlineError: too little time left to complete it
+        """
+        now = monotonic()
+        if self.deadline is None:
+            self.__applyTimeout(self.timeout)
+            return now
+        left = self.deadline - now
+        if left <= self.rtt:
+            self.dropped += 1
+            raise modbusDeadlineError('Modbus Error: %.1fms left in the '\
+                                      'cycle, requests take %.1fms' %\
+                                      (left * 1e3, self.rtt * 1e3))
+        self.__applyTimeout(min(left, self.timeout))
+        return now
+    
+    
     def __readData(self, reg, addr, length, encoding):
         """Read data from the MODBUS Slave
         
@@ -162,48 +258,31 @@ class modbusClient:
         :type length:    int
         :type encoding: int
         
-        :return:         List containing the requested data or failure exception.
+        :return:         List containing the requested data
         """
-        data = []
-        
         if 1 <= reg <= 2:
-            try:
-                if reg == 1:
-                    co = self.client.read_coils(addr,length,unit=0x01)
-                else:
-                    co = self.client.read_discrete_inputs(addr,length,unit=0x01)
-            except ConnectionException:
-                return ConnectionException
-            
-            if co.function_code != reg:
-                return ModbusIOException
-                
-            for i in range(length):
-                data.append(co.getBit(i))
-            return data
+            if reg == 1:
+                co = self.client.read_coils(addr,length,unit=0x01)
+            else:
+                co = self.client.read_discrete_inputs(addr,length,unit=0x01)
+            self.__checkReply(co, reg)
+            return co.bits[:length]
         
         
         elif 3 <= reg <= 4:
-            try:
-                if reg == 3:
-                    hr = self.client.read_holding_registers(addr,length,unit=0x01)
-                else:
-                    hr = self.client.read_input_registers(addr,length,unit=0x01)
-            except ConnectionException:
-                return ConnectionException
-            
-            if hr.function_code != reg:
-                return ModbusIOException
-                
-            for i in range(length):
-                data.append(hr.getRegister(i))
+            if reg == 3:
+                hr = self.client.read_holding_registers(addr,length,unit=0x01)
+            else:
+                hr = self.client.read_input_registers(addr,length,unit=0x01)
+            self.__checkReply(hr, reg)
+            data = hr.registers[:length]
             
             if encoding == 1:
                 return self.__decodeData(data)
             return data
         
         else:
-            return ValueError
+            raise modbusRequestError('Invalid Register - Use 1 to 4')
             
     
     def __writeData(self, reg, addr, data, encoding):
@@ -220,32 +299,86 @@ class modbusClient:
         :type addr:      int
         :type length:    int
         :type encoding: int
-        
-        :return:         success or failure exception
         """
         if reg == 15:
-            try:
-                co = self.client.write_coils(addr,data,unit=0x01)
-            except ConnectionException:
-                return ConnectionException
-            
-            if co.function_code != reg:
-                return ModbusIOException
+            co = self.client.write_coils(addr,data,unit=0x01)
+            self.__checkReply(co, reg)
         
         elif reg == 16:
             if encoding == 1:
                 data = self.__encodeData(data)
-            
-            try:
-                hr = self.client.write_registers(addr,data,unit=0x01)
-            except ConnectionException:
-                return ConnectionException
-            
-            if hr.function_code != reg:
-                return ModbusIOException
+            hr = self.client.write_registers(addr,data,unit=0x01)
+            self.__checkReply(hr, reg)
             
         else:
-            return ValueError
+            raise modbusRequestError('Invalid Register - Use 15 or 16')
+        
+    
+    def __checkReply(self, reply, reg):
+        """Raise the matching 'modbusError' if a reply is not a success
+        
+        pymodbus returns a 'ModbusIOException' both for a reply that did not
+        arrive in full within the timeout and for a socket (or serial port)
+        error. Only the second means the link is lost. A slow reply is a
+        timeout and the link stays up: the connection is closed so the late
+        reply is not misread, and pymodbus reconnects on the next request (a
+        failed reconnect raises 'ConnectionException' and so a link error).
+        """
+        if isinstance(reply, ModbusIOException):
+            if not any(text in reply.string for text in self.noReply):
+                raise modbusLinkError('Modbus Error: Connection lost')
+            if self.modbusCfg['method'] == "tcp":
+                self.client.close()             #Late reply would be misread
+            raise modbusTimeoutError('Modbus Error: No reply within ' +\
+                                     str(self.client.timeout) + 's')
+        code = getattr(reply, 'function_code', None)
+        if code == reg | 0x80:
+            raise modbusDeviceError(reply.exception_code)
+        if code != reg:
+            raise modbusError('Modbus Error: Unexpected reply')
+        
+    
+    def __linkLost(self):
+        """Drop the connection and start reconnecting in the background"""
+        self.linkUp.clear()
+        with self.__lock:
+            if self.__thread is not None:
+                return
+            self.client.close()
+        print("Connection lost - reconnecting in the background")
+        self.__startReconnect()
+        
+    
+    def __startReconnect(self):
+        """Start the background reconnection thread"""
+        with self.__lock:
+            if self.__thread is not None or self.__halt.is_set():
+                return
+            self.__thread = threading.Thread(target=self.__reconnect)
+            self.__thread.daemon = True
+            self.__thread.start()
+        
+    
+    def __reconnect(self):
+        """Background thread - retry the connection with jittered exponential
+        backoff until it succeeds or 'closeConnection' is called
+        """
+        attempt = 0
+        try:
+            while True:
+                delay = min(self.modbusCfg['backoffMax'],\
+                            self.modbusCfg['backoffBase'] * 2 ** attempt)
+                if self.__halt.wait(random.uniform(0, delay)):
+                    return                                  #Closing down
+                attempt += 1
+                if self.client.connect() == True:
+                    self.reconnects += 1
+                    print("Reconnected after " + str(attempt) + " attempt(s)")
+                    self.linkUp.set()
+                    return
+        finally:
+            with self.__lock:
+                self.__thread = None
         
     
     def __encodeData(self, data):
@@ -258,13 +391,7 @@ class modbusClient:
         :param data: Float to be encoded
         :type data: list
         """
-        builder = BinaryPayloadBuilder(endian=Endian.Little)
-        try:
-            for i in range(0,len(data)):
-                builder.add_32bit_float(data[i])
-        except TypeError:
-            builder.add_32bit_float(data)
-        return builder.to_registers()
+        return self.codec.encode(data, "float32")
 
     def __decodeData(self, data):
         """Decode MODBUS data to float
@@ -276,8 +403,4 @@ class modbusClient:
         :param data: Data to be decoded
         :type data: list
         """
-        returnData = [0]*(len(data)/2)
-        decoder = BinaryPayloadDecoder.fromRegisters(data, endian=Endian.Little)
-        for i in range(0,len(data)/2):
-            returnData[i] = round(decoder.decode_32bit_float(),2)
-        return returnData
\ No newline at end of file
+        return np.round(self.codec.decode(data, "float32"), 2).tolist()
\ No newline at end of file
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Alexander David Leech
+@date:   Wed Aug 31 19:52:18 2016
+@rev:    1
+@lang:   Python 2.7
+@deps:   <None>
+@desc:   Exceptions raised by modbusClient when a request does not complete
+"""
+
+
+class modbusError(IOError):
+    """Base of every failed MODBUS request - catch this to ride through any
+    communication fault and try again on the next scan
+    """
+
+
+class modbusLinkError(modbusError):
+    """The connection is down. modbusClient is reconnecting in the background
+    and fails requests straight away until the link is back.
+    """
+
+
+class modbusTimeoutError(modbusError):
+    """The device did not return a complete reply within the request timeout"""
+
+
+class modbusDeadlineError(modbusTimeoutError):
+    """The request was dropped without being sent because it could not
+    complete before the deadline set by 'setDeadline'
+    """
+
+
+class modbusDeviceError(modbusError):
+    """The device replied with a MODBUS exception code"""
+
+    def __init__(self, code, message=None):
+        """
+        :param code:    MODBUS exception code from the reply
+        :param message: Description (default built from the code)
+        :type code:     int
+        :type message:  string
+        """
+        self.code = code
+        if message is None:
+            message = "Device returned exception code " + str(code)
+        modbusError.__init__(self, message)
+
+
+class modbusRequestError(ValueError):
+    """The request itself is invalid (bad operation or function code). This
+    is a fault in the calling code, so it is not a 'modbusError'.
+    """
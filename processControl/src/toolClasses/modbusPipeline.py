@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Alexander David Leech
+@date:   Tue Aug 09 21:03:26 2016
+@rev:    1
+@lang:   Python 2.7
+@deps:   pymodbus, numpy
+@desc:   Non-blocking MODBUS TCP client with pipelined transactions
+"""
+
+import time
+import errno
+import select
+import socket
+import struct
+import numpy as np
+from registerCodec import registerCodec
+
+from pymodbus.exceptions import ModbusIOException, ConnectionException
+
+
+class modbusPipeline:
+    """Polls many MODBUS TCP slaves at once with several requests in flight on
+    each connection
+
+    Usage:  Create an instance of the class (one per scanning thread)
+            Queue requests with 'request(...)', keeping the returned index
+            Call 'scan()' to send everything and collect the results
+            Call 'close()' to drop all open connections
+
+    Each (host, port) gets one non-blocking socket which is kept open between
+    scans. Up to 'window' transactions are written to a connection before any
+    reply is needed and the replies are matched back up by transaction ID, so
+    a scan of many devices costs roughly one round trip rather than one per
+    request. Results use the same convention as modbusClient: a list of data,
+    1 for a completed write, or the ConnectionException/ModbusIOException
+    class on failure.
+    """
+
+    def __init__(self, window=16, timeout=1.0, codec=None):
+        """Setup
+
+        :param window:  Max transactions in flight per connection
+        :param timeout: Default time allowed for a scan (s)
+        :param codec:   Register layout for floats (default registerCodec())
+        :type window:   int
+        :type timeout:  float
+        :type codec:    registerCodec
+        """
+        self.window = window
+        self.timeout = timeout
+        self.codec = codec if codec is not None else registerCodec()
+        self.conns = {}
+        self.__pending = []
+
+
+    def request(self, host, unit, reg, addr, length=None, data=None,\
+                port=502, encoding=0):
+        """Queue a request for the next scan
+
+        :param host:     Slave IP address
+        :param unit:     Slave unit ID
+        :param reg:      Function code (1-4 read, 15-16 write)
+        :param addr:     Address to start operation at
+        :param length:   Quantity to read (reads only)
+        :param data:     List of data to write (writes only)
+        :param port:     Slave TCP port
+        :param encoding: 1 to decode/encode registers as 32bit floats
+        :type host:      string
+        :type unit:      int
+        :type reg:       int
+        :type addr:      int
+        :type length:    int
+        :type data:      list
+        :type port:      int
+        :type encoding:  int
+
+        :return: Index of the result in the list returned by 'scan'
+        """
+        if reg not in (1, 2, 3, 4, 15, 16):
+            raise ValueError("Invalid Register - Use 1-4, 15 or 16")
+        if reg == 16 and encoding == 1:
+            data = self.codec.encode(data, "float32")
+        self.__pending.append(((host, port), unit, reg, addr, length,\
+                               data, encoding))
+        return len(self.__pending) - 1
+
+
+    def scan(self, timeout=None):
+        """Send all queued requests and wait for the replies
+
+        :param timeout: Time allowed for the whole scan (s)
+        :type timeout:  float
+
+        :return: List of results in the order the requests were queued
+        """
+        requests = self.__pending
+        self.__pending = []
+        results = [ModbusIOException] * len(requests)
+        deadline = time.time() + (self.timeout if timeout is None else timeout)
+
+        for i in range(len(requests)):
+            conn = self.__connection(requests[i][0])
+            if conn is None:
+                results[i] = ConnectionException
+            else:
+                conn['queue'].append(i)
+
+        while True:
+            active = [c for c in self.conns.values()\
+                      if c['queue'] or c['inflight']]
+            remaining = deadline - time.time()
+            if not active or remaining <= 0:
+                break
+            for conn in active:
+                if conn['connected']:
+                    self.__fillWindow(conn, requests)
+            readers = [c['sock'] for c in active if c['connected']]
+            writers = [c['sock'] for c in active\
+                       if not c['connected'] or c['tx']]
+            try:
+                r, w, e = select.select(readers, writers, [], remaining)
+            except select.error:
+                break
+            for conn in active:
+                if conn['sock'] in w:
+                    self.__onWritable(conn, requests, results)
+                if conn['sock'] in r and conn['sock'] is not None:
+                    self.__onReadable(conn, requests, results)
+
+        for key in list(self.conns.keys()):             #Timed out requests
+            conn = self.conns[key]
+            if conn['queue'] or conn['inflight']:
+                self.__drop(key, requests, results, ModbusIOException)
+        return results
+
+
+    def close(self):
+        """Close all open connections"""
+        for conn in self.conns.values():
+            if conn['sock'] is not None:
+                conn['sock'].close()
+        self.conns = {}
+
+
+    def __connection(self, key):
+        """Return the connection for a host, starting a connect if required
+
+        :param key: (host, port) tuple
+        :type key:  tuple
+        """
+        if key in self.conns:
+            return self.conns[key]
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setblocking(0)
+            err = sock.connect_ex(key)
+        except socket.error:
+            return None
+        if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            sock.close()
+            return None
+        self.conns[key] = {'key': key, 'sock': sock, 'connected': err == 0,\
+                           'tid': 0, 'queue': [], 'inflight': {}, 'tx': b'',\
+                           'rx': bytearray()}
+        return self.conns[key]
+
+
+    def __fillWindow(self, conn, requests):
+        """Frame queued requests until the connection window is full"""
+        while conn['queue'] and len(conn['inflight']) < self.window:
+            i = conn['queue'].pop(0)
+            conn['tid'] = (conn['tid'] + 1) & 0xFFFF
+            conn['inflight'][conn['tid']] = i
+            conn['tx'] += self.__frame(conn['tid'], requests[i])
+
+
+    def __frame(self, tid, req):
+        """Build the MBAP header and PDU for one request"""
+        key, unit, reg, addr, length, data, encoding = req
+        if reg <= 4:
+            pdu = struct.pack('>BHH', reg, addr, length)
+        elif reg == 15:
+            packed = registerCodec.packBits(data)
+            pdu = struct.pack('>BHHB', reg, addr, len(data), len(packed)) +\
+                  packed
+        else:
+            pdu = struct.pack('>BHHB', reg, addr, len(data), len(data) * 2) +\
+                  struct.pack('>' + 'H' * len(data), *data)
+        return struct.pack('>HHHB', tid, 0, len(pdu) + 1, unit) + pdu
+
+
+    def __onWritable(self, conn, requests, results):
+        """Complete a pending connect or push buffered requests to the socket"""
+        key = conn['key']
+        if not conn['connected']:
+            if conn['sock'].getsockopt(socket.SOL_SOCKET, socket.SO_ERROR):
+                self.__drop(key, requests, results, ConnectionException)
+                return
+            conn['connected'] = True
+            self.__fillWindow(conn, requests)
+        try:
+            sent = conn['sock'].send(conn['tx'])
+        except socket.error:
+            self.__drop(key, requests, results, ConnectionException)
+            return
+        conn['tx'] = conn['tx'][sent:]
+
+
+    def __onReadable(self, conn, requests, results):
+        """Read available data and resolve every complete reply"""
+        key = conn['key']
+        try:
+            chunk = conn['sock'].recv(65536)
+        except socket.error:
+            chunk = b''
+        if not chunk:
+            self.__drop(key, requests, results, ConnectionException)
+            return
+        rx = conn['rx']
+        rx.extend(chunk)
+        while len(rx) >= 7:
+            tid, pid, length = struct.unpack_from('>HHH', rx, 0)
+            if len(rx) < 6 + length:
+                break
+            pdu = rx[7:6 + length]
+            del rx[:6 + length]
+            if tid in conn['inflight']:
+                i = conn['inflight'].pop(tid)
+                results[i] = self.__parse(requests[i], pdu)
+
+
+    def __parse(self, req, pdu):
+        """Convert a reply PDU into the result for its request"""
+        key, unit, reg, addr, length, data, encoding = req
+        if len(pdu) < 2 or pdu[0] != reg:
+            return ModbusIOException
+        if reg <= 2:
+            if len(pdu) < 2 + ((length + 7) // 8):
+                return ModbusIOException
+            return registerCodec.unpackBits(pdu[2:], length).tolist()
+        if reg <= 4:
+            if len(pdu) < 2 + (2 * length):
+                return ModbusIOException
+            regs = np.frombuffer(bytes(pdu[2:2 + (2 * length)]), dtype='>u2')
+            if encoding == 1:
+                return np.round(self.codec.decode(regs, "float32"), 2).tolist()
+            return regs.tolist()
+        return 1
+
+
+    def __drop(self, key, requests, results, failure):
+        """Close a connection and fail everything waiting on it"""
+        conn = self.conns.pop(key)
+        for i in conn['queue'] + list(conn['inflight'].values()):
+            results[i] = failure
+        conn['sock'].close()
+        conn['sock'] = None
+        conn['queue'] = []
+        conn['inflight'] = {}
+
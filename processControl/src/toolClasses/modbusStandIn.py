@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Alexander David Leech
+@date:   Tue Aug 09 22:47:58 2016
+@rev:    1
+@lang:   Python 2.7
+@deps:   <None>
+@desc:   Local MODBUS TCP server to stand in for real devices when testing
+"""
+
+import time
+import struct
+import threading
+import SocketServer
+
+
+class modbusStandIn:
+    """Small MODBUS TCP server holding a set of register tables per unit ID
+
+    Usage:  Create an instance of the class with the units to serve
+            Call 'start()' to serve in a background thread
+            Read/write the tables with 'getValues' and 'setValues'
+            Call 'stop()' to shut the server down
+
+    Requests on a connection may be pipelined. When 'delay' is set each reply
+    is held back by that long (on its own timer) to imitate a slow device
+    while still allowing several transactions to be outstanding at once.
+    Subclasses can override 'readTable' and 'writeTable' to serve data from
+    somewhere other than the local tables.
+    """
+
+    #Table each function code operates on
+    fcTable = {1: 1, 2: 2, 3: 3, 4: 4, 15: 1, 16: 3}
+
+
+    def __init__(self, host="127.0.0.1", port=5020, units=[1], size=1000,\
+                 delay=0.0):
+        """Create the register tables
+
+        :param host:  Interface to listen on
+        :param port:  TCP port to listen on
+        :param units: Unit IDs to respond to
+        :param size:  Number of entries in each table
+        :param delay: Reply delay to simulate device latency (s)
+        :type host:   string
+        :type port:   int
+        :type units:  list
+        :type size:   int
+        :type delay:  float
+        """
+        self.host = host
+        self.port = port
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.tables = {}
+        for unit in units:
+            self.tables[unit] = {1: [False] * size, 2: [False] * size,\
+                                 3: [0] * size, 4: [0] * size}
+        self.server = None
+
+
+    def start(self):
+        """Start serving in a background thread"""
+        standIn = self
+
+        class handler(SocketServer.BaseRequestHandler):
+            def handle(self):
+                standIn.serveConnection(self.request)
+
+        SocketServer.ThreadingTCPServer.allow_reuse_address = True
+        self.server = SocketServer.ThreadingTCPServer((self.host, self.port),\
+                                                      handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]       #If port 0 was given
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+
+    def stop(self):
+        """Shut the server down"""
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+    def getValues(self, unit, table, addr, length):
+        """Read values from a local table
+
+        :param unit:   Unit ID
+        :param table:  Table number (1-4)
+        :param addr:   Start address
+        :param length: Quantity to read
+        :type unit:    int
+        :type table:   int
+        :type addr:    int
+        :type length:  int
+        """
+        with self.lock:
+            return self.tables[unit][table][addr:addr + length]
+
+
+    def setValues(self, unit, table, addr, values):
+        """Write values to a local table
+
+        :param unit:   Unit ID
+        :param table:  Table number (1-4)
+        :param addr:   Start address
+        :param values: Values to write
+        :type unit:    int
+        :type table:   int
+        :type addr:    int
+        :type values:  list
+        """
+        with self.lock:
+            self.tables[unit][table][addr:addr + len(values)] = values
+
+
+    def readTable(self, unit, reg, addr, length):
+        """Serve a read request
+
+        :return: List of values or a MODBUS exception code
+        """
+        if unit not in self.tables:
+            return 0x0B
+        if addr + length > len(self.tables[unit][self.fcTable[reg]]):
+            return 0x02
+        return self.getValues(unit, self.fcTable[reg], addr, length)
+
+
+    def writeTable(self, unit, reg, addr, values):
+        """Serve a write request
+
+        :return: None on success or a MODBUS exception code
+        """
+        if unit not in self.tables:
+            return 0x0B
+        if addr + len(values) > len(self.tables[unit][self.fcTable[reg]]):
+            return 0x02
+        self.setValues(unit, self.fcTable[reg], addr, values)
+
+
+    def serveConnection(self, sock):
+        """Read request frames from one client until it disconnects
+
+        :param sock: Connected client socket
+        :type sock:  socket
+        """
+        sendLock = threading.Lock()
+        rx = bytearray()
+        while True:
+            try:
+                chunk = sock.recv(65536)
+            except Exception:
+                return
+            if not chunk:
+                return
+            rx.extend(chunk)
+            while len(rx) >= 7:
+                tid, pid, length, unit = struct.unpack_from('>HHHB', rx, 0)
+                if len(rx) < 6 + length:
+                    break
+                pdu = bytes(rx[7:6 + length])
+                del rx[:6 + length]
+                if self.delay > 0:
+                    timer = threading.Timer(self.delay, self.__reply,\
+                                    (sock, sendLock, tid, unit, pdu))
+                    timer.daemon = True
+                    timer.start()
+                else:
+                    self.__reply(sock, sendLock, tid, unit, pdu)
+
+
+    def __reply(self, sock, sendLock, tid, unit, pdu):
+        """Process one request PDU and send the response"""
+        resp = self.processRequest(unit, pdu)
+        frame = struct.pack('>HHHB', tid, 0, len(resp) + 1, unit) + resp
+        with sendLock:
+            try:
+                sock.sendall(frame)
+            except Exception:
+                pass
+
+
+    def processRequest(self, unit, pdu):
+        """Decode a request PDU, apply it and build the response PDU
+
+        :param unit: Unit ID the request was sent to
+        :param pdu:  Request PDU
+        :type unit:  int
+        :type pdu:   bytes
+
+        :return: Response PDU
+        """
+        reg = struct.unpack_from('>B', pdu, 0)[0]
+        if reg not in self.fcTable:
+            return struct.pack('>BB', reg | 0x80, 0x01)
+        addr, qty = struct.unpack_from('>HH', pdu, 1)
+
+        if reg <= 4:
+            values = self.readTable(unit, reg, addr, qty)
+            if type(values) == int:
+                return struct.pack('>BB', reg | 0x80, values)
+            if reg <= 2:
+                packed = bytearray((qty + 7) // 8)
+                for i in range(qty):
+                    if values[i]:
+                        packed[i // 8] |= 1 << (i % 8)
+                return struct.pack('>BB', reg, len(packed)) + bytes(packed)
+            return struct.pack('>BB', reg, 2 * qty) +\
+                   struct.pack('>' + 'H' * qty, *values)
+
+        if reg == 15:
+            packed = bytearray(pdu[6:])
+            values = [bool((packed[i // 8] >> (i % 8)) & 1)\
+                      for i in range(qty)]
+        else:
+            values = list(struct.unpack_from('>' + 'H' * qty, pdu, 6))
+        err = self.writeTable(unit, reg, addr, values)
+        if err is not None:
+            return struct.pack('>BB', reg | 0x80, err)
+        return struct.pack('>BHH', reg, addr, qty)
+
+
+def main():
+    server = modbusStandIn(port=5020)                    #Serve unit 1 locally
+    server.start()
+    print("Serving MODBUS TCP on port " + str(server.port) + " - Ctrl+C to exit")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == '__main__':main()
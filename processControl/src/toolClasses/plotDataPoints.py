@@ -16,53 +16,62 @@ from yamlImport import yamlImport
 
 class plotDataPoints:
     """Plots a graph of the data passed to it
-    
-    Usage:  Ensure all params are setup in the 'plotPenConfig' file 
+
+    Usage:  Ensure all params are setup in the 'plotPenConfig' file
             Create an instance of the class to initialise the required params
             Call 'dataUpdate' to add data to the plot
             Use 'closeBlock' upon program end to keep plot window open
+
+    Samples are held in a preallocated circular buffer which is stored twice
+    end to end, so the last 'x_axis_length' samples are always one contiguous
+    slice. Each pen has one persistent line that is updated in place. The x
+    axis moves forward a page at a time ('scroll_margin') and only then is the
+    whole figure redrawn; between pages just the lines are blitted onto a
+    cached background where the backend supports it.
     """
-    
+
     def __init__(self):
         """Import config and call the necessary setup functions"""
         self.plotCfg = yamlImport.importYAML("./cfg/plotPenConfig.yaml")
+        self.__setupPens()
         self.__setupPlots()
         self.__setupArrays()
-        self.__setupPens()
-        self.__startFlag = 1
+        self.__setupLines()
 
 
     def __setupPlots(self):
         """Setup matplotlib figure and configure each of the respective plots"""
-        self.fig = plt.subplots()
+        self.fig = plt.figure()
         self.__createSubPlots()
         self.__configureSubPlots()
         plt.ion()
         plt.show()
-    
-    
+
+
     def __setupArrays(self):
-        """Initalise the arrays for data plotting"""
-        self.xData = np.array([[]])
-        self.yData = np.array([[]]).reshape((self.plotCfg.__len__()-1),0)
-        
-    
+        """Initalise the circular buffers for data plotting"""
+        self.length = self.plotCfg['plot_cfg']['x_axis_length']
+        self.xData = np.zeros(2 * self.length)
+        self.yData = np.zeros((len(self.pens), 2 * self.length))
+        self.__head = 0                         #Next buffer position to write
+        self.__count = 0                        #Samples currently held
+        self.__xMin = None                      #Current x axis page
+        self.__xMax = None
+
+
     def __createSubPlots(self):
         """Using the config file create all required subplots"""
-        plotNo = []
-        for i in range(1,(self.plotCfg.__len__())):
-            plotNo.append(self.plotCfg["pen_" + str(i)]['plot'])
-        
-        self.ax = {}        
+        plotNo = [self.plotCfg[pen]['plot'] for pen in self.pens]
+        self.ax = {}
         for i in range(1,max(plotNo)+1):
-            self.ax[i] = plt.subplot(max(plotNo),1,i)
-        
-        
+            self.ax[i] = self.fig.add_subplot(max(plotNo),1,i)
+
+
     def __configureSubPlots(self):
         """Add axis lables and set range"""
         for i in range(1, self.ax.__len__()+1):
             self.ax[i].set_xlabel(self.plotCfg['plot_cfg']['x_axis_label'])
-            self.ax[i].set_ylabel(self.plotCfg['plot_cfg']['y_axis_label'])            
+            self.ax[i].set_ylabel(self.plotCfg['plot_cfg']['y_axis_label'])
             self.ax[i].set_ylim(self.plotCfg['plot_cfg']['y_axis_min'],\
                                 self.plotCfg['plot_cfg']['y_axis_max'])
 
@@ -71,53 +80,118 @@ class plotDataPoints:
         """Enable legends on each of the subplots"""
         for i in range(1, self.ax.__len__()+1):
             self.ax[i].legend()
-    
-    
+
+
     def __setupPens(self):
-        """Setup pens ready for graphical plotting"""
-        self.penDict = {}
-        for i in range(1,len(self.ax)+1):
-            axPens  = []
-            for j in range(1,(self.plotCfg.__len__())):
-                if self.plotCfg["pen_" + str(j)]['plot'] == i:
-                    axPens.append("pen_" + str(j))
-            self.penDict[i] = axPens
-    
+        """Find the configured pens and the data column each one plots"""
+        self.pens = sorted([key for key in self.plotCfg if key[:4] == "pen_"],\
+                           key=lambda pen: int(pen[4:]))
+        self.penCol = [int(pen[4:]) - 1 for pen in self.pens]
+
+
+    def __setupLines(self):
+        """Create one persistent line per pen and prepare blitting"""
+        canvas = self.fig.canvas
+        self.blit = self.plotCfg['plot_cfg']['blit'] and\
+                    getattr(canvas, 'supports_blit', False)
+        self.lines = []
+        for k in range(len(self.pens)):
+            pen = self.plotCfg[self.pens[k]]
+            line, = self.ax[pen['plot']].plot([], [], pen['colour'],\
+                                              label=pen['name'],\
+                                              animated=self.blit)
+            self.lines.append(line)
+        self.__configureLegends()
+        self.fig.stale_callback = None          #Redraws are done in '__plot'
+        self.__background = {}
+        if self.blit:
+            canvas.mpl_connect('draw_event', self.__cacheBackground)
+        canvas.draw()
+
+
+    def __cacheBackground(self, event):
+        """Store the static parts of each subplot after a full draw"""
+        for i in self.ax:
+            self.__background[i] = \
+                self.fig.canvas.copy_from_bbox(self.ax[i].bbox)
+
+
     def __plot(self):
-        """Plots the x and y data from the 'dataUpdate' method"""
-        for i in range(1, self.penDict.__len__()+1):
-            for j in range(self.penDict[i].__len__()):
-                self.ax[i].plot(self.xData,\
-                np.transpose(self.yData[int(self.penDict[i][j][-1])-1,:]),\
-                self.plotCfg[self.penDict[i][j]]["colour"],\
-                label=self.plotCfg[self.penDict[i][j]]["name"] )
-        if self.__startFlag == 1:
-            self.__configureLegends()
-            self.__startFlag = 0
-        plt.draw()                              # Draws the graph to your screen
+        """Push the buffered data to the lines and update the screen"""
+        start = self.__head if self.__count == self.length else 0
+        xView = self.xData[start:start + self.__count]
+        yView = self.yData[:, start:start + self.__count]
+        for k in range(len(self.lines)):
+            self.lines[k].set_data(xView, yView[k])
+
+        canvas = self.fig.canvas
         warnings.simplefilter("ignore")         # Hide depreciation warnings
-        plt.pause(0.001)                        # Workaround to avoid the freezing problem
-    
-    def __graphScroll(self):
-        """Removes all lines on the graph ready for updated data"""
-        for i in range(1, self.penDict.__len__()+1):
-            self.ax[i].lines = []
-            self.ax[i].set_xlim(self.xData[0],self.xData[-1])
-    
-    
+        if self.__graphScroll(xView) or not self.blit:
+            canvas.draw()                       # Full redraw (new x axis page)
+            if self.blit:
+                self.__blitLines()
+        else:
+            for i in self.ax:
+                canvas.restore_region(self.__background[i])
+            self.__blitLines()
+        canvas.flush_events()                   # Keep the window responsive
+
+
+    def __blitLines(self):
+        """Draw the animated lines on top of the cached background"""
+        for k in range(len(self.lines)):
+            self.lines[k].axes.draw_artist(self.lines[k])
+        for i in self.ax:
+            self.fig.canvas.blit(self.ax[i].bbox)
+
+
+    def __graphScroll(self, xView):
+        """Move the x axis on a page once the data passes the right hand edge
+
+        :return: True if the axis limits changed
+        """
+        if self.__xMax is not None and xView[-1] <= self.__xMax:
+            return False
+        span = max(xView[-1] - xView[0], 1)
+        self.__xMin = xView[0]
+        self.__xMax = xView[0] +\
+                      span * (1 + self.plotCfg['plot_cfg']['scroll_margin'])
+        for i in self.ax:
+            self.ax[i].set_xlim(self.__xMin, self.__xMax)
+        return True
+
+
+    def dataAppend(self, x, *y):
+        """Add data to the buffer without redrawing"""
+        if len(y) == 1 and hasattr(y[0], '__len__'):
+            y = y[0]
+        i = self.__head
+        self.xData[i] = self.xData[i + self.length] = x
+        for k in range(len(self.penCol)):
+            if self.penCol[k] < len(y):
+                value = y[self.penCol[k]]
+            else:
+                value = np.nan
+            self.yData[k, i] = self.yData[k, i + self.length] = value
+        self.__head = (i + 1) % self.length
+        self.__count = min(self.__count + 1, self.length)
+
+
+    def refresh(self):
+        """Redraw the graph with the buffered data"""
+        if self.__count > 0:
+            self.__plot()
+
+
     def dataUpdate(self, x, *y):
         """Add data to the graph"""
-        self.xData = np.append(self.xData,x)
-        #todo: Need to add try catch on this line as will fail if config is wrong
-        self.yData = np.append(self.yData,np.transpose(np.matrix(y)),1)
-        if len(self.xData) > self.plotCfg['plot_cfg']['x_axis_length']:
-            self.xData = np.delete(self.xData,0)
-            self.yData = np.delete(self.yData,0,1)
-        self.__graphScroll()
+        self.dataAppend(x, *y)
         self.__plot()
-      
-    
+
+
     def closeBlock(self):
         """Use to block the graph closing upon exit"""
+        for line in self.lines:
+            line.set_animated(False)            #Include in normal redraws
         print("Close plot window to finish...")
-        plt.show(block=True)
\ No newline at end of file
+        plt.show(block=True)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Alexander David Leech
+@date:   Mon Aug 15 20:52:31 2016
+@rev:    1
+@lang:   Python 2.7
+@deps:   numpy, multiprocessing
+@desc:   Runs the live trend display in its own process
+"""
+
+import numpy as np
+import multiprocessing
+from multiprocessing.sharedctypes import RawArray, RawValue
+from yamlImport import yamlImport
+
+
+def _plotWorker(buf, head, stop, slots, width, frameRate):
+    """Plot process - redraw the graph from the shared ring at a fixed rate
+
+    :param buf:       Shared sample ring (slots x (width + 1) doubles)
+    :param head:      Shared count of samples written so far
+    :param stop:      Shared flag set when the producer has finished
+    :param slots:     Ring capacity (samples)
+    :param width:     Data values held per sample
+    :param frameRate: Redraws per second
+    """
+    from plotDataPoints import plotDataPoints
+    from loopScheduler import loopScheduler
+    ring = np.frombuffer(buf, dtype=np.float64).reshape(slots, width + 1)
+    gph = plotDataPoints()
+    sched = loopScheduler(1.0 / frameRate, "skip")
+    readPos = 0
+    while True:
+        finished = stop.value
+        writePos = head.value
+        readPos = max(readPos, writePos - slots)        #Lapped - skip ahead
+        rows = ring[np.arange(readPos, writePos) % slots].copy()
+        lapped = head.value - slots + 1                 #Overwritten mid copy
+        for i in range(max(lapped - readPos, 0), len(rows)):
+            gph.dataAppend(rows[i, 0], rows[i, 1:])
+        readPos = writePos
+        gph.refresh()
+        if finished:
+            break
+        sched.wait()
+    gph.closeBlock()
+
+
+class plotProcess:
+    """Plots a graph of the data passed to it from a separate process
+
+    Usage:  Ensure all params are setup in the 'plotPenConfig' file
+            Create an instance of the class to start the plot process
+            Call 'dataUpdate' to add data to the plot
+            Use 'closeBlock' upon program end to keep plot window open
+
+    'dataUpdate' only copies the sample into a shared memory ring and bumps
+    the write counter, it never waits on the plot process. The plot process
+    reads whatever is new at its own frame rate ('frame_rate'), so a slow or
+    frozen window cannot hold up the control loop. If the display falls more
+    than 'shm_slots' samples behind the oldest samples are skipped.
+    """
+
+    def __init__(self):
+        """Create the shared ring and start the plot process"""
+        self.plotCfg = yamlImport.importYAML("./cfg/plotPenConfig.yaml")
+        self.slots = self.plotCfg['plot_cfg']['shm_slots']
+        self.width = max([int(key[4:]) for key in self.plotCfg\
+                          if key[:4] == "pen_"])
+        self.__buf = RawArray('d', self.slots * (self.width + 1))
+        self.__head = RawValue('L', 0)
+        self.__stop = RawValue('b', 0)
+        self.__ring = np.frombuffer(self.__buf, dtype=np.float64)\
+                        .reshape(self.slots, self.width + 1)
+        self.proc = multiprocessing.Process(target=_plotWorker,\
+                        args=(self.__buf, self.__head, self.__stop,\
+                              self.slots, self.width,\
+                              self.plotCfg['plot_cfg']['frame_rate']))
+        self.proc.daemon = True
+        self.proc.start()
+
+
+    def dataUpdate(self, x, *y):
+        """Add data to the graph"""
+        if len(y) == 1 and hasattr(y[0], '__len__'):
+            y = y[0]
+        row = self.__ring[self.__head.value % self.slots]
+        row[0] = x
+        count = min(len(y), self.width)
+        row[1:count + 1] = y[:count]
+        row[count + 1:] = np.nan
+        self.__head.value += 1                  #Publish the completed row
+
+
+    def closeBlock(self):
+        """Use to block the graph closing upon exit"""
+        self.__stop.value = 1
+        print("Close plot window to finish...")
+        self.proc.join()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Alexander David Leech
+@date:   Mon Aug 15 21:40:12 2016
+@rev:    1
+@lang:   Python 2.7
+@deps:   <>
+@desc:   Creates the trend display chosen by a tool's 'plotMode' setting
+"""
+
+
+class plotSetup():
+    """Contains a function to create the trend display for a plot mode"""
+
+    @staticmethod
+    def createPlot(plotMode):
+        """Create the trend display selected by 'plotMode'
+
+        The plotting modules (and so matplotlib) are only imported when they
+        are used, so a headless instance starts quickly and stays small.
+
+        :param plotMode: "inline", "process" or "none"
+        :type plotMode:  string
+
+        :return: Plot object, or None when plotting is off
+        """
+        if plotMode == "inline":
+            from plotDataPoints import plotDataPoints
+            return plotDataPoints()
+        if plotMode == "process":
+            from plotProcess import plotProcess
+            return plotProcess()
+        if plotMode == "none":
+            return None
+        raise ValueError("Invalid plot mode - Options are inline, process & none")
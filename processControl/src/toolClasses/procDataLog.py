@@ -5,101 +5,328 @@
 @date:   Wed Jul 13 17:21:01 2016
 @rev:    1
 @lang:   Python 2.7
-@deps:   csv, time
-@desc:   class to log process data to a csv file
+@deps:   csv, time, numpy (binary backend and compression only)
+@desc:   class to log process data to a csv or binary file
 """
 
+import os
 import csv
-import copy
 import time
+import Queue
+import threading
 from yamlImport import yamlImport
 
 
 class procDataLog:
     """Used to log data from the process upon controller runtime
-    
+
     Usage: Create an instance of the class to initialise the required params
            Call 'startlog()' to begin logging
            Add to log using 'write(data)' where data contains a list of values
            When finished, call 'stoplog()'
-           
+
     It should be noted that a config file is avaliable in the 'cfg' directory
     to allow the addition of headers to the file. Futhermore, a new config file
     is created at midnight each day to avoid problems with large files.
+    Files are named "<stream> HH.MM.SS DD.MM.YYYY" so the logs of each tool
+    (or task) sharing the log directory can be told apart by historian.
+
+    The 'logSettings' file selects the write mode. In async mode 'write' only
+    timestamps the row and puts it on a bounded queue; a background thread
+    formats, writes and flushes the rows in batches so the caller never waits
+    on disk I/O. Rows that do not fit in the queue are dropped as per the
+    drop policy and counted in 'dropped'. If the writer thread hits an error
+    (e.g. the disk is full) it stops and the error is raised by every later
+    'write' until the log is restarted.
+
+    The backend is also chosen in 'logSettings'; 'binary' writes fixed width
+    records (see binDataLog) instead of csv rows.
+
+    When 'log_compression' is enabled in the 'logHeaders' file the rows pass
+    through logCompress before being written (on the writer thread in async
+    mode) and only the rows needed to reproduce each column within its
+    tolerance are stored. The first row of each day is always stored.
     """
-    
-    def __init__(self):
-        """Setup"""
+
+    def __init__(self, headers=None, stream=None):
+        """Setup
+
+        :param headers: Column names to use instead of the 'logHeaders' file
+                        (compression then only applies to the columns named
+                        in both)
+        :param stream:  Name put in front of the date/time in each file name
+                        (None for the date/time only)
+        :type headers:  list
+        :type stream:   string
+        """
         self.logRun = 0
+        self.stream = stream
         self.dateNow = time.strftime('%d')
         self.headerCfg = yamlImport.importYAML("./cfg/logHeaders.yaml")
+        if headers is not None:
+            self.headerCfg["log_headers"] = list(headers)
+            columns = self.headerCfg.get("log_compression", {}).get("columns")
+            if columns:
+                for name in columns.keys():
+                    if name not in headers:
+                        del columns[name]
         self.headerCfg["log_headers"].insert(0,"Time")
-    
-    
+        self.logCfg = yamlImport.importYAML("./cfg/logSettings.yaml")
+        self.written = 0                        #Rows written to file
+        self.dropped = 0                        #Rows lost to a full queue
+        self.flushes = 0                        #File flushes performed
+        self.compress = None
+        if self.headerCfg.get("log_compression", {}).get("enabled"):
+            from logCompress import logCompress
+            self.compress = logCompress(self.headerCfg["log_headers"][1:],\
+                                        self.headerCfg["log_compression"])
+        self.__queue = None
+        self.__writer = None
+        self.error = None                       #Error that stopped the writer
+
+
     def write(self, procData):
         """Write given values to a log
-        
+
         :param logData: list of data to log to the csv file
         :type logData: list
+        :raises: the error that stopped the writer thread (async mode)
         """
-        logData = copy.deepcopy(procData)
+        if self.error is not None:
+            raise self.error
         if self.logRun == 1:
-            if time.strftime('%d') != self.dateNow:
-                self.stopLog()
-                self.startLog()
-                self.dateNow = time.strftime('%d')
-                
-            if type(logData) != list:
-                logData = [self.formatTime(), logData]
+            stamp = time.time()
+            if type(procData) != list:
+                logData = [procData]
             else:
-                logData.insert(0, self.formatTime())
-            self.csvLog.writerow(logData)
-            self.logFile.flush()
+                logData = list(procData)
+            if self.__queue is None:
+                self.__writeRows([(stamp, logData)])
+            else:
+                self.__enqueue((stamp, logData))
         else:
             print("No log currently active")
-    
-    
+
+
     def startLog(self, name=None):
         """Create a new file and start logging
-        
+
         :param Name: Optional File name. If 'None' sets as date/time
-        :type Name: String        
+        :type Name: String
         """
         if self.logRun == 1:
             print("A log is already running. Please stop that first")
             return
-        if name == None:
-            fileName = "./log/" + self.__formatTimeDate() + ".csv"
-        else:
-            fileName = "./log/" + str(name) +".csv"
-        self.logFile = open(fileName, 'wb')
-        self.csvLog = csv.writer(self.logFile,\
-                                 delimiter=',',\
-                                 quoting=csv.QUOTE_ALL)
-        self.csvLog.writerow(self.headerCfg["log_headers"])
-        self.logFile.flush()
+        self.__compressDay = None               #First row always stored
+        self.error = None
+        self.__openFile(name)
+        if self.logCfg['mode'] == "async":
+            self.__queue = Queue.Queue(self.logCfg['queueSize'])
+            self.__writer = threading.Thread(target=self.__writerLoop)
+            self.__writer.daemon = True
+            self.__writer.start()
+        elif self.logCfg['mode'] != "sync":
+            raise ValueError("Invalid log mode - Options are sync & async")
         self.logRun = 1
-    
-    
+
+
     def stopLog(self):
-        """Stop current log"""
-        self.logFile.close()
+        """Stop current log, writing out any queued rows first"""
         self.logRun = 0
+        if self.__writer is not None:
+            while self.__writer.is_alive():
+                try:
+                    self.__queue.put(None, True, 0.1)   #Wait for queue space
+                    break
+                except Queue.Full:
+                    pass
+            self.__writer.join()
+            self.dropped += self.__queue.qsize()        #Left by a failed writer
+            self.__writer = None
+            self.__queue = None
+        try:
+            if self.error is None:
+                if self.compress is not None:
+                    self.__storeRows(self.compress.flush())  #End on last row
+                    self.compress.reset()
+                self.__flush()
+        finally:
+            self.logFile.close()
+
+
+    def stats(self):
+        """Return the log counters
+
+        :return: dict of rows written, dropped & queued plus flush count
+                 (and rows left out by compression when enabled)
+        """
+        queued = 0
+        if self.__queue is not None:
+            queued = self.__queue.qsize()
+        stats = {'written': self.written, 'dropped': self.dropped,\
+                 'queued': queued, 'flushes': self.flushes}
+        if self.compress is not None:
+            stats['compressed'] = self.compress.rowsIn - self.compress.rowsOut
+        return stats
+
+
+    def formatTime(self, stamp=None):
+        """Format the time appropriate for logging
+
+        :param stamp: Epoch time to format. If 'None' uses the current time
+        :type stamp: float
+        """
+        return time.strftime('%H:%M:%S', time.localtime(stamp))
+
 
+    def __enqueue(self, row):
+        """Queue a row for the writer thread without ever blocking
 
-    def formatTime(self):
-        """Format the time appropriate for logging"""
-        return time.strftime('%H') + ":" +\
-               time.strftime('%M') + ":" +\
-               time.strftime('%S')
+        :param row: (timestamp, data) tuple
+        :type row: tuple
+        """
+        try:
+            self.__queue.put_nowait(row)
+            return
+        except Queue.Full:
+            self.dropped += 1
+        if self.logCfg['dropPolicy'] == "dropOldest":
+            try:
+                self.__queue.get_nowait()
+                self.__queue.put_nowait(row)
+            except (Queue.Empty, Queue.Full):
+                pass
+
+
+    def __writerLoop(self):
+        """Background thread - run the writer, recording any error that
+        stops it for 'write' to raise
+        """
+        try:
+            self.__drainQueue()
+        except Exception as err:
+            self.error = err
+
+
+    def __drainQueue(self):
+        """Drain the queue in batches until stopped"""
+        flushPeriod = self.logCfg['flushMs'] / 1000.0
+        while True:
+            timeout = None
+            if self.__unflushed > 0 and flushPeriod > 0:
+                timeout = max(self.__lastFlush + flushPeriod - time.time(),\
+                              0.001)
+            try:
+                row = self.__queue.get(True, timeout)
+            except Queue.Empty:
+                self.__flush()
+                continue
+            batch = []
+            while row is not None:
+                batch.append(row)
+                try:
+                    row = self.__queue.get_nowait()
+                except Queue.Empty:
+                    break
+            if batch:
+                self.__writeRows(batch)
+            if row is None:
+                return
+
+
+    def __writeRows(self, rows):
+        """Pass rows through the compression (if enabled) and store them
+
+        :param rows: list of (timestamp, data) tuples
+        :type rows: list
+        """
+        if self.compress is None:
+            self.__storeRows(rows)
+            return
+        kept = []
+        for stamp, logData in rows:
+            day = time.strftime('%d', time.localtime(stamp))
+            newDay = day != self.__compressDay
+            if newDay:
+                kept.extend(self.compress.flush())      #Finish the old day
+                self.__compressDay = day
+            kept.extend(self.compress.process(stamp, logData, newDay))
+        self.__storeRows(kept)
+
+
+    def __storeRows(self, rows):
+        """Write rows to the current file, rolling the file over at midnight
+
+        :param rows: list of (timestamp, data) tuples
+        :type rows: list
+        """
+        for stamp, logData in rows:
+            localTime = time.localtime(stamp)
+            if time.strftime('%d', localTime) != self.dateNow:
+                self.__flush()
+                self.logFile.close()
+                self.__openFile()
+            if self.binLog is not None:
+                self.binLog.writeRow(stamp, logData)
+                continue
+            logData.insert(0, time.strftime('%H:%M:%S', localTime))
+            self.csvLog.writerow(logData)
+        self.written += len(rows)
+        self.__unflushed += len(rows)
+        if (self.logCfg['flushRows'] > 0 and\
+            self.__unflushed >= self.logCfg['flushRows']) or\
+           (self.logCfg['flushMs'] > 0 and\
+            (time.time() - self.__lastFlush) * 1000 >= self.logCfg['flushMs']):
+            self.__flush()
+
+
+    def __flush(self):
+        """Flush buffered rows to the file (and disk if fsync is set)"""
+        if self.__unflushed > 0:
+            self.logFile.flush()
+            if self.logCfg['fsync']:
+                os.fsync(self.logFile.fileno())
+            self.flushes += 1
+        self.__unflushed = 0
+        self.__lastFlush = time.time()
+
+
+    def __openFile(self, name=None):
+        """Create a new log file and write the headers
+
+        :param Name: Optional File name. If 'None' sets as date/time
+        :type Name: String
+        """
+        if self.logCfg['backend'] == "binary":
+            ext = ".bin"
+        elif self.logCfg['backend'] == "csv":
+            ext = ".csv"
+        else:
+            raise ValueError("Invalid log backend - Options are csv & binary")
+        if name == None:
+            fileName = "./log/" + self.__formatTimeDate() + ext
+        else:
+            fileName = "./log/" + str(name) + ext
+        self.logFile = open(fileName, 'wb')
+        self.binLog = None
+        if ext == ".bin":
+            from binDataLog import binDataLog
+            self.binLog = binDataLog(self.logFile,\
+                                     self.headerCfg["log_headers"][1:],\
+                                     self.logCfg['binaryType'])
+        else:
+            self.csvLog = csv.writer(self.logFile,\
+                                     delimiter=',',\
+                                     quoting=csv.QUOTE_ALL)
+            self.csvLog.writerow(self.headerCfg["log_headers"])
+        self.logFile.flush()
+        self.dateNow = time.strftime('%d')
+        self.__unflushed = 0
+        self.__lastFlush = time.time()
 
 
     def __formatTimeDate(self):
-        """Format the date and time appropriate for a filename"""
-        timeNow = time.strftime('%H') + "." +\
-                  time.strftime('%M') + "." +\
-                  time.strftime('%S')
-        date    = time.strftime('%d') + "." +\
-                  time.strftime('%m') + "." +\
-                  time.strftime('%Y')
-        return (timeNow + " " + date)
\ No newline at end of file
+        """Format the stream, date and time appropriate for a filename"""
+        if self.stream:
+            return self.stream + " " + time.strftime('%H.%M.%S %d.%m.%Y')
+        return time.strftime('%H.%M.%S %d.%m.%Y')
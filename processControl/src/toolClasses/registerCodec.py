@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Alexander David Leech
+@date:   Wed Aug 17 21:14:05 2016
+@rev:    1
+@lang:   Python 2.7
+@deps:   numpy
+@desc:   Bulk conversion between MODBUS registers and typed numpy arrays
+"""
+
+import numpy as np
+
+
+class registerCodec:
+    """Decodes/encodes whole blocks of MODBUS registers in one call
+
+    Usage:  Create an instance with the byte and word order of the device
+            Call 'decode(registers, dataType)' to get a numpy array of values
+            Call 'encode(values, dataType)' to get registers to write
+            Use 'unpackBits'/'packBits' for coil and discrete input data
+
+    byteOrder is the order of the two bytes within each register and
+    wordOrder the order of the registers within a 32/64bit value. The
+    defaults (big/little) match the pymodbus Endian.Little payload layout
+    used previously, i.e. the low word is sent first.
+    """
+
+    #numpy type and registers per value for each supported data type
+    dataTypes = {"int16": ('i2', 1), "uint16": ('u2', 1),\
+                 "int32": ('i4', 2), "uint32": ('u4', 2),\
+                 "float32": ('f4', 2), "float64": ('f8', 4)}
+
+
+    def __init__(self, byteOrder="big", wordOrder="little"):
+        """Setup
+
+        :param byteOrder: Byte order within a register - big or little
+        :param wordOrder: Register order within a value - big or little
+        :type byteOrder:  string
+        :type wordOrder:  string
+        """
+        if byteOrder not in ("big", "little") or\
+           wordOrder not in ("big", "little"):
+            raise ValueError("Invalid byte/word order - Use big or little")
+        self.byteOrder = byteOrder
+        self.wordOrder = wordOrder
+
+
+    def decode(self, registers, dataType="float32"):
+        """Convert a block of registers to an array of values
+
+        Any registers left over after the last whole value are ignored.
+
+        :param registers: Register values (0 - 65535)
+        :param dataType:  One of 'dataTypes'
+        :type registers:  list or numpy array
+        :type dataType:   string
+
+        :return: numpy array of decoded values
+        """
+        code, words = self.dataTypes[dataType]
+        regs = np.asarray(registers, dtype=np.uint16)
+        count = len(regs) // words
+        regs = regs[:count * words].reshape(count, words)
+        if self.byteOrder == "little":
+            regs = regs.byteswap()
+        if self.wordOrder == "little":
+            regs = regs[:, ::-1]
+        return np.ascontiguousarray(regs, dtype='>u2').view('>' + code)\
+                 .reshape(count).astype(code)
+
+
+    def encode(self, values, dataType="float32"):
+        """Convert values to the registers that represent them
+
+        :param values:   Value or list of values to encode
+        :param dataType: One of 'dataTypes'
+        :type values:    float, int, list or numpy array
+        :type dataType:  string
+
+        :return: List of register values
+        """
+        code, words = self.dataTypes[dataType]
+        data = np.atleast_1d(np.asarray(values)).astype('>' + code)
+        regs = data.view('>u2').reshape(len(data), words)
+        if self.wordOrder == "little":
+            regs = regs[:, ::-1]
+        if self.byteOrder == "little":
+            regs = regs.byteswap()
+        return regs.astype(np.uint16).ravel().tolist()
+
+
+    @staticmethod
+    def unpackBits(data, count):
+        """Convert packed coil/input bytes (LSB first) to an array of bools
+
+        :param data:  Packed bytes as sent by the device
+        :param count: Number of bits to return
+        :type data:   bytes or bytearray
+        :type count:  int
+        """
+        packed = np.frombuffer(bytes(data), dtype=np.uint8)
+        bits = np.unpackbits(packed).reshape(-1, 8)[:, ::-1].ravel()
+        return bits[:count].astype(bool)
+
+
+    @staticmethod
+    def packBits(bits):
+        """Convert a list of bools to packed bytes (LSB first)
+
+        :param bits: Coil/input states
+        :type bits:  list or numpy array
+        """
+        bits = np.asarray(bits, dtype=np.uint8)
+        padded = np.zeros(((len(bits) + 7) // 8) * 8, dtype=np.uint8)
+        padded[:len(bits)] = bits
+        return np.packbits(padded.reshape(-1, 8)[:, ::-1]).tobytes()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Alexander David Leech
+@date:   Tue Aug 23 19:52:16 2016
+@rev:    1
+@lang:   Python 2.7
+@deps:   <None>
+@desc:   Low overhead timing of each stage of a control loop
+"""
+
+from bisect        import bisect_right
+from loopScheduler import monotonic
+
+
+class stageTimer:
+    """Times each stage of a loop into fixed bucket histograms
+
+    Usage:  Create an instance with the stage names in loop order
+            Call 'start()' at the top of each cycle
+            Call 'mark(stage)' as each stage finishes
+            Use 'stats()' for p50/p99/max per stage, or set 'summaryFile' to
+            have the summary rewritten every 'summaryPeriod' seconds
+
+    'mark' records the time since the previous 'start' or 'mark', so each
+    stage costs one clock read, one bisect and a few list updates. Buckets
+    are log spaced from 1us to 100s (10 per decade) and fixed for the life of
+    the timer, so percentiles are accurate to the bucket width (~26%) and
+    memory does not grow with the number of cycles. The time from 'start' to
+    the last 'mark' of each cycle is recorded as the stage "cycle". A timer
+    created with enabled=False turns 'start' and 'mark' into no-ops.
+    'miss(stage)' counts a stage that ran out of time (e.g. a MODBUS request
+    past the cycle deadline) and is counted whether timing is enabled or not.
+    """
+
+    #Bucket upper edges (s) - anything above the last edge goes in overflow
+    edges = [10 ** (i / 10.0 - 6) for i in range(81)]
+
+
+    def __init__(self, stages, enabled=True, summaryFile=None,\
+                 summaryPeriod=60.0):
+        """Setup
+
+        :param stages:        Stage names in loop order
+        :param enabled:       Set False to disable all timing
+        :param summaryFile:   File to rewrite with the summary (None for off)
+        :param summaryPeriod: Seconds between summary file writes
+        :type stages:         list
+        :type enabled:        bool
+        :type summaryFile:    string
+        :type summaryPeriod:  float
+        """
+        self.stages = list(stages) + ["cycle"]
+        self.enabled = enabled
+        self.summaryFile = summaryFile
+        self.summaryPeriod = summaryPeriod
+        if not enabled:
+            self.start = self.mark = self.__skip
+        self.reset()
+
+
+    def reset(self):
+        """Clear all recorded timings"""
+        self.counts = dict((s, [0] * (len(self.edges) + 1))\
+                           for s in self.stages)
+        self.total = dict((s, 0.0) for s in self.stages)
+        self.max = dict((s, 0.0) for s in self.stages)
+        self.misses = dict((s, 0) for s in self.stages)
+        self.cycleStart = None
+        self.last = None
+        self.lastSummary = monotonic()
+
+
+    def start(self):
+        """Begin timing a new cycle"""
+        now = monotonic()
+        if self.last is not None and self.last > self.cycleStart:
+            self.__record("cycle", self.last - self.cycleStart)
+        if self.summaryFile is not None and\
+           now - self.lastSummary >= self.summaryPeriod:
+            self.writeSummary()
+            self.lastSummary = now
+        self.cycleStart = self.last = now
+
+
+    def mark(self, stage):
+        """Record the time since the previous mark against a stage
+
+        :param stage: Name of the stage that just finished
+        :type stage:  string
+        """
+        now = monotonic()
+        if self.last is not None:
+            self.__record(stage, now - self.last)
+        self.last = now
+
+
+    def miss(self, stage):
+        """Count a deadline miss against a stage
+
+        :param stage: Name of the stage that ran out of time
+        :type stage:  string
+        """
+        self.misses[stage] += 1
+
+
+    def __record(self, stage, secs):
+        """Add one timing to the histogram of a stage"""
+        self.counts[stage][bisect_right(self.edges, secs)] += 1
+        self.total[stage] += secs
+        if secs > self.max[stage]:
+            self.max[stage] = secs
+
+
+    def __skip(self, *args):
+        """Replaces 'start' and 'mark' when timing is disabled"""
+        pass
+
+
+    def percentile(self, stage, q):
+        """Return the upper bucket edge holding the q'th percentile
+
+        :param stage: Stage name
+        :param q:     Percentile (0 - 100)
+        :type stage:  string
+        :type q:      float
+
+        :return: Time (s), the stage max for the overflow bucket or 0.0 with
+                 no samples
+        """
+        counts = self.counts[stage]
+        n = sum(counts)
+        if n == 0:
+            return 0.0
+        target = n * q / 100.0
+        seen = 0
+        for i in range(len(counts)):
+            seen += counts[i]
+            if seen >= target and seen > 0:
+                if i == len(self.edges):
+                    return self.max[stage]
+                return min(self.edges[i], self.max[stage])
+        return self.max[stage]
+
+
+    def stats(self):
+        """Return the timing summary of every stage
+
+        :return: dict of stage -> dict of count, mean, p50, p99, max (s) and
+                 deadline misses
+        """
+        out = {}
+        for stage in self.stages:
+            n = sum(self.counts[stage])
+            out[stage] = {'count': n,
+                          'mean': self.total[stage] / n if n else 0.0,
+                          'p50': self.percentile(stage, 50),
+                          'p99': self.percentile(stage, 99),
+                          'max': self.max[stage],
+                          'misses': self.misses[stage]}
+        return out
+
+
+    def summary(self):
+        """Return the stats as a text table in ms"""
+        stats = self.stats()
+        lines = ["%-12s %10s %10s %10s %10s %10s %8s" % ("stage", "count",\
+                 "mean (ms)", "p50 (ms)", "p99 (ms)", "max (ms)", "misses")]
+        for stage in self.stages:
+            s = stats[stage]
+            lines.append("%-12s %10d %10.3f %10.3f %10.3f %10.3f %8d" %\
+                         (stage, s['count'], s['mean'] * 1e3, s['p50'] * 1e3,\
+                          s['p99'] * 1e3, s['max'] * 1e3, s['misses']))
+        return "\n".join(lines) + "\n"
+
+
+    def writeSummary(self):
+        """Rewrite the summary file with the current stats"""
+        with open(self.summaryFile, 'w') as f:
+            f.write(self.summary())
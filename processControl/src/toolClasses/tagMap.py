@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Alexander David Leech
+@date:   Sun Aug 07 15:41:09 2016
+@rev:    1
+@lang:   Python 2.7
+@deps:   numpy
+@desc:   Declarative tag map compiled into a minimal set of MODBUS block reads
+"""
+
+import numpy as np
+from yamlImport import yamlImport
+
+
+class tagMap:
+    """Reads a list of named tags from the MODBUS server in as few requests as
+    possible
+
+    Usage:  Ensure all tags are setup in the 'tagMap' file
+            Create an instance of the class to compile the read plan
+            Call 'read(coms)' with a connected modbusClient each scan
+
+    The plan is compiled once. Tags in the same table are sorted by address and
+    merged into one block read while the gap between them is no more than
+    'max_gap' and the block stays inside the MODBUS request limit. Tags of the
+    same type in a block are then decoded together using the codec of the
+    modbusClient.
+    """
+
+    #Registers (or bits) covered by each data type
+    typeSize = {"bool": 1, "int16": 1, "uint16": 1,
+                "int32": 2, "uint32": 2, "float32": 2}
+
+    #Largest quantity allowed in a single read for each table
+    readLimit = {1: 2000, 2: 2000, 3: 125, 4: 125}
+
+
+    def __init__(self, pathToFile="./cfg/tagMap.yaml", tagCfg=None):
+        """Import the tag map and compile the read plan
+
+        :param pathToFile: Path to the tag map config file
+        :param tagCfg:     Tag map settings to use instead of the file
+        :type pathToFile: string
+        :type tagCfg:     dict
+        """
+        if tagCfg is None:
+            tagCfg = yamlImport.importYAML(pathToFile)
+        self.tagCfg = tagCfg
+        self.tags = self.tagCfg['tags']
+        self.__checkTags()
+        self.blocks = self.compilePlan(self.tags,\
+                                       self.tagCfg['plan_cfg']['max_gap'])
+        self.__groups = [self.__compileDecode(block) for block in self.blocks]
+
+
+    def __checkTags(self):
+        """Fill in default values and reject invalid tag entries"""
+        for tag in self.tags:
+            tag.setdefault('type', "float32")
+            tag.setdefault('scale', 1.0)
+            tag.setdefault('offset', 0.0)
+            if tag['table'] not in self.readLimit:
+                raise ValueError("Invalid table for tag " + str(tag['name']))
+            if tag['type'] not in self.typeSize:
+                raise ValueError("Invalid type for tag " + str(tag['name']))
+            if (tag['table'] <= 2) != (tag['type'] == "bool"):
+                raise ValueError("Type does not suit table for tag " +\
+                                 str(tag['name']))
+
+
+    @staticmethod
+    def compilePlan(tags, maxGap):
+        """Merge the tags into the smallest set of block reads
+
+        :param tags:   List of tag dictionaries (table, address, type)
+        :param maxGap: Largest unused span allowed inside one block
+        :type tags:    list
+        :type maxGap:  int
+
+        :return: List of blocks [table, start, length, [(tagIndex, offset)]]
+        """
+        order = sorted(range(len(tags)),\
+                       key=lambda i: (tags[i]['table'], tags[i]['address']))
+        blocks = []
+        for i in order:
+            table = tags[i]['table']
+            start = tags[i]['address']
+            end = start + tagMap.typeSize[tags[i].get('type', "float32")]
+            if blocks and blocks[-1][0] == table:
+                block = blocks[-1]
+                blockEnd = block[1] + block[2]
+                if start - blockEnd <= maxGap and\
+                   max(end, blockEnd) - block[1] <= tagMap.readLimit[table]:
+                    block[2] = max(end, blockEnd) - block[1]
+                    block[3].append((i, start - block[1]))
+                    continue
+            blocks.append([table, start, end - start, [(i, 0)]])
+        return blocks
+
+
+    def __compileDecode(self, block):
+        """Group the tags of a block by type for decoding in one call
+
+        :param block: Block from 'compilePlan'
+        :type block:  list
+
+        :return: List of (type, tags, register positions, scale, offset)
+        """
+        groups = []
+        for dataType in sorted(self.typeSize):
+            members = [m for m in block[3]\
+                       if self.tags[m[0]]['type'] == dataType]
+            if not members:
+                continue
+            index = [m[0] for m in members]
+            words = np.arange(self.typeSize[dataType])
+            positions = (np.array([m[1] for m in members])[:, None] + words)\
+                        .ravel()
+            scale = np.array([self.tags[i]['scale'] for i in index], float)
+            offset = np.array([self.tags[i]['offset'] for i in index], float)
+            if (scale == 1.0).all() and (offset == 0.0).all():
+                scale = offset = None
+            groups.append((dataType, index, positions, scale, offset))
+        return groups
+
+
+    def names(self):
+        """Return the tag names in the order 'read' returns their values"""
+        return [tag['name'] for tag in self.tags]
+
+
+    def read(self, coms):
+        """Read every tag from the server using the compiled plan
+
+        :param coms: Connected modbusClient instance
+        :type coms:  modbusClient
+
+        :return: List of tag values in the order of the tag map
+        """
+        values = [None] * len(self.tags)
+        for block, groups in zip(self.blocks, self.__groups):
+            table, start, length = block[:3]
+            raw = np.asarray(coms.dataHandler('r', table, start,\
+                                              length=length, encoding=0))
+            for dataType, index, positions, scale, offset in groups:
+                if dataType == "bool":
+                    data = raw[positions].astype(bool)
+                else:
+                    data = coms.codec.decode(raw[positions], dataType)
+                    if scale is not None:
+                        data = (data * scale) + offset
+                    if dataType == "float32":
+                        data = np.round(data, 2)
+                for i, value in zip(index, data.tolist()):
+                    values[i] = value
+        return values
+